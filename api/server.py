@@ -2,13 +2,19 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
+import asyncio
+import itertools
+import json
 import shutil
 import logging
 import hashlib
+import threading
+from contextlib import contextmanager
 from functools import lru_cache
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
@@ -16,13 +22,19 @@ from slowapi.errors import RateLimitExceeded
 import config
 from src.document_parser import DocumentParser
 from src.embeddings import EmbeddingGenerator
-from src.vector_store import VectorStore
+from src.vector_store import get_vector_store
 from src.rag_engine import RAGEngine
 from src.settings_manager import SettingsManager
 from src.cache_manager import CacheManager
-from src.file_utils import generate_safe_filename, save_file
+from src.file_utils import save_upload
+from src.document_registry import DocumentRegistry, ParseCache
+from src.parse_pool import close_parse_pool, get_parse_pool
 from src.xwiki_connector import XWikiConnector
 from src.web_scraper import WebScraper
+from src.ollama_client import close_ollama_pool, get_ollama_pool
+from src.api_model_connector import close_api_clients, scheduler_stats
+from src.session_store import get_session_store
+from src.llm_router import get_llm_router
 from urllib.parse import urlparse
 
 # Настройка логирования
@@ -62,10 +74,11 @@ if static_dir.exists():
 settings_manager = SettingsManager()
 cache_manager = CacheManager(ttl=config.CACHE_TTL)
 parser = DocumentParser()
+document_registry = DocumentRegistry(config.DOCUMENT_REGISTRY_DB)
+parse_cache = ParseCache(config.PARSE_CACHE_DIR)
 
 # Lazy initialization for heavy components
 _embedding_gen = None
-_vector_store = None
 _rag_engine = None
 
 def get_embedding_gen():
@@ -76,25 +89,62 @@ def get_embedding_gen():
         _embedding_gen = EmbeddingGenerator()
     return _embedding_gen
 
-def get_vector_store():
-    """Lazy initialization of vector store"""
-    global _vector_store
-    if _vector_store is None:
-        logger.info("Initializing vector store...")
-        _vector_store = VectorStore()
-    return _vector_store
-
 def get_rag_engine():
     """Lazy initialization of RAG engine"""
     global _rag_engine
     if _rag_engine is None:
         logger.info("Initializing RAG engine...")
-        _rag_engine = RAGEngine(settings_manager=settings_manager)
+        _rag_engine = RAGEngine(settings_manager=settings_manager, vector_store=get_vector_store())
     return _rag_engine
 
 
+async def preload_model(model: str, previous_model: Optional[str] = None):
+    """Load model into Ollama memory so the first question does not pay for it"""
+    # Для внешних API моделей локальная модель не нужна
+    if settings_manager.get('use_api_model', False):
+        return
+    try:
+        pool = get_ollama_pool()
+        if previous_model and previous_model != model:
+            # На Raspberry Pi двум моделям не хватит памяти
+            await pool.unload(previous_model)
+        else:
+            # Узнаем, на каких узлах установлена модель
+            await pool.probe()
+        await pool.preload(model)
+    except Exception as e:
+        logger.warning(f"Could not preload model {model}: {str(e)}")
+
+
+_preload_task = None
+
+def schedule_preload(model: str, previous_model: Optional[str] = None):
+    """Start model preload in background (task reference keeps it from being collected)"""
+    global _preload_task
+    _preload_task = asyncio.create_task(preload_model(model, previous_model))
+
+
+@app.on_event("startup")
+async def startup():
+    """Start Ollama health checks and preload configured model in background"""
+    get_ollama_pool().start_health_checks()
+    if config.OLLAMA_PRELOAD:
+        schedule_preload(settings_manager.get('model', config.OLLAMA_MODEL))
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Close pooled connections and stop parse workers"""
+    await close_ollama_pool()
+    await close_api_clients()
+    close_parse_pool()
+
+
 class QueryRequest(BaseModel):
     question: str
+    source_types: Optional[List[str]] = None  # files, web, xwiki
+    session_id: Optional[str] = None  # продолжение диалога (POST /sessions)
+    deadline_ms: Optional[int] = None  # предельное время ответа, по умолчанию QUERY_DEADLINE_MS
 
 
 @app.get("/")
@@ -114,14 +164,149 @@ async def api_root():
 # Константы
 ALLOWED_FILE_EXTENSIONS = ('.pdf', '.docx', '.xlsx', '.xls')
 
-def validate_file(filename: str, content: bytes) -> None:
-    """Validate uploaded file"""
+def validate_file(filename: str) -> None:
+    """Validate uploaded file name (size is checked while the file is saved)"""
     if not filename.endswith(ALLOWED_FILE_EXTENSIONS):
         raise HTTPException(400, f"Only {', '.join(ALLOWED_FILE_EXTENSIONS)} files supported")
+
+
+def chunk_sizing() -> tuple:
+    """Get chunk size, overlap and tokenizer (None when chunks are sized in characters)"""
+    if config.CHUNK_TOKENS:
+        return config.CHUNK_TOKENS, config.CHUNK_TOKEN_OVERLAP, get_embedding_gen().count_text_tokens
+    return config.CHUNK_SIZE, config.CHUNK_OVERLAP, None
+
+
+def index_signature(chunk_size: int, overlap: int, count_tokens) -> str:
+    """Settings that stored chunks and vectors depend on"""
+    unit = "tokens" if count_tokens else "chars"
+    return f"{config.EMBEDDING_MODEL}|{unit}|{chunk_size}|{overlap}"
+
+
+def store_chunks(chunks, metadata: dict) -> tuple:
+    """Embed and store chunks in batches of EMBED_BATCH_SIZE, returns chunk count and parsed text length"""
+    count = 0
+    text_length = 0
+    while True:
+        batch = list(itertools.islice(chunks, config.EMBED_BATCH_SIZE))
+        if not batch:
+            break
+        texts = [text for text, _ in batch]
+        # text_length - длина текста, разобранного к моменту создания чанка (у последнего - всего документа)
+        metadatas = [{**metadata, "chunk": count + i, **chunk_metadata}
+                     for i, (_, chunk_metadata) in enumerate(batch)]
+        get_vector_store().add_documents(texts, get_embedding_gen().generate_embeddings(texts), metadatas)
+        count += len(batch)
+        text_length = metadatas[-1]["text_length"]
+    return count, text_length
+
+
+# Блокировки индексации по file_hash: одинаковые файлы из параллельных загрузок индексируются по очереди
+_index_locks: dict = {}
+_index_locks_lock = threading.Lock()
+
+
+@contextmanager
+def file_hash_lock(file_hash: str):
+    """Hold the indexing lock of a file hash, dropping it when nobody waits for it"""
+    with _index_locks_lock:
+        lock, users = _index_locks.get(file_hash, (threading.Lock(), 0))
+        _index_locks[file_hash] = (lock, users + 1)
+    try:
+        with lock:
+            yield
+    finally:
+        with _index_locks_lock:
+            lock, users = _index_locks[file_hash]
+            if users > 1:
+                _index_locks[file_hash] = (lock, users - 1)
+            else:
+                del _index_locks[file_hash]
+
+
+def index_document(file_path: Path, filename: str, file_hash: str, digest: str) -> dict:
+    """
+    Index a document unless the same content is already indexed
+    
+    An identical file indexed with the current chunking and embedding model
+    is a no-op returning the existing record. A file whose parsed text matches
+    an indexed one gets copies of its chunks and vectors. Otherwise the text
+    is chunked, embedded and stored in batches of EMBED_BATCH_SIZE chunks.
     
-    if len(content) > config.MAX_UPLOAD_SIZE:
-        max_size_mb = config.MAX_UPLOAD_SIZE / 1024 / 1024
-        raise HTTPException(413, f"File too large. Max size: {int(max_size_mb)}MB")
+    Sections are parsed (in the parse pool when PARSE_WORKERS > 0) into the
+    parse cache and read back lazily, so memory does not grow with the
+    document size and re-indexing skips extraction.
+    If indexing fails midway, chunks already stored for this file hash are removed.
+    Concurrent calls for the same file hash run one after another, so the
+    later ones see the first one's record and return duplicate.
+    
+    Returns:
+        Status (processed, reused or duplicate), number of chunks created
+        and length of the parsed text
+    
+    Raises:
+        ValueError: Document cannot be parsed or is empty
+    """
+    with file_hash_lock(file_hash):
+        return _index_document(file_path, filename, file_hash, digest)
+
+
+def _index_document(file_path: Path, filename: str, file_hash: str, digest: str) -> dict:
+    """Index a document, the caller holds the lock of its file hash"""
+    from datetime import datetime
+    chunk_size, overlap, count_tokens = chunk_sizing()
+    signature = index_signature(chunk_size, overlap, count_tokens)
+    store = get_vector_store()
+    
+    record = document_registry.get(file_hash)
+    if record and record["digest"] == digest and record["signature"] == signature and store.has_document(file_hash):
+        # Тот же файл под другим именем: вторая копия на диске не нужна
+        if Path(record["path"]) != file_path and Path(record["path"]).exists():
+            file_path.unlink(missing_ok=True)
+        document = {field: record[field] for field in ("filename", "file_hash", "chunks", "text_length", "uploaded_at")}
+        return {"status": "duplicate", "chunks_created": 0, "text_length": record["text_length"], "document": document}
+    
+    try:
+        if parse_cache.has(digest):
+            content_hash = parse_cache.content_hash(digest)
+        else:
+            parse_pool = get_parse_pool()
+            sections = parse_pool.iter_sections(file_path) if parse_pool else parser.iter_sections(file_path)
+            content_hash = parse_cache.store(digest, sections)
+        
+        # Файл индексируется заново (другие настройки чанкинга или модель): старые чанки заменяются
+        if store.has_document(file_hash):
+            store.delete_document_by_hash(file_hash)
+        
+        metadata = {"source": filename, "file_hash": file_hash, "uploaded_at": datetime.now().isoformat()}
+        original = next((other for other in document_registry.find_content(content_hash, signature)
+                         if other["file_hash"] != file_hash and store.has_document(other["file_hash"])), None)
+        try:
+            if original:
+                # Текст уже проиндексирован из другого файла: векторы копируются без эмбеддингов
+                status = "reused"
+                count = store.copy_document(original["file_hash"], metadata)
+                text_length = original["text_length"]
+            else:
+                status = "processed"
+                chunks = parser.iter_chunks(file_path, chunk_size, overlap, parse_cache.sections(digest), count_tokens)
+                count, text_length = store_chunks(chunks, metadata)
+        except Exception:
+            store.delete_document_by_hash(file_hash)
+            raise
+    finally:
+        if not config.PARSE_CACHE:
+            parse_cache.remove([digest])
+    
+    if not count:
+        raise ValueError("Document is empty or could not be parsed")
+    
+    document_registry.put({
+        "file_hash": file_hash, "digest": digest, "filename": filename, "path": str(file_path),
+        "content_hash": content_hash, "signature": signature, "chunks": count,
+        "text_length": text_length, "uploaded_at": metadata["uploaded_at"]
+    })
+    return {"status": status, "chunks_created": count, "text_length": text_length}
 
 
 @app.post("/upload")
@@ -129,49 +314,32 @@ def validate_file(filename: str, content: bytes) -> None:
 async def upload_document(request: Request, file: UploadFile = File(...)):
     """Upload and process document"""
     try:
-        # Чтение и валидация файла
-        file_content = await file.read()
-        validate_file(file.filename, file_content)
+        validate_file(file.filename)
         
-        # Генерация безопасного имени файла и сохранение
-        safe_filename, file_hash = generate_safe_filename(file.filename, file_content)
-        file_path = config.DOCUMENTS_DIR / safe_filename
-        save_file(file_path, file_content)
+        # Файл пишется на диск по блокам, целиком в памяти не держится
+        try:
+            file_path, file_hash, _, digest = await save_upload(
+                file, config.DOCUMENTS_DIR, file.filename, config.MAX_UPLOAD_SIZE
+            )
+        except ValueError as e:
+            raise HTTPException(413, str(e))
+        safe_filename = file_path.name
         
         logger.info(f"Processing file: {safe_filename}")
         
-        # Парсинг документа
+        # Разбор, чанкинг и эмбеддинги идут потоком пакетами, в пуле потоков
         try:
-            text = parser.parse_document(file_path)
+            indexed = await asyncio.to_thread(index_document, file_path, file.filename, file_hash, digest)
         except ValueError as e:
             logger.error(f"Cannot parse document {safe_filename}: {str(e)}")
             raise HTTPException(400, str(e))
         
-        if not text.strip():
-            logger.error(f"Document is empty after parsing: {safe_filename}")
-            raise HTTPException(400, "Document is empty or could not be parsed")
-        
-        chunks = parser.chunk_text(text, config.CHUNK_SIZE, config.CHUNK_OVERLAP)
-        logger.info(f"Created {len(chunks)} chunks from {safe_filename}")
-        
-        # Генерация эмбеддингов
-        embeddings = get_embedding_gen().generate_embeddings(chunks)
-        
-        # Сохранение в векторную БД
-        from datetime import datetime
-        uploaded_at = datetime.now().isoformat()
-        metadatas = [{"source": file.filename, "chunk": i, "file_hash": file_hash, "text_length": len(text), "uploaded_at": uploaded_at} 
-                     for i in range(len(chunks))]
-        get_vector_store().add_documents(chunks, embeddings, metadatas)
-        
-        logger.info(f"Successfully processed {safe_filename}")
+        logger.info(f"Successfully processed {safe_filename}: {indexed['status']}, {indexed['chunks_created']} chunks")
         
         return {
             "filename": file.filename,
             "file_hash": file_hash,
-            "chunks_created": len(chunks),
-            "text_length": len(text),
-            "status": "processed"
+            **indexed
         }
     
     except HTTPException as e:
@@ -182,6 +350,40 @@ async def upload_document(request: Request, file: UploadFile = File(...)):
         raise HTTPException(500, f"Error processing document: {str(e)}")
 
 
+@app.post("/upload/batch")
+@limiter.limit("5/minute")
+async def upload_documents(request: Request, files: List[UploadFile] = File(...)):
+    """Upload and process several documents concurrently, results are in upload order"""
+    if len(files) > config.UPLOAD_BATCH_MAX_FILES:
+        raise HTTPException(400, f"Too many files. Max: {config.UPLOAD_BATCH_MAX_FILES}")
+    for file in files:
+        validate_file(file.filename)
+    
+    # Одновременно индексируется не больше файлов, чем процессов разбора
+    semaphore = asyncio.Semaphore(max(config.PARSE_WORKERS, 1))
+    
+    async def process(file: UploadFile) -> dict:
+        try:
+            file_path, file_hash, _, digest = await save_upload(
+                file, config.DOCUMENTS_DIR, file.filename, config.MAX_UPLOAD_SIZE
+            )
+        except ValueError as e:
+            return {"filename": file.filename, "status": "error", "error": str(e)}
+        
+        async with semaphore:
+            try:
+                indexed = await asyncio.to_thread(index_document, file_path, file.filename, file_hash, digest)
+            except Exception as e:
+                logger.error(f"Error processing file {file.filename}: {str(e)}")
+                return {"filename": file.filename, "file_hash": file_hash, "status": "error", "error": str(e)}
+        logger.info(f"Successfully processed {file_path.name}: {indexed['status']}, {indexed['chunks_created']} chunks")
+        return {"filename": file.filename, "file_hash": file_hash, **indexed}
+    
+    results = await asyncio.gather(*(process(file) for file in files))
+    processed = sum(1 for result in results if result["status"] != "error")
+    return {"results": results, "processed": processed, "failed": len(results) - processed}
+
+
 @app.post("/query")
 @limiter.limit("30/minute")
 async def query(request: Request, query_request: QueryRequest):
@@ -189,21 +391,42 @@ async def query(request: Request, query_request: QueryRequest):
     try:
         if not query_request.question.strip():
             raise HTTPException(400, "Question cannot be empty")
+        if query_request.deadline_ms is not None and query_request.deadline_ms <= 0:
+            raise HTTPException(400, "deadline_ms must be positive")
         
         logger.info(f"Processing query: {query_request.question[:100]}...")
         
-        # Кэширование запросов
+        if query_request.session_id:
+            # Ответ в диалоге зависит от истории, поэтому кэш не используется
+            session = get_session_store().get(query_request.session_id)
+            if session is None:
+                raise HTTPException(404, "Session not found or expired")
+            async with session.lock:
+                result = await get_rag_engine().aquery(
+                    query_request.question, source_types=query_request.source_types, session=session,
+                    deadline_ms=query_request.deadline_ms
+                )
+            logger.info(f"Session query processed, found {result['sources_count']} sources")
+            return result
+        
+        # Кэширование запросов (ключ учитывает фильтр по типам источников)
+        cache_key = query_request.question
+        if query_request.source_types:
+            cache_key += "|" + ",".join(sorted(query_request.source_types))
+        
         if config.ENABLE_CACHE:
-            cached_result = cache_manager.get_by_text(query_request.question)
+            cached_result = cache_manager.get_by_text(cache_key)
             if cached_result:
                 logger.info("Returning cached result")
                 return cached_result
         
-        result = get_rag_engine().query(query_request.question)
+        result = await get_rag_engine().aquery(
+            query_request.question, source_types=query_request.source_types, deadline_ms=query_request.deadline_ms
+        )
         
-        # Сохранение в кэш
-        if config.ENABLE_CACHE:
-            cache_manager.set_by_text(query_request.question, result)
+        # Сохранение в кэш (запасной ответ по дедлайну не кэшируется)
+        if config.ENABLE_CACHE and not result.get("deadline_exceeded"):
+            cache_manager.set_by_text(cache_key, result)
         
         logger.info(f"Query processed successfully, found {result['sources_count']} sources")
         return result
@@ -214,23 +437,97 @@ async def query(request: Request, query_request: QueryRequest):
         logger.error(f"Error processing query: {str(e)}")
         raise HTTPException(500, f"Error processing query: {str(e)}")
 
+@app.post("/query/stream")
+@limiter.limit("30/minute")
+async def query_stream(request: Request, query_request: QueryRequest):
+    """Query the RAG system, streaming the answer as Server-Sent Events (sources, delta..., done or error)"""
+    if not query_request.question.strip():
+        raise HTTPException(400, "Question cannot be empty")
+    
+    session = None
+    if query_request.session_id:
+        session = get_session_store().get(query_request.session_id)
+        if session is None:
+            raise HTTPException(404, "Session not found or expired")
+    
+    logger.info(f"Processing streaming query: {query_request.question[:100]}...")
+    
+    async def events():
+        stream = get_rag_engine().astream_query(
+            query_request.question, source_types=query_request.source_types, session=session
+        )
+        if session:
+            # Ходы одной сессии выполняются по очереди
+            await session.lock.acquire()
+        try:
+            async for event in stream:
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            if session:
+                session.lock.release()
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/sessions")
+async def create_session():
+    """Start a chat session"""
+    store = get_session_store()
+    store.cleanup_expired()
+    session = store.create()
+    return {"session_id": session.session_id, "idle_ttl": store.idle_ttl}
+
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    """Get chat session history"""
+    session = get_session_store().get(session_id)
+    if session is None:
+        raise HTTPException(404, "Session not found or expired")
+    return session.to_dict()
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """End a chat session"""
+    if not get_session_store().delete(session_id):
+        raise HTTPException(404, "Session not found or expired")
+    return {"status": "success", "session_id": session_id}
+
+
+@app.get("/llm/backends")
+async def get_llm_backends():
+    """Get LLM routing stats: latency, error rate, in-flight calls and circuit state"""
+    return {
+        "failover": config.LLM_FAILOVER,
+        "failover_to_api": config.LLM_FAILOVER_TO_API,
+        "backends": get_llm_router().stats(),
+        "ollama_nodes": get_ollama_pool().stats(),
+        "api_providers": scheduler_stats()
+    }
+
+
 @app.get("/stats")
 async def get_stats():
     """Get system statistics"""
     try:
         # Получаем данные о документах и сайтах
-        collection_data = get_vector_store().collection.get()
+        all_metadatas = get_vector_store().get_all_metadatas()
         
         chunks_count = get_vector_store().get_collection_count()
         documents_count = 0
         websites_count = 0
         
-        if collection_data and collection_data.get('metadatas'):
+        if all_metadatas:
             # Подсчитываем уникальные документы
             unique_files = set()
             unique_sites = set()
             
-            for metadata in collection_data['metadatas']:
+            for metadata in all_metadatas:
                 if metadata:
                     if metadata.get('web_url'):
                         # Это веб-сайт
@@ -258,6 +555,7 @@ async def get_stats():
             "model": current_model,
             "embedding_model": config.EMBEDDING_MODEL,
             "chunk_size": config.CHUNK_SIZE,
+            "chunk_tokens": config.CHUNK_TOKENS,
             "top_k_results": settings_manager.get('context_length', config.TOP_K_RESULTS),
             "cache_enabled": config.ENABLE_CACHE,
             "cache_size": cache_manager.size() if config.ENABLE_CACHE else 0
@@ -272,6 +570,8 @@ async def clear_database():
     """Clear vector database"""
     try:
         get_vector_store().clear_collection()
+        document_registry.clear()
+        parse_cache.clear()
         cache_manager.clear()
         logger.info("Database and cache cleared")
         return {"status": "database and cache cleared"}
@@ -280,11 +580,96 @@ async def clear_database():
         raise HTTPException(500, f"Error clearing database: {str(e)}")
 
 
+@app.get("/shards")
+async def get_shards():
+    """Get vector store shards and their chunk counts"""
+    try:
+        return {
+            "sharding": config.VECTOR_SHARDING,
+            "shards": get_vector_store().list_shards(),
+            "quantization": get_vector_store().quantization_stats()
+        }
+    except Exception as e:
+        logger.error(f"Error getting shards: {str(e)}")
+        raise HTTPException(500, f"Error getting shards: {str(e)}")
+
+
+@app.delete("/shards/{shard}")
+async def clear_shard(shard: str):
+    """Clear one shard (e.g. before re-indexing a web crawl) without touching the others"""
+    try:
+        get_vector_store().clear_shard(shard)
+        cache_manager.clear()
+        logger.info(f"Shard {shard} cleared")
+        return {"status": "success", "message": f"Shard {shard} cleared"}
+    except ValueError as e:
+        raise HTTPException(404, str(e))
+    except Exception as e:
+        logger.error(f"Error clearing shard: {str(e)}")
+        raise HTTPException(500, f"Error clearing shard: {str(e)}")
+
+
+@app.get("/kb/export")
+async def export_knowledge_base(quantize: bool = False):
+    """Export knowledge base as a bundle with precomputed embeddings"""
+    from datetime import datetime
+    from src.kb_bundle import export_bundle
+    
+    try:
+        bundle_name = f"kb_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ragkb"
+        bundle_path = config.EXPORTS_DIR / bundle_name
+        try:
+            # Полный проход по коллекциям и запись zip идут в пуле потоков, не блокируя event loop
+            manifest = await asyncio.to_thread(export_bundle, get_vector_store(), bundle_path, quantize=quantize)
+        except Exception:
+            bundle_path.unlink(missing_ok=True)
+            raise
+        logger.info(f"Exported knowledge base: {bundle_name} ({manifest['count']} chunks)")
+        # Бандл удаляется после отправки, чтобы экспорты не копились в EXPORTS_DIR
+        return FileResponse(
+            bundle_path, media_type="application/zip", filename=bundle_name,
+            background=BackgroundTask(bundle_path.unlink, missing_ok=True)
+        )
+    except Exception as e:
+        logger.error(f"Error exporting knowledge base: {str(e)}")
+        raise HTTPException(500, f"Error exporting knowledge base: {str(e)}")
+
+
+@app.post("/kb/import")
+async def import_knowledge_base(file: UploadFile = File(...), replace: bool = False, force: bool = False):
+    """Import knowledge-base bundle without re-embedding"""
+    import tempfile
+    from src.kb_bundle import import_bundle
+    
+    try:
+        config.EXPORTS_DIR.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=config.EXPORTS_DIR, suffix=".ragkb", delete=False) as tmp:
+            await asyncio.to_thread(shutil.copyfileobj, file.file, tmp)
+            bundle_path = Path(tmp.name)
+        
+        try:
+            result = await asyncio.to_thread(
+                import_bundle, get_vector_store(), bundle_path, replace=replace, force=force
+            )
+        finally:
+            bundle_path.unlink(missing_ok=True)
+        
+        cache_manager.clear()
+        logger.info(f"Imported knowledge base from {file.filename}: {result['imported_chunks']} chunks")
+        return {"status": "success", **result}
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    except Exception as e:
+        logger.error(f"Error importing knowledge base: {str(e)}")
+        raise HTTPException(500, f"Error importing knowledge base: {str(e)}")
+
+
 @app.delete("/documents/{file_hash}")
 async def delete_document(file_hash: str):
     """Delete a specific document by file_hash"""
     try:
         deleted_count = get_vector_store().delete_document_by_hash(file_hash)
+        parse_cache.remove(document_registry.remove([file_hash]))
         
         if deleted_count == 0:
             raise HTTPException(404, f"Document with hash {file_hash} not found")
@@ -304,21 +689,77 @@ async def delete_document(file_hash: str):
         logger.error(f"Error deleting document: {str(e)}")
         raise HTTPException(500, f"Error deleting document: {str(e)}")
 
+@app.post("/documents/{file_hash}/reindex")
+async def reindex_document(file_hash: str):
+    """Re-chunk and re-embed a document with current settings (no-op if it is up to date)"""
+    record = document_registry.get(file_hash)
+    if record is None:
+        raise HTTPException(404, f"Document with hash {file_hash} not found")
+    
+    try:
+        # Текст берется из кэша разбора, исходный файл нужен только без него
+        indexed = await asyncio.to_thread(
+            index_document, Path(record["path"]), record["filename"], file_hash, record["digest"]
+        )
+    except (ValueError, FileNotFoundError) as e:
+        raise HTTPException(400, str(e))
+    except Exception as e:
+        logger.error(f"Error reindexing document {file_hash}: {str(e)}")
+        raise HTTPException(500, f"Error reindexing document: {str(e)}")
+    
+    cache_manager.clear()
+    logger.info(f"Reindexed document with hash {file_hash}: {indexed['status']}, {indexed['chunks_created']} chunks")
+    return {"filename": record["filename"], "file_hash": file_hash, **indexed}
+
+
+class BulkDeleteRequest(BaseModel):
+    file_hashes: List[str]
+
+
+@app.post("/documents/delete")
+async def delete_documents(request: BulkDeleteRequest):
+    """Delete several documents by file_hash in one batched operation"""
+    try:
+        if not request.file_hashes:
+            raise HTTPException(400, "file_hashes cannot be empty")
+        
+        deleted_count = get_vector_store().delete_documents_by_hashes(request.file_hashes)
+        parse_cache.remove(document_registry.remove(request.file_hashes))
+        
+        if deleted_count == 0:
+            raise HTTPException(404, "Documents not found")
+        
+        cache_manager.clear()
+        
+        logger.info(f"Deleted {len(request.file_hashes)} documents ({deleted_count} chunks)")
+        return {
+            "status": "success",
+            "message": f"Documents deleted ({deleted_count} chunks)",
+            "deleted_chunks": deleted_count
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error deleting documents: {str(e)}")
+        raise HTTPException(500, f"Error deleting documents: {str(e)}")
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    try:
-        # Проверка подключения к Ollama
-        import requests
-
-        response = requests.get(f"{config.OLLAMA_BASE_URL}/api/tags", timeout=5)
-        ollama_status = "healthy" if response.status_code == 200 else "unhealthy"
-    except:
+    # Проверка подключения ко всем узлам Ollama
+    nodes = await get_ollama_pool().probe()
+    healthy_nodes = sum(1 for node in nodes if node["healthy"])
+    if healthy_nodes == len(nodes):
+        ollama_status = "healthy"
+    elif healthy_nodes:
+        ollama_status = "degraded"
+    else:
         ollama_status = "unreachable"
 
     return {
         "status": "healthy",
         "ollama": ollama_status,
+        "ollama_nodes": nodes,
         "vector_store": "healthy",
         "documents_count": get_vector_store().get_collection_count(),
     }
@@ -388,9 +829,13 @@ async def update_settings(settings: SettingsUpdate):
         
         # Обновляем настройки
         if settings.model is not None:
+            previous_model = settings_manager.get('model', config.OLLAMA_MODEL)
             settings_manager.set('model', settings.model)
             config.OLLAMA_MODEL = settings.model
             updated['model'] = settings.model
+            # Новая модель загружается в фоне, пока пользователь не задал вопрос
+            if config.OLLAMA_PRELOAD and settings.model != previous_model:
+                schedule_preload(settings.model, previous_model)
         
         if settings.temperature is not None:
             settings_manager.set('temperature', settings.temperature)
@@ -547,7 +992,7 @@ async def test_api_connection(config_data: APIModelConfig):
         )
         
         # Тестируем подключение
-        test_result = connector.test_connection()
+        test_result = await connector.atest_connection()
         
         if test_result:
             return {
@@ -582,7 +1027,7 @@ async def configure_api_model(config_data: APIModelConfig):
             model_name=config_data.model_name
         )
         
-        test_result = connector.test_connection()
+        test_result = await connector.atest_connection()
         
         if not test_result:
             raise HTTPException(400, "Не удалось подключиться к API. Проверьте ключ и название модели.")
@@ -598,9 +1043,6 @@ async def configure_api_model(config_data: APIModelConfig):
         settings_manager.set('api_model_config', api_config)
         settings_manager.set('use_api_model', True)
         
-        # Обновляем RAG engine для использования новой конфигурации
-        get_rag_engine().api_connector = None
-        
         logger.info(f"Successfully configured API model: {config_data.api_type} - {config_data.model_name}")
         
         return {
@@ -621,7 +1063,6 @@ async def disable_api_model():
     """Disable external API model and switch back to Ollama"""
     try:
         settings_manager.set('use_api_model', False)
-        get_rag_engine().api_connector = None
         
         logger.info("Disabled API model, switched back to Ollama")
         
@@ -640,16 +1081,16 @@ async def get_documents():
     """Get list of uploaded documents"""
     try:
         # Получаем все документы из коллекции
-        collection_data = get_vector_store().collection.get()
+        all_metadatas = get_vector_store().get_all_metadatas()
         
-        if not collection_data or not collection_data.get('metadatas'):
+        if not all_metadatas:
             return {"documents": [], "websites": []}
         
         # Группируем по файлам и веб-сайтам
         files_dict = {}
         websites_dict = {}
         
-        for metadata in collection_data['metadatas']:
+        for metadata in all_metadatas:
             if metadata and 'source' in metadata:
                 source = metadata['source']
                 file_hash = metadata.get('file_hash', 'unknown')
@@ -684,6 +1125,8 @@ async def get_documents():
                             'uploaded_at': uploaded_at
                         }
                     files_dict[source]['chunks_count'] += 1
+                    # У потоково проиндексированных документов длина растет от чанка к чанку
+                    files_dict[source]['text_length'] = max(files_dict[source]['text_length'], text_length)
         
         # Подсчитываем количество страниц для веб-сайтов
         for site_data in websites_dict.values():
@@ -711,10 +1154,11 @@ async def test_xwiki_connection(config: XWikiConfig):
             password=config.password
         )
         
-        is_connected = connector.test_connection()
+        # Клиент XWiki синхронный: запросы идут в пуле потоков, чтобы не блокировать event loop
+        is_connected = await asyncio.to_thread(connector.test_connection)
         
         if is_connected:
-            spaces = connector.get_spaces(config.wiki)
+            spaces = await asyncio.to_thread(connector.get_spaces, config.wiki)
             return {
                 "status": "success",
                 "message": "Подключение успешно",
@@ -741,7 +1185,7 @@ async def import_from_xwiki(request: XWikiImportRequest):
         )
         
         # Проверяем подключение
-        if not connector.test_connection():
+        if not await asyncio.to_thread(connector.test_connection):
             raise HTTPException(400, "Cannot connect to XWiki")
         
         # Получаем страницы
@@ -764,7 +1208,7 @@ async def import_from_xwiki(request: XWikiImportRequest):
                     continue
                 
                 # Создаем чанки
-                chunks = parser.chunk_text(content, config.CHUNK_SIZE, config.CHUNK_OVERLAP)
+                chunks = parser.chunk_text(content, *chunk_sizing())
                 
                 # Генерируем эмбеддинги
                 embeddings = get_embedding_gen().generate_embeddings(chunks)
@@ -841,7 +1285,7 @@ async def import_from_web(request: Request, import_request: WebImportRequest):
                     continue
                 
                 # Создаем чанки
-                chunks = parser.chunk_text(content, config.CHUNK_SIZE, config.CHUNK_OVERLAP)
+                chunks = parser.chunk_text(content, *chunk_sizing())
                 
                 # Генерируем эмбеддинги
                 embeddings = get_embedding_gen().generate_embeddings(chunks)
@@ -923,24 +1367,15 @@ async def delete_website(site_name: str):
         
         logger.info(f"Attempting to delete website: {site_name}")
         
-        # Получаем все документы с данным site_name
-        vector_store = get_vector_store()
-        collection_data = vector_store.collection.get(
-            where={"web_site": site_name}
-        )
+        deleted_count = get_vector_store().delete_website(site_name)
         
-        if not collection_data or not collection_data.get('ids'):
+        if deleted_count == 0:
             logger.warning(f"Website {site_name} not found in database")
             raise HTTPException(404, f"Website {site_name} not found")
         
-        # Удаляем все найденные чанки
-        ids_to_delete = collection_data['ids']
-        vector_store.collection.delete(ids=ids_to_delete)
-        
         # Очищаем кэш
         cache_manager.clear()
         
-        deleted_count = len(ids_to_delete)
         logger.info(f"Deleted website {site_name} ({deleted_count} chunks)")
         
         return {
@@ -7,6 +7,7 @@ BASE_DIR = Path(__file__).parent
 DATA_DIR = BASE_DIR / "data"
 DOCUMENTS_DIR = DATA_DIR / "documents"
 CHROMA_DB_DIR = DATA_DIR / "chroma_db"
+EXPORTS_DIR = DATA_DIR / "exports"
 LOGS_DIR = BASE_DIR / "logs"
 
 # Ensure directories exist
@@ -16,22 +17,154 @@ LOGS_DIR.mkdir(parents=True, exist_ok=True)
 
 # Ollama settings
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+# Несколько экземпляров Ollama через запятую: запросы идут на наименее загруженный здоровый узел.
+# Управление моделями (загрузка, удаление, список) выполняется на OLLAMA_BASE_URL
+OLLAMA_BASE_URLS = [url.strip() for url in (os.getenv("OLLAMA_BASE_URLS") or OLLAMA_BASE_URL).split(",") if url.strip()]
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2:3b")
 OLLAMA_TIMEOUT = int(os.getenv("OLLAMA_TIMEOUT", "120"))
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+# Пул keep-alive соединений async клиента
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "10"))
+OLLAMA_POOL_IDLE_TIMEOUT = float(os.getenv("OLLAMA_POOL_IDLE_TIMEOUT", "60"))
+# Сколько модель остается в памяти после запроса: длительность (30m, 1h) или секунды (-1 - всегда)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+if OLLAMA_KEEP_ALIVE.lstrip("-").isdigit():
+    OLLAMA_KEEP_ALIVE = int(OLLAMA_KEEP_ALIVE)
+OLLAMA_PRELOAD = os.getenv("OLLAMA_PRELOAD", "true").lower() == "true"
+# Порог времени загрузки модели, выше которого запрос считается "холодным"
+OLLAMA_COLD_LOAD_MS = int(os.getenv("OLLAMA_COLD_LOAD_MS", "1000"))
+# Проверка узлов через /api/tags; после OLLAMA_EJECT_FAILURES ошибок подряд узел исключается на OLLAMA_EJECT_TIME секунд
+OLLAMA_HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "15"))
+OLLAMA_EJECT_FAILURES = int(os.getenv("OLLAMA_EJECT_FAILURES", "2"))
+OLLAMA_EJECT_TIME = float(os.getenv("OLLAMA_EJECT_TIME", "30"))
+
+# LLM routing
+# Запрос идет на бэкенд с лучшей оценкой (медианная задержка, очередь, недавние ошибки). Выбранный в настройках
+# бэкенд (Ollama или API) остается первым, пока другой не лучше него больше чем в 1 + LLM_SWITCH_MARGIN раз;
+# перегруженный или отключенный предохранителем бэкенд уступает очередь
+LLM_FAILOVER = os.getenv("LLM_FAILOVER", "true").lower() == "true"
+LLM_SWITCH_MARGIN = float(os.getenv("LLM_SWITCH_MARGIN", "0.5"))
+# Переход с локальной модели на платный API (стоимость, данные уходят наружу) включается явно
+LLM_FAILOVER_TO_API = os.getenv("LLM_FAILOVER_TO_API", "false").lower() == "true"
+# Для Ollama - на каждый узел OLLAMA_BASE_URLS
+LLM_OLLAMA_MAX_IN_FLIGHT = int(os.getenv("LLM_OLLAMA_MAX_IN_FLIGHT", "2"))
+LLM_API_MAX_IN_FLIGHT = int(os.getenv("LLM_API_MAX_IN_FLIGHT", "8"))
+LLM_DEFAULT_LATENCY_MS = float(os.getenv("LLM_DEFAULT_LATENCY_MS", "3000"))
+LLM_STATS_WINDOW = int(os.getenv("LLM_STATS_WINDOW", "50"))
+# Предохранитель: после LLM_CIRCUIT_FAILURES ошибок подряд бэкенд исключается на LLM_CIRCUIT_COOLDOWN секунд
+LLM_CIRCUIT_FAILURES = int(os.getenv("LLM_CIRCUIT_FAILURES", "3"))
+LLM_CIRCUIT_COOLDOWN = float(os.getenv("LLM_CIRCUIT_COOLDOWN", "30"))
+# Общее время на генерацию со всеми попытками
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", str(OLLAMA_TIMEOUT)))
+# Дедлайн запроса /query по умолчанию (0 - без дедлайна). Поиск документов может занять до
+# RETRIEVAL_DEADLINE_SHARE дедлайна (иначе реранкинг пропускается), генерация получает остаток.
+# Если модель не успела, возвращается EXTRACTIVE_SENTENCES предложений из найденных чанков
+QUERY_DEADLINE_MS = int(os.getenv("QUERY_DEADLINE_MS", "0"))
+RETRIEVAL_DEADLINE_SHARE = float(os.getenv("RETRIEVAL_DEADLINE_SHARE", "0.3"))
+EXTRACTIVE_SENTENCES = int(os.getenv("EXTRACTIVE_SENTENCES", "3"))
 
 # Embedding settings
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+# Размер чанков в токенах токенизатора эмбеддингов (0 - в символах по CHUNK_SIZE/CHUNK_OVERLAP)
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "0"))
+CHUNK_TOKEN_OVERLAP = int(os.getenv("CHUNK_TOKEN_OVERLAP", "32"))
+# Чанков в одном пакете эмбеддингов при загрузке документа (память не растет с размером файла)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# Процессы для разбора документов (0 - разбор в потоке запроса); большие PDF делятся на диапазоны страниц
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(min(2, os.cpu_count() or 1))))
+PARSE_PAGES_PER_TASK = int(os.getenv("PARSE_PAGES_PER_TASK", "64"))
+# Разобранный текст хранится по хешу файла: повторная индексация (например, после смены чанкинга) не разбирает PDF заново
+PARSE_CACHE = os.getenv("PARSE_CACHE", "true").lower() == "true"
+PARSE_CACHE_DIR = DATA_DIR / "parse_cache"
+# Реестр загруженных файлов: одинаковый файл не индексируется повторно, одинаковый текст берет готовые векторы
+DOCUMENT_REGISTRY_DB = CHROMA_DB_DIR / "document_registry.sqlite3"
+
+# Context settings
+# Упаковка целых чанков в бюджет токенов (num_ctx - промпт - num_predict) вместо обрезки по context_length
+CONTEXT_PACKING = os.getenv("CONTEXT_PACKING", "true").lower() == "true"
+CONTEXT_TOKEN_SAFETY = float(os.getenv("CONTEXT_TOKEN_SAFETY", "1.1"))
+API_CONTEXT_TOKENS = int(os.getenv("API_CONTEXT_TOKENS", "4000"))
+# Склейка перекрывающихся соседних чанков и отбрасывание почти одинаковых (сходство шинглов по Жаккару)
+CONTEXT_DEDUP = os.getenv("CONTEXT_DEDUP", "true").lower() == "true"
+DEDUP_SIMILARITY = float(os.getenv("DEDUP_SIMILARITY", "0.8"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+CHARS_PER_TOKEN = 3  # оценка для кириллицы, если токенизатор недоступен
 
 # Vector store settings
 COLLECTION_NAME = "documents"
 TOP_K_RESULTS = int(os.getenv("TOP_K_RESULTS", "5"))
+# Адаптивный top-k: от RETRIEVAL_MIN_K до RETRIEVAL_MAX_K чанков, отсекаем нерелевантный хвост.
+# RETRIEVAL_MAX_DISTANCE - в метрике VECTOR_METRIC, RETRIEVAL_RELATIVE_GAP - допустимая потеря сходства
+# относительно лучшего результата. По умолчанию (0) отсечки выключены и поиск возвращает RETRIEVAL_MAX_K чанков:
+# пороги зависят от модели эмбеддингов и документов, их включают после проверки расстояний на своих запросах
+RETRIEVAL_MAX_K = int(os.getenv("RETRIEVAL_MAX_K", str(TOP_K_RESULTS)))
+RETRIEVAL_MIN_K = int(os.getenv("RETRIEVAL_MIN_K", "1"))
+RETRIEVAL_MAX_DISTANCE = float(os.getenv("RETRIEVAL_MAX_DISTANCE") or 0) or None
+RETRIEVAL_RELATIVE_GAP = float(os.getenv("RETRIEVAL_RELATIVE_GAP") or 0) or None
+# Реранкинг кросс-энкодером: из RERANK_CANDIDATES кандидатов в промпт идут RERANK_TOP_K лучших
+ENABLE_RERANK = os.getenv("ENABLE_RERANK", "false").lower() == "true"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "3"))
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "256"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "2048"))
+# Бюджет задержки: сколько кандидатов успеваем переоценить; под нагрузкой реранкинг пропускается
+RERANK_BUDGET_MS = int(os.getenv("RERANK_BUDGET_MS", "300"))
+RERANK_MAX_IN_FLIGHT = int(os.getenv("RERANK_MAX_IN_FLIGHT", "1"))
+SOURCE_INDEX_DB = CHROMA_DB_DIR / "source_index.sqlite3"
+DELETE_BATCH_SIZE = int(os.getenv("DELETE_BATCH_SIZE", "500"))
+# Параметры HNSW-индекса коллекций (после изменения выполните scripts/rebuild_index.py)
+VECTOR_METRIC = os.getenv("VECTOR_METRIC", "cosine")  # l2 | cosine | ip
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "100"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "50"))
+# Шардирование коллекций: none (одна коллекция), source_type (files/web/xwiki), site (отдельный шард на сайт)
+VECTOR_SHARDING = os.getenv("VECTOR_SHARDING", "none")
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "4"))
+# Сжатие векторов для хостов с малым объемом памяти: none | int8 | pq
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+QUANTIZATION_RERANK_K = int(os.getenv("QUANTIZATION_RERANK_K", "50"))
+PQ_SUBVECTORS = int(os.getenv("PQ_SUBVECTORS", "48"))
+QUANTIZED_INDEX_DIR = CHROMA_DB_DIR / "quantized"
+
+# Chat sessions
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "1000"))
+SESSION_IDLE_TTL = int(os.getenv("SESSION_IDLE_TTL", "1800"))  # 30 minutes
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "3"))  # старые ходы сворачиваются в резюме
+SESSION_SUMMARY_CHARS = int(os.getenv("SESSION_SUMMARY_CHARS", "600"))
+# Доля num_ctx, которую может занимать сохраненное состояние Ollama
+SESSION_CONTEXT_SHARE = float(os.getenv("SESSION_CONTEXT_SHARE", "0.5"))
+
+# External API models (OpenAI, Anthropic, Gemini, custom)
+# Пул keep-alive соединений (HTTP/2, если установлен пакет h2) и отдельные таймауты соединения и ответа
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "5"))
+API_READ_TIMEOUT = float(os.getenv("API_READ_TIMEOUT", "60"))
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", "20"))
+API_POOL_IDLE_TIMEOUT = float(os.getenv("API_POOL_IDLE_TIMEOUT", "60"))
+# Повторы при 429/5xx и обрывах соединения: экспоненциальная задержка с джиттером, Retry-After соблюдается.
+# Если провайдер просит ждать дольше API_RETRY_MAX_DELAY секунд, ошибка возвращается сразу
+API_MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "3"))
+API_RETRY_BASE_DELAY = float(os.getenv("API_RETRY_BASE_DELAY", "0.5"))
+API_RETRY_MAX_DELAY = float(os.getenv("API_RETRY_MAX_DELAY", "10"))
+# Очередь к каждому провайдеру: не более API_MAX_CONCURRENCY запросов одновременно и лимиты в минуту
+# (0 - без ограничения, пока лимит не придет в заголовках x-ratelimit-* / anthropic-ratelimit-*)
+API_MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", "4"))
+API_RPM = float(os.getenv("API_RPM", "0"))
+API_TPM = float(os.getenv("API_TPM", "0"))
+API_QUEUE_TIMEOUT = float(os.getenv("API_QUEUE_TIMEOUT", "60"))
+
+# Telegram bot
+# Ответ показывается по мере генерации: сообщение редактируется не чаще раза в TELEGRAM_STREAM_EDIT_INTERVAL секунд
+TELEGRAM_STREAM = os.getenv("TELEGRAM_STREAM", "true").lower() == "true"
+TELEGRAM_STREAM_EDIT_INTERVAL = float(os.getenv("TELEGRAM_STREAM_EDIT_INTERVAL", "1.5"))
 
 # API settings
 API_HOST = os.getenv("API_HOST", "0.0.0.0")
 API_PORT = int(os.getenv("API_PORT", "8000"))
 MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", "52428800"))  # 50MB
+UPLOAD_BATCH_MAX_FILES = int(os.getenv("UPLOAD_BATCH_MAX_FILES", "20"))  # файлов в одном /upload/batch
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "*").split(",")
 
 # Logging
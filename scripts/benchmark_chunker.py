@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Сравнение чанкеров на многомегабайтных текстах
+
+- legacy: прежний chunk_text (список предложений, перекрытие через insert(0), join каждого чанка)
+- spans: chunk_spans, только смещения (start, end) без копирования текста
+- chunk_text: chunk_spans с получением текста чанков
+- tokens: размер в токенах токенизатора эмбеддингов (или оценке по CHARS_PER_TOKEN без transformers)
+
+Использование:
+    python scripts/benchmark_chunker.py --size-mb 5
+    python scripts/benchmark_chunker.py --file data/documents/book.txt --chunk-tokens 128 --token-overlap 32
+"""
+import argparse
+import random
+import re
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import config  # noqa: E402
+from src.document_parser import DocumentParser, chunk_spans  # noqa: E402
+
+
+def make_text(size_mb: float) -> str:
+    """Generate text of Russian-like sentences with paragraph breaks"""
+    rng = random.Random(0)
+    words = ["договор", "поставки", "сторона", "обязуется", "передать", "товар", "в", "срок", "оплата",
+             "производится", "по", "счету", "акт", "приемки", "подписывается", "обеими", "сторонами"]
+    parts = []
+    size = 0
+    while size < size_mb * 1e6:
+        sentence = " ".join(rng.choice(words) for _ in range(rng.randint(4, 30))).capitalize()
+        sentence += rng.choice([".", ".", ".", "!", "?", ".\n\n"])
+        parts.append(sentence)
+        size += len(sentence.encode()) + 1
+    return " ".join(parts)
+
+
+def legacy_chunk_text(text: str, chunk_size: int, overlap: int) -> List[str]:
+    """Previous DocumentParser.chunk_text"""
+    sentences = re.split(r'(?<=[.!?])\s+', text)
+    chunks = []
+    current_chunk = []
+    current_size = 0
+    for sentence in sentences:
+        sentence_len = len(sentence)
+        if current_size + sentence_len > chunk_size and current_chunk:
+            chunks.append(' '.join(current_chunk))
+            overlap_sentences = []
+            overlap_size = 0
+            for s in reversed(current_chunk):
+                if overlap_size + len(s) <= overlap:
+                    overlap_sentences.insert(0, s)
+                    overlap_size += len(s)
+                else:
+                    break
+            current_chunk = overlap_sentences
+            current_size = overlap_size
+        current_chunk.append(sentence)
+        current_size += sentence_len
+    if current_chunk:
+        chunks.append(' '.join(current_chunk))
+    return [c for c in chunks if c.strip()]
+
+
+def load_tokenizer() -> (Callable[[str], int], str):
+    """Get token counter of the embedding model, or the character estimate without transformers"""
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(config.EMBEDDING_MODEL)
+        return lambda text: len(tokenizer.encode(text, add_special_tokens=False, verbose=False)), "model"
+    except Exception as e:
+        print(f"Tokenizer not available ({type(e).__name__}), using {config.CHARS_PER_TOKEN} chars per token estimate")
+        return lambda text: len(text) // config.CHARS_PER_TOKEN + 1, "estimate"
+
+
+def measure(fn):
+    """Time a run, then repeat it under tracemalloc for peak memory (tracing slows it down)"""
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--file", type=Path, help="text file instead of generated text")
+    arg_parser.add_argument("--size-mb", type=float, default=5)
+    arg_parser.add_argument("--chunk-size", type=int, default=config.CHUNK_SIZE)
+    arg_parser.add_argument("--overlap", type=int, default=config.CHUNK_OVERLAP)
+    arg_parser.add_argument("--chunk-tokens", type=int, default=config.CHUNK_TOKENS or 256)
+    arg_parser.add_argument("--token-overlap", type=int, default=config.CHUNK_TOKEN_OVERLAP)
+    arg_parser.add_argument("--no-tokens", action="store_true", help="skip token-based sizing")
+    args = arg_parser.parse_args()
+
+    text = args.file.read_text(encoding="utf-8") if args.file else make_text(args.size_mb)
+    size_mb = len(text.encode()) / 1e6
+    print(f"Text: {len(text)} chars ({size_mb:.1f} MB), "
+          f"chunk {args.chunk_size} / overlap {args.overlap} chars")
+
+    parser = DocumentParser()
+    runs = [
+        ("legacy", lambda: [len(chunk) for chunk in legacy_chunk_text(text, args.chunk_size, args.overlap)]),
+        ("spans", lambda: [end - start for start, end in chunk_spans(text, args.chunk_size, args.overlap)]),
+        ("chunk_text", lambda: [len(chunk) for chunk in parser.chunk_text(text, args.chunk_size, args.overlap)]),
+    ]
+    if not args.no_tokens:
+        count_tokens, kind = load_tokenizer()
+        runs.append((f"tokens/{kind}", lambda: [end - start for start, end in chunk_spans(
+            text, args.chunk_tokens, args.token_overlap, count_tokens)]))
+
+    print(f"{'chunker':<16} {'time s':>8} {'MB/s':>7} {'peak MB':>9} {'chunks':>8} {'avg chars':>10}")
+    for name, fn in runs:
+        elapsed, peak, lengths = measure(fn)
+        print(f"{name:<16} {elapsed:>8.2f} {size_mb / elapsed:>7.1f} {peak / 1e6:>9.1f} "
+              f"{len(lengths):>8} {sum(lengths) / max(len(lengths), 1):>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Сравнение разбора Excel: pandas read_excel + to_string против построчного openpyxl (read-only)
+
+Для каждого способа: время разбора и чанкинга, пиковая память (tracemalloc),
+объем текста и число чанков, которые пойдут в эмбеддинги.
+
+Использование:
+    python scripts/benchmark_excel.py                         # синтетическая книга 3 x 10000 строк
+    python scripts/benchmark_excel.py --sheets 5 --rows 100000 --cols 12
+    python scripts/benchmark_excel.py --file data/documents/report.xlsx
+"""
+import argparse
+import datetime
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import config  # noqa: E402
+from src.document_parser import DocumentParser  # noqa: E402
+
+
+def make_workbook(path: Path, sheets: int, rows: int, cols: int) -> None:
+    """Write a workbook with mixed text, numeric and date columns"""
+    import openpyxl
+
+    rng = random.Random(0)
+    words = ["склад", "поставка", "договор", "счет", "клиент", "заказ", "оплата", "отгрузка"]
+    workbook = openpyxl.Workbook(write_only=True)
+    for sheet_num in range(sheets):
+        sheet = workbook.create_sheet(f"Лист{sheet_num + 1}")
+        sheet.append([f"Поле {col + 1}" for col in range(cols)])
+        for row in range(rows):
+            values = []
+            for col in range(cols):
+                kind = col % 4
+                if kind == 0:
+                    values.append(" ".join(rng.choice(words) for _ in range(rng.randint(1, 4))))
+                elif kind == 1:
+                    values.append(rng.randint(1, 100000))
+                elif kind == 2:
+                    values.append(round(rng.random() * 1000, 2))
+                else:
+                    values.append(datetime.date(2024, 1, 1) + datetime.timedelta(days=row % 365))
+            # Часть ячеек пустая, как в реальных таблицах
+            if row % 5 == 0:
+                values[-1] = None
+            sheet.append(values)
+    workbook.save(path)
+
+
+def pandas_text(parser: DocumentParser, path: Path) -> List[int]:
+    """Previous path: all sheets as DataFrames rendered with to_string"""
+    import pandas as pd
+
+    text_parts = []
+    for sheet_name, sheet_df in pd.read_excel(path, sheet_name=None).items():
+        text_parts.append(f"=== Лист: {sheet_name} ===\n")
+        text_parts.append(sheet_df.to_string(index=False))
+        text_parts.append("\n\n")
+    text = "\n".join(text_parts)
+    return [len(chunk) for chunk in parser.chunk_text(text, config.CHUNK_SIZE, config.CHUNK_OVERLAP)]
+
+
+def streaming_text(parser: DocumentParser, path: Path) -> List[int]:
+    """Current path: row records streamed into chunks"""
+    return [len(chunk) for chunk, _ in parser.iter_chunks(path, config.CHUNK_SIZE, config.CHUNK_OVERLAP)]
+
+
+def measure(fn, parser: DocumentParser, path: Path):
+    """Time a parser, then run it again under tracemalloc for peak memory (tracing slows it down)"""
+    start = time.perf_counter()
+    lengths = fn(parser, path)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    fn(parser, path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, lengths
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--file", type=Path, help="existing .xlsx workbook instead of a synthetic one")
+    arg_parser.add_argument("--sheets", type=int, default=3)
+    arg_parser.add_argument("--rows", type=int, default=10000)
+    arg_parser.add_argument("--cols", type=int, default=8)
+    args = arg_parser.parse_args()
+
+    parser = DocumentParser()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.file
+        if path is None:
+            path = Path(tmp) / "benchmark.xlsx"
+            start = time.perf_counter()
+            make_workbook(path, args.sheets, args.rows, args.cols)
+            print(f"Workbook: {args.sheets} sheets x {args.rows} rows x {args.cols} cols "
+                  f"({path.stat().st_size / 1e6:.1f} MB, written in {time.perf_counter() - start:.1f} s)")
+        else:
+            print(f"Workbook: {path} ({path.stat().st_size / 1e6:.1f} MB)")
+
+        # Чанк длиннее окна модели эмбеддингов представлен в индексе только своим началом
+        print(f"{'parser':<12} {'time s':>8} {'peak MB':>9} {'text chars':>12} {'chunks':>8} {'max chunk':>10}")
+        for name, fn in (("pandas", pandas_text), ("streaming", streaming_text)):
+            elapsed, peak, lengths = measure(fn, parser, path)
+            print(f"{name:<12} {elapsed:>8.2f} {peak / 1e6:>9.1f} {sum(lengths):>12} {len(lengths):>8} "
+                  f"{max(lengths, default=0):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Сравнение сжатых индексов (int8 / PQ) с несжатым поиском по float32
+
+Использование:
+    python scripts/benchmark_quantization.py              # векторы из базы знаний
+    python scripts/benchmark_quantization.py --synthetic 50000
+    python scripts/benchmark_quantization.py --synthetic 20000 --first-batch 5
+
+Строки "+add" строят индекс так же, как загрузки: первый маленький пакет,
+затем пакеты по --batch-size через add (с переобучением квантизатора по мере роста).
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import config  # noqa: E402
+from src.quantization import QuantizedIndex, exact_distances  # noqa: E402
+
+
+def load_vectors(synthetic: int) -> np.ndarray:
+    """Load embeddings from the vector store or generate clustered synthetic ones"""
+    if synthetic:
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(max(synthetic // 100, 10), 384))
+        labels = rng.integers(0, len(centers), synthetic)
+        return (centers[labels] + 0.4 * rng.normal(size=(synthetic, 384))).astype(np.float32)
+
+    from src.vector_store import VectorStore
+    store = VectorStore()
+    matrices = [store.get_shard_embeddings(shard)[1] for shard in store.collections]
+    matrices = [matrix for matrix in matrices if len(matrix)]
+    return np.concatenate(matrices) if matrices else np.empty((0, 0), dtype=np.float32)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--synthetic", type=int, default=0, help="use N synthetic vectors instead of the vector store")
+    arg_parser.add_argument("--queries", type=int, default=200, help="number of queries")
+    arg_parser.add_argument("--top-k", type=int, default=config.TOP_K_RESULTS)
+    arg_parser.add_argument("--rerank-k", type=int, default=config.QUANTIZATION_RERANK_K)
+    arg_parser.add_argument("--metric", default=config.VECTOR_METRIC, choices=["l2", "ip", "cosine"])
+    arg_parser.add_argument("--first-batch", type=int, default=5, help="first batch size for incremental builds")
+    arg_parser.add_argument("--batch-size", type=int, default=config.EMBED_BATCH_SIZE, help="later batch size")
+    args = arg_parser.parse_args()
+
+    vectors = load_vectors(args.synthetic)
+    if len(vectors) < args.top_k + args.queries:
+        print(f"Not enough vectors: {len(vectors)}")
+        return 1
+
+    # Запросы - зашумленные копии случайных векторов базы
+    rng = np.random.default_rng(1)
+    query_rows = rng.choice(len(vectors), args.queries, replace=False)
+    queries = vectors[query_rows] + 0.05 * rng.normal(size=(args.queries, vectors.shape[1])).astype(np.float32)
+    ids = [str(i) for i in range(len(vectors))]
+
+    start = time.perf_counter()
+    truth = [set(np.argsort(exact_distances(q, vectors, args.metric))[:args.top_k].astype(str)) for q in queries]
+    exact_ms = (time.perf_counter() - start) * 1000 / args.queries
+
+    print(f"Vectors: {len(vectors)} x {vectors.shape[1]}, metric: {args.metric}, "
+          f"top_k: {args.top_k}, rerank_k: {args.rerank_k}")
+    print(f"{'index':<8} {'memory':>12} {'ratio':>7} {'build s':>8} {'query ms':>9} {'recall@k':>9}")
+    print(f"{'float32':<8} {vectors.nbytes / 1024 / 1024:>10.1f}MB {1.0:>7.1f} {0.0:>8.2f} {exact_ms:>9.2f} {1.0:>9.3f}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for method, incremental in (("int8", False), ("int8", True), ("pq", False), ("pq", True)):
+            name = f"{method}+add" if incremental else method
+            index = QuantizedIndex(Path(tmp) / name, method, args.metric, config.PQ_SUBVECTORS)
+
+            start = time.perf_counter()
+            if incremental:
+                index.add(ids[:args.first_batch], vectors[:args.first_batch])
+                for offset in range(args.first_batch, len(vectors), args.batch_size):
+                    index.add(ids[offset:offset + args.batch_size], vectors[offset:offset + args.batch_size])
+            else:
+                index.build(ids, vectors)
+            build_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            results = [index.search(q, args.top_k, args.rerank_k) for q in queries]
+            query_ms = (time.perf_counter() - start) * 1000 / args.queries
+
+            recall = np.mean([
+                len(expected & {chunk_id for chunk_id, _ in found}) / args.top_k
+                for expected, found in zip(truth, results)
+            ])
+            stats = index.stats()
+            print(f"{name:<8} {stats['code_bytes'] / 1024 / 1024:>10.1f}MB {stats['compression']:>7.1f} "
+                  f"{build_s:>8.2f} {query_ms:>9.2f} {recall:>9.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Имитатор LLM сервера для воспроизводимых замеров задержки без Ollama и платных API
+
+Отвечает как Ollama (/api/generate с потоком и без, /api/tags) и как OpenAI
+(/v1/chat/completions с потоком и без, /v1/models). Время до первого токена,
+скорость генерации, доля ошибок и число одновременных генераций задаются
+параметрами; ошибки выбираются генератором с фиксированным seed.
+Только стандартная библиотека.
+
+Использование:
+    python scripts/fake_llm_server.py --port 11435 --ttft-ms 300 --tokens-per-sec 15
+    OLLAMA_BASE_URL=http://localhost:11435 python main.py
+
+    # Ошибки 503 в 10% ответов, не больше 2 генераций одновременно, очередь до 8
+    python scripts/fake_llm_server.py --error-rate 0.1 --parallel 2 --max-queue 8
+
+Счетчики запросов: GET /stats
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional
+
+# Грубая оценка числа токенов, как CHARS_PER_TOKEN в config.py
+CHARS_PER_TOKEN = 3
+
+
+class FakeLLM:
+    """Generation model of the fake server: timings, errors and parallel slots"""
+
+    def __init__(self, models: List[str], ttft_ms: float = 200, tokens_per_sec: float = 20,
+                 prompt_tokens_per_sec: float = 0, max_tokens: int = 64, error_rate: float = 0,
+                 error_status: int = 503, parallel: int = 1, max_queue: int = 64, seed: int = 0):
+        """
+        Initialize fake model
+
+        Args:
+            models: Model names reported by /api/tags (other names get 404)
+            ttft_ms: Time to first token, without prompt processing
+            tokens_per_sec: Generation speed
+            prompt_tokens_per_sec: Prompt processing speed added to the first token time (0 - free)
+            max_tokens: Answer length when the request does not limit it
+            error_rate: Share of requests failed with error_status
+            error_status: HTTP status of injected errors (429 also sends Retry-After)
+            parallel: Generations served at once (like OLLAMA_NUM_PARALLEL)
+            max_queue: Requests waiting for a slot before 503 (like OLLAMA_MAX_QUEUE)
+            seed: Seed of error injection
+        """
+        self.models = models
+        self.ttft_ms = ttft_ms
+        self.tokens_per_sec = tokens_per_sec
+        self.prompt_tokens_per_sec = prompt_tokens_per_sec
+        self.max_tokens = max_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.parallel = parallel
+        self.max_queue = max_queue
+        self._random = random.Random(seed)
+        self._slots = threading.Semaphore(parallel)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "rejected": 0, "queued": 0, "active": 0, "max_active": 0,
+                      "prompt_tokens": 0, "generated_tokens": 0}
+
+    def has_model(self, model: Optional[str]) -> bool:
+        return not self.models or model in self.models or f"{model}:latest" in self.models
+
+    def admit(self) -> Optional[int]:
+        """
+        Register a request and decide whether it fails
+
+        Returns:
+            HTTP status of an injected error or of a full queue, None to serve the request
+        """
+        with self._lock:
+            self.stats["requests"] += 1
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return self.error_status
+            if self.stats["queued"] >= self.max_queue:
+                self.stats["rejected"] += 1
+                return 503
+            self.stats["queued"] += 1
+        return None
+
+    def acquire(self) -> None:
+        """Wait for a generation slot (the request must be admitted)"""
+        self._slots.acquire()
+        with self._lock:
+            self.stats["queued"] -= 1
+            self.stats["active"] += 1
+            self.stats["max_active"] = max(self.stats["max_active"], self.stats["active"])
+
+    def release(self) -> None:
+        with self._lock:
+            self.stats["active"] -= 1
+        self._slots.release()
+
+    def tokens(self, prompt: str, limit: Optional[int]) -> List[str]:
+        """Get answer tokens: words of the prompt repeated up to the length limit"""
+        count = min(limit, self.max_tokens) if limit and limit > 0 else self.max_tokens
+        words = prompt.split()[-32:] or ["ответ"]
+        return [("" if i == 0 else " ") + words[i % len(words)] for i in range(count)]
+
+    def generate(self, prompt: str, limit: Optional[int]) -> Iterator[str]:
+        """Yield answer tokens at the configured pace (call between acquire and release)"""
+        prompt_tokens = len(prompt) // CHARS_PER_TOKEN + 1
+        tokens = self.tokens(prompt, limit)
+        with self._lock:
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["generated_tokens"] += len(tokens)
+
+        first_ms = self.ttft_ms
+        if self.prompt_tokens_per_sec:
+            first_ms += prompt_tokens / self.prompt_tokens_per_sec * 1000
+        start = time.monotonic()
+        time.sleep(first_ms / 1000)
+        for i, token in enumerate(tokens):
+            # Токены отдаются по расписанию от начала, чтобы задержки записи не накапливались
+            delay = start + first_ms / 1000 + i / self.tokens_per_sec - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            yield token
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    """HTTP handler speaking the Ollama and OpenAI APIs"""
+
+    protocol_version = "HTTP/1.1"
+    llm: FakeLLM = None
+    quiet = True
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, data: Dict, headers: Optional[Dict] = None) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_chunked(self, content_type: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_chunked(self) -> None:
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _send_error(self, status: int) -> None:
+        headers = {"Retry-After": "1"} if status == 429 else None
+        self._send_json(status, {"error": {"message": f"injected error {status}"}}, headers)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": name, "model": name} for name in self.llm.models]})
+        elif self.path == "/v1/models":
+            self._send_json(200, {"object": "list", "data": [{"id": name, "object": "model"} for name in self.llm.models]})
+        elif self.path == "/api/version":
+            self._send_json(200, {"version": "0.0.0-fake"})
+        elif self.path == "/stats":
+            self._send_json(200, dict(self.llm.stats))
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "invalid JSON"})
+            return
+
+        if self.path == "/api/generate":
+            self._ollama_generate(request)
+        elif self.path == "/v1/chat/completions":
+            self._openai_chat(request)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def _serve(self, request: Dict, model: str, respond) -> None:
+        """Check the model, inject errors and run respond() in a generation slot"""
+        if not self.llm.has_model(model):
+            self._send_json(404, {"error": f"model '{model}' not found"})
+            return
+        status = self.llm.admit()
+        if status:
+            self._send_error(status)
+            return
+        self.llm.acquire()
+        try:
+            respond()
+        finally:
+            self.llm.release()
+
+    def _ollama_generate(self, request: Dict) -> None:
+        model = request.get("model")
+        prompt = request.get("prompt")
+        if prompt is None:
+            # Загрузка или выгрузка модели (keep_alive) без генерации
+            self._send_json(200, {"model": model, "response": "", "done": True, "done_reason": "load"})
+            return
+        limit = (request.get("options") or {}).get("num_predict")
+
+        def respond():
+            start = time.monotonic()
+            first = None
+            answer = []
+            stream = request.get("stream", True)
+            if stream:
+                self._start_chunked("application/x-ndjson")
+            for token in self.llm.generate(prompt, limit):
+                first = first or time.monotonic()
+                answer.append(token)
+                if stream:
+                    self._write_chunk((json.dumps({"model": model, "response": token, "done": False},
+                                                  ensure_ascii=False) + "\n").encode())
+            end = time.monotonic()
+            first = first or end
+            prompt_tokens = len(prompt) // CHARS_PER_TOKEN + 1
+            final = {
+                "model": model,
+                "response": "" if stream else "".join(answer),
+                "done": True,
+                "done_reason": "length" if limit and len(answer) >= limit else "stop",
+                "context": list(range(prompt_tokens + len(answer))),
+                "total_duration": int((end - start) * 1e9),
+                "load_duration": 0,
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int((first - start) * 1e9),
+                "eval_count": len(answer),
+                "eval_duration": int((end - first) * 1e9)
+            }
+            if stream:
+                self._write_chunk((json.dumps(final) + "\n").encode())
+                self._end_chunked()
+            else:
+                self._send_json(200, final)
+
+        self._serve(request, model, respond)
+
+    def _openai_chat(self, request: Dict) -> None:
+        model = request.get("model")
+        prompt = "\n".join(
+            message["content"] if isinstance(message.get("content"), str)
+            else "".join(part.get("text", "") for part in message.get("content") or [])
+            for message in request.get("messages", [])
+        )
+        limit = request.get("max_tokens") or request.get("max_completion_tokens")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        def respond():
+            answer = []
+            if request.get("stream"):
+                self._start_chunked("text/event-stream")
+                for token in self.llm.generate(prompt, limit):
+                    answer.append(token)
+                    chunk = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                             "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+                    self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+                final = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                         "choices": [{"index": 0, "delta": {}, "finish_reason": self._finish(answer, limit)}],
+                         "usage": self._usage(prompt, answer)}
+                self._write_chunk(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+                self._end_chunked()
+                return
+            answer = list(self.llm.generate(prompt, limit))
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(answer)},
+                             "finish_reason": self._finish(answer, limit)}],
+                "usage": self._usage(prompt, answer)
+            })
+
+        self._serve(request, model, respond)
+
+    @staticmethod
+    def _finish(answer: List[str], limit: Optional[int]) -> str:
+        return "length" if limit and len(answer) >= limit else "stop"
+
+    @staticmethod
+    def _usage(prompt: str, answer: List[str]) -> Dict:
+        prompt_tokens = len(prompt) // CHARS_PER_TOKEN + 1
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": len(answer),
+                "total_tokens": prompt_tokens + len(answer)}
+
+
+def start_server(llm: FakeLLM, host: str = "127.0.0.1", port: int = 0, quiet: bool = True) -> ThreadingHTTPServer:
+    """Start the fake server in a background thread (port 0 - any free port)"""
+    handler = type("Handler", (FakeLLMHandler,), {"llm": llm, "quiet": quiet})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_arguments(arg_parser: argparse.ArgumentParser) -> None:
+    """Add fake model options to a parser"""
+    arg_parser.add_argument("--models", nargs="+", default=["llama3.2:3b"], help="models reported by /api/tags")
+    arg_parser.add_argument("--ttft-ms", type=float, default=200, help="time to first token")
+    arg_parser.add_argument("--tokens-per-sec", type=float, default=20, help="generation speed")
+    arg_parser.add_argument("--prompt-tokens-per-sec", type=float, default=0,
+                            help="prompt processing speed added to the first token time (0 - free)")
+    arg_parser.add_argument("--max-tokens", type=int, default=64, help="answer length if the request does not limit it")
+    arg_parser.add_argument("--error-rate", type=float, default=0, help="share of requests failed with --error-status")
+    arg_parser.add_argument("--error-status", type=int, default=503)
+    arg_parser.add_argument("--parallel", type=int, default=1, help="generations served at once")
+    arg_parser.add_argument("--max-queue", type=int, default=64, help="waiting requests before 503")
+    arg_parser.add_argument("--seed", type=int, default=0, help="seed of error injection")
+
+
+def llm_from_args(args: argparse.Namespace) -> FakeLLM:
+    return FakeLLM(
+        models=args.models,
+        ttft_ms=args.ttft_ms,
+        tokens_per_sec=args.tokens_per_sec,
+        prompt_tokens_per_sec=args.prompt_tokens_per_sec,
+        max_tokens=args.max_tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        parallel=args.parallel,
+        max_queue=args.max_queue,
+        seed=args.seed
+    )
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=11435)
+    arg_parser.add_argument("--verbose", action="store_true", help="log every request")
+    add_arguments(arg_parser)
+    args = arg_parser.parse_args()
+
+    server = start_server(llm_from_args(args), args.host, args.port, quiet=not args.verbose)
+    print(f"Fake LLM server on http://{args.host}:{server.server_address[1]} "
+          f"(ttft {args.ttft_ms} ms, {args.tokens_per_sec} tok/s, parallel {args.parallel}, "
+          f"errors {args.error_rate:.0%})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Подбор параметров HNSW: задержка и recall для каждой комбинации на собственных данных
+
+Индексы строятся той же библиотекой hnswlib, что использует Chroma.
+Эталон - точный поиск по float32.
+
+Использование:
+    python scripts/hnsw_sweep.py
+    python scripts/hnsw_sweep.py --metric cosine --m 8 16 32 --ef-construction 100 200 --ef-search 10 50 100
+"""
+import argparse
+import itertools
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import config  # noqa: E402
+from src.quantization import exact_distances  # noqa: E402
+
+
+def load_vectors(synthetic: int) -> np.ndarray:
+    """Load embeddings from the vector store or generate clustered synthetic ones"""
+    if synthetic:
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(max(synthetic // 100, 10), 384))
+        labels = rng.integers(0, len(centers), synthetic)
+        return (centers[labels] + 0.4 * rng.normal(size=(synthetic, 384))).astype(np.float32)
+
+    from src.vector_store import VectorStore
+    store = VectorStore()
+    matrices = [store.get_shard_embeddings(shard)[1] for shard in store.collections]
+    matrices = [matrix for matrix in matrices if len(matrix)]
+    return np.concatenate(matrices) if matrices else np.empty((0, 0), dtype=np.float32)
+
+
+def main():
+    import hnswlib
+
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--synthetic", type=int, default=0, help="use N synthetic vectors instead of the vector store")
+    arg_parser.add_argument("--queries", type=int, default=200)
+    arg_parser.add_argument("--top-k", type=int, default=config.TOP_K_RESULTS)
+    arg_parser.add_argument("--metric", default=config.VECTOR_METRIC, choices=["l2", "ip", "cosine"])
+    arg_parser.add_argument("--m", type=int, nargs="+", default=[8, 16, 32])
+    arg_parser.add_argument("--ef-construction", type=int, nargs="+", default=[100, 200])
+    arg_parser.add_argument("--ef-search", type=int, nargs="+", default=[10, 25, 50, 100])
+    args = arg_parser.parse_args()
+
+    vectors = load_vectors(args.synthetic)
+    if len(vectors) < args.top_k + args.queries:
+        print(f"Not enough vectors: {len(vectors)}")
+        return 1
+
+    rng = np.random.default_rng(1)
+    query_rows = rng.choice(len(vectors), args.queries, replace=False)
+    queries = vectors[query_rows] + 0.05 * rng.normal(size=(args.queries, vectors.shape[1])).astype(np.float32)
+    truth = [set(np.argsort(exact_distances(q, vectors, args.metric))[:args.top_k]) for q in queries]
+
+    print(f"Vectors: {len(vectors)} x {vectors.shape[1]}, metric: {args.metric}, top_k: {args.top_k}")
+    print(f"{'M':>4} {'ef_c':>6} {'ef':>5} {'build s':>8} {'p50 ms':>8} {'p95 ms':>8} {'recall@k':>9}")
+
+    for m, ef_construction in itertools.product(args.m, args.ef_construction):
+        index = hnswlib.Index(space=args.metric, dim=vectors.shape[1])
+        start = time.perf_counter()
+        index.init_index(max_elements=len(vectors), ef_construction=ef_construction, M=m)
+        index.add_items(vectors, np.arange(len(vectors)))
+        build_s = time.perf_counter() - start
+
+        for ef in args.ef_search:
+            index.set_ef(max(ef, args.top_k))
+            latencies = []
+            recall = 0.0
+            for q, expected in zip(queries, truth):
+                start = time.perf_counter()
+                labels, _ = index.knn_query(q, k=args.top_k)
+                latencies.append((time.perf_counter() - start) * 1000)
+                recall += len(expected & set(labels[0].tolist())) / args.top_k
+            p50, p95 = np.percentile(latencies, [50, 95])
+            print(f"{m:>4} {ef_construction:>6} {ef:>5} {build_s:>8.2f} {p50:>8.3f} {p95:>8.3f} {recall / len(queries):>9.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Экспорт и импорт базы знаний с готовыми эмбеддингами
+
+Индексация выполняется на быстрой машине, на Raspberry Pi бандл
+загружается напрямую в векторную БД без модели эмбеддингов.
+
+Использование:
+    python scripts/kb_bundle.py export data/exports/kb.ragkb [--quantize]
+    python scripts/kb_bundle.py import data/exports/kb.ragkb [--replace] [--force]
+    python scripts/kb_bundle.py info data/exports/kb.ragkb
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.kb_bundle import export_bundle, import_bundle, read_manifest  # noqa: E402
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = arg_parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="write bundle")
+    export_parser.add_argument("path", type=Path)
+    export_parser.add_argument("--quantize", action="store_true", help="store 8-bit embeddings (4x smaller)")
+
+    import_parser = subparsers.add_parser("import", help="load bundle into the vector store")
+    import_parser.add_argument("path", type=Path)
+    import_parser.add_argument("--replace", action="store_true", help="clear the vector store first")
+    import_parser.add_argument("--force", action="store_true", help="ignore embedding model mismatch")
+
+    info_parser = subparsers.add_parser("info", help="show bundle manifest")
+    info_parser.add_argument("path", type=Path)
+
+    args = arg_parser.parse_args()
+
+    if args.command == "info":
+        print(json.dumps(read_manifest(args.path), ensure_ascii=False, indent=2))
+        return 0
+
+    from src.vector_store import VectorStore
+    store = VectorStore()
+    if args.command == "export":
+        manifest = export_bundle(store, args.path, quantize=args.quantize)
+        print(f"{manifest['count']} chunks, {args.path.stat().st_size / 1024 / 1024:.1f} MB")
+    else:
+        result = import_bundle(store, args.path, replace=args.replace, force=args.force)
+        print(f"{result['imported_chunks']} chunks imported, {result['skipped_chunks']} already present")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест полного конвейера запроса (поиск, сборка контекста, генерация)
+
+Запросы идут напрямую в RAGEngine по базе знаний из .env с заданной
+параллельностью. С --fake генерацию обслуживает встроенный имитатор LLM
+(scripts/fake_llm_server.py), поэтому цифры воспроизводимы и не требуют
+Ollama или платного API.
+
+Использование:
+    python scripts/load_test.py --fake --ttft-ms 300 --tokens-per-sec 15 --parallel 2
+    python scripts/load_test.py --fake --stream --concurrency 8 --requests 200
+    python scripts/load_test.py --ollama-url http://localhost:11434 --questions questions.txt
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import config  # noqa: E402
+from fake_llm_server import add_arguments, llm_from_args, start_server  # noqa: E402
+
+DEFAULT_QUESTIONS = [
+    "Как настроить доступ к системе?",
+    "Какие документы нужны для оформления?",
+    "Кто отвечает за согласование?",
+    "Какие сроки выполнения работ?",
+    "Как подать заявку?",
+]
+
+
+def percentile(values: List[float], share: float) -> float:
+    """Get percentile of values (nearest rank)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(share * len(ordered)), len(ordered) - 1)]
+
+
+async def run_query(engine, question: str, stream: bool, deadline_ms: int) -> Dict:
+    """Run one query, returns its latency, first token time and outcome"""
+    start = time.perf_counter()
+    if not stream:
+        result = await engine.aquery(question, deadline_ms=deadline_ms)
+        return {
+            "total_ms": (time.perf_counter() - start) * 1000,
+            "first_token_ms": None,
+            "retrieval_ms": result.get("timings", {}).get("retrieval_ms"),
+            "tokens": result.get("timings", {}).get("generated_tokens", 0),
+            # Без найденных документов генерация не запускается, это не ошибка модели
+            "error": bool(result.get("sources_count")) and not result.get("backend") and not result.get("fallback"),
+            "fallback": bool(result.get("fallback")),
+            "sources": result.get("sources_count", 0)
+        }
+
+    first_token_ms = None
+    outcome = {"error": True, "retrieval_ms": None, "tokens": 0, "sources": 0}
+    async for event in engine.astream_query(question):
+        if event["type"] == "sources":
+            outcome["sources"] = event["sources_count"]
+        elif event["type"] == "delta" and first_token_ms is None:
+            first_token_ms = (time.perf_counter() - start) * 1000
+        elif event["type"] == "done":
+            timings = event.get("timings", {})
+            outcome.update(error=bool(outcome["sources"]) and not event.get("backend"),
+                           retrieval_ms=timings.get("retrieval_ms"), tokens=timings.get("generated_tokens", 0))
+    return {"total_ms": (time.perf_counter() - start) * 1000, "first_token_ms": first_token_ms,
+            "fallback": False, **outcome}
+
+
+async def load(engine, questions: List[str], requests: int, concurrency: int, stream: bool,
+               deadline_ms: int) -> List[Dict]:
+    """Run requests with a fixed number of concurrent clients"""
+    results = []
+    counter = iter(range(requests))
+
+    async def client():
+        for i in counter:
+            results.append(await run_query(engine, questions[i % len(questions)], stream, deadline_ms))
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return results
+
+
+def report(results: List[Dict], wall_s: float) -> None:
+    print(f"\nRequests: {len(results)} in {wall_s:.1f} s, {len(results) / wall_s:.2f} req/s")
+    errors = sum(1 for result in results if result["error"])
+    fallbacks = sum(1 for result in results if result["fallback"])
+    no_sources = sum(1 for result in results if not result["sources"])
+    print(f"Errors: {errors}, extractive fallbacks: {fallbacks}, without sources: {no_sources}")
+    tokens = sum(result["tokens"] or 0 for result in results)
+    print(f"Generated tokens: {tokens} ({tokens / wall_s:.1f} tok/s)")
+
+    print(f"\n{'':<14} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    series = {
+        "total": [result["total_ms"] for result in results],
+        "first token": [result["first_token_ms"] for result in results if result["first_token_ms"] is not None],
+        "retrieval": [result["retrieval_ms"] for result in results if result["retrieval_ms"] is not None],
+    }
+    for name, values in series.items():
+        if values:
+            print(f"{name:<14} {percentile(values, 0.5):>9.1f} {percentile(values, 0.95):>9.1f} "
+                  f"{percentile(values, 0.99):>9.1f} {max(values):>9.1f}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--requests", type=int, default=50)
+    arg_parser.add_argument("--concurrency", type=int, default=4, help="concurrent clients")
+    arg_parser.add_argument("--stream", action="store_true", help="stream answers and measure first token time")
+    arg_parser.add_argument("--deadline-ms", type=int, default=0, help="per-request deadline (0 - QUERY_DEADLINE_MS)")
+    arg_parser.add_argument("--questions", type=Path, help="file with one question per line")
+    arg_parser.add_argument("--warmup", type=int, default=2, help="requests run before measuring")
+    arg_parser.add_argument("--ollama-url", help="Ollama URL(s), comma separated (default from .env)")
+    arg_parser.add_argument("--fake", action="store_true", help="serve generation by the built-in fake LLM server")
+    add_arguments(arg_parser)
+    arg_parser.set_defaults(models=[config.OLLAMA_MODEL])
+    args = arg_parser.parse_args()
+
+    fake = None
+    if args.fake:
+        fake = llm_from_args(args)
+        server = start_server(fake)
+        args.ollama_url = f"http://127.0.0.1:{server.server_address[1]}"
+        print(f"Fake LLM: ttft {args.ttft_ms} ms, {args.tokens_per_sec} tok/s, parallel {args.parallel}, "
+              f"errors {args.error_rate:.0%}")
+    if args.ollama_url:
+        # До создания пула Ollama
+        config.OLLAMA_BASE_URLS = [url.strip() for url in args.ollama_url.split(",") if url.strip()]
+        config.OLLAMA_BASE_URL = config.OLLAMA_BASE_URLS[0]
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        questions = [line.strip() for line in args.questions.read_text(encoding="utf-8").splitlines() if line.strip()]
+
+    from src.llm_router import get_llm_router
+    from src.ollama_client import close_ollama_pool
+    from src.rag_engine import RAGEngine
+
+    engine = RAGEngine()
+
+    async def run():
+        try:
+            if args.warmup:
+                await load(engine, questions, args.warmup, 1, args.stream, args.deadline_ms)
+            start = time.perf_counter()
+            results = await load(engine, questions, args.requests, args.concurrency, args.stream, args.deadline_ms)
+            return results, time.perf_counter() - start
+        finally:
+            await close_ollama_pool()
+
+    print(f"Requests: {args.requests}, concurrency: {args.concurrency}, stream: {args.stream}")
+    results, wall_s = asyncio.run(run())
+    report(results, wall_s)
+
+    print("\nBackends:")
+    for backend in get_llm_router().stats():
+        print(f"  {backend['name']}: {backend['calls']} calls, latency {backend['latency_ms']} ms, "
+              f"errors {backend['error_rate']:.0%}, circuit {backend['circuit']}")
+    if fake:
+        print(f"Fake LLM stats: {fake.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Перестроение коллекций с параметрами HNSW из конфигурации
+
+Копирует чанки вместе с эмбеддингами в новую коллекцию с текущими
+VECTOR_METRIC, HNSW_M, HNSW_EF_CONSTRUCTION и HNSW_EF_SEARCH.
+Повторная генерация эмбеддингов не нужна.
+
+Использование:
+    python scripts/rebuild_index.py              # только устаревшие шарды
+    python scripts/rebuild_index.py --all
+    python scripts/rebuild_index.py --shard web
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.vector_store import VectorStore  # noqa: E402
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--shard", action="append", help="shard to rebuild (can be repeated)")
+    arg_parser.add_argument("--all", action="store_true", help="rebuild every shard")
+    args = arg_parser.parse_args()
+
+    store = VectorStore()
+    if args.shard:
+        shards = args.shard
+    elif args.all:
+        shards = list(store.collections)
+    else:
+        shards = store.outdated_shards()
+
+    if not shards:
+        print("All shards already use the configured HNSW parameters")
+        return 0
+
+    print(f"Target parameters: {store.collection_metadata()}")
+    for shard in shards:
+        store.rebuild_shard(shard)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -29,6 +29,7 @@ echo ""
 echo "Создание архива проекта..."
 tar -czf /tmp/${PROJECT_NAME}.tar.gz \
     --exclude='data/chroma_db/*' \
+    --exclude='data/exports/*' \
     --exclude='data/documents/*' \
     --exclude='logs/*' \
     --exclude='__pycache__' \
@@ -1,10 +1,467 @@
 """Connector for external API models (OpenAI, Anthropic, etc.)"""
-import requests
-from typing import Dict, Optional
+import asyncio
+import importlib.util
+import json
 import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+import httpx
+import config
 
 logger = logging.getLogger(__name__)
 
+# Коды ответа, после которых запрос имеет смысл повторить (529 - перегрузка Anthropic)
+RETRY_STATUSES = {429, 500, 502, 503, 504, 529}
+# Ошибки до получения ответа: повтор безопасен. ReadTimeout не повторяем - генерация могла идти
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, httpx.ReadError,
+                httpx.RemoteProtocolError)
+
+
+def _client_options() -> Dict:
+    """Get options shared by sync and async API clients"""
+    return {
+        "timeout": httpx.Timeout(config.API_READ_TIMEOUT, connect=config.API_CONNECT_TIMEOUT),
+        "limits": httpx.Limits(
+            max_connections=config.API_POOL_SIZE,
+            max_keepalive_connections=config.API_POOL_SIZE,
+            keepalive_expiry=config.API_POOL_IDLE_TIMEOUT
+        ),
+        # HTTP/2 мультиплексирует запросы в одном TLS-соединении, если установлен пакет h2
+        "http2": importlib.util.find_spec("h2") is not None
+    }
+
+
+# Общие клиенты: соединения с провайдером переиспользуются между запросами и коннекторами
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.Client:
+    """Get shared pooled client for sync calls"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.Client(**_client_options())
+    return _http_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Get shared pooled client for async calls"""
+    global _async_http_client
+    if _async_http_client is None or _async_http_client.is_closed:
+        _async_http_client = httpx.AsyncClient(**_client_options())
+    return _async_http_client
+
+
+async def close_api_clients() -> None:
+    """Close shared API clients"""
+    global _http_client, _async_http_client
+    if _async_http_client is not None:
+        await _async_http_client.aclose()
+        _async_http_client = None
+    if _http_client is not None:
+        _http_client.close()
+        _http_client = None
+
+
+def sse_events(lines: Iterable[str]) -> Iterator[Tuple[str, str]]:
+    """Parse Server-Sent Events into (event, data) pairs"""
+    event, data = "message", []
+    for line in lines:
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].lstrip())
+    if data:
+        yield event, "\n".join(data)
+
+
+async def asse_events(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[str, str]]:
+    """Parse Server-Sent Events from an async line stream (see sse_events)"""
+    event, data = "message", []
+    async for line in lines:
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].lstrip())
+    if data:
+        yield event, "\n".join(data)
+
+
+def empty_usage() -> Dict:
+    return {"prompt_tokens": None, "completion_tokens": None, "cache_read_tokens": None, "cache_write_tokens": None}
+
+
+def openai_usage(usage: Dict) -> Dict:
+    """Normalize OpenAI usage (cached prompt tokens are part of prompt_tokens)"""
+    return {
+        "prompt_tokens": usage.get('prompt_tokens'),
+        "completion_tokens": usage.get('completion_tokens'),
+        "cache_read_tokens": (usage.get('prompt_tokens_details') or {}).get('cached_tokens'),
+        "cache_write_tokens": None
+    }
+
+
+def anthropic_usage(usage: Dict) -> Dict:
+    """Normalize Anthropic usage (input_tokens excludes cache reads and writes)"""
+    cache_read = usage.get('cache_read_input_tokens')
+    cache_write = usage.get('cache_creation_input_tokens')
+    prompt_tokens = usage.get('input_tokens')
+    if prompt_tokens is not None:
+        prompt_tokens += (cache_read or 0) + (cache_write or 0)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": usage.get('output_tokens'),
+        "cache_read_tokens": cache_read,
+        "cache_write_tokens": cache_write
+    }
+
+
+def gemini_usage(usage: Dict) -> Dict:
+    """Normalize Gemini usage metadata"""
+    return {
+        "prompt_tokens": usage.get('promptTokenCount'),
+        "completion_tokens": usage.get('candidatesTokenCount'),
+        "cache_read_tokens": usage.get('cachedContentTokenCount'),
+        "cache_write_tokens": None
+    }
+
+
+def total_tokens(usage: Dict) -> Optional[int]:
+    """Get prompt plus completion tokens (None if not reported)"""
+    total = (usage.get("prompt_tokens") or 0) + (usage.get("completion_tokens") or 0)
+    return total or None
+
+
+class StreamDecoder:
+    """Turn provider stream events into text deltas and final usage/finish reason"""
+    
+    def __init__(self, api_type: str):
+        self.api_type = api_type
+        self.finish_reason: Optional[str] = None
+        self.usage = empty_usage()
+    
+    def feed(self, event: str, payload: str) -> List[Dict]:
+        """Decode one SSE event, returns delta events"""
+        if payload == "[DONE]":
+            return []
+        chunk = json.loads(payload)
+        if self.api_type == 'anthropic':
+            texts = self._anthropic(event, chunk)
+        elif self.api_type == 'gemini':
+            texts = self._gemini(chunk)
+        else:
+            texts = self._openai(chunk)
+        return [{"type": "delta", "text": text} for text in texts if text]
+    
+    def finish(self) -> Dict:
+        """Get final event"""
+        return {"type": "done", "finish_reason": self.finish_reason, "usage": self.usage}
+    
+    def _openai(self, chunk: Dict) -> List[str]:
+        if chunk.get('usage'):
+            self.usage = openai_usage(chunk['usage'])
+        texts = []
+        for choice in chunk.get('choices') or []:
+            texts.append((choice.get('delta') or {}).get('content'))
+            self.finish_reason = choice.get('finish_reason') or self.finish_reason
+        return texts
+    
+    def _anthropic(self, event: str, chunk: Dict) -> List[str]:
+        event = chunk.get('type', event)
+        if event == 'error':
+            raise ValueError(f"Ошибка потока Anthropic: {chunk.get('error', {}).get('message', chunk)}")
+        if event == 'message_start':
+            self.usage = anthropic_usage(chunk.get('message', {}).get('usage', {}))
+        elif event == 'content_block_delta' and chunk.get('delta', {}).get('type') == 'text_delta':
+            return [chunk['delta'].get('text')]
+        elif event == 'message_delta':
+            self.finish_reason = chunk.get('delta', {}).get('stop_reason') or self.finish_reason
+            self.usage["completion_tokens"] = chunk.get('usage', {}).get('output_tokens')
+        return []
+    
+    def _gemini(self, chunk: Dict) -> List[str]:
+        if chunk.get('usageMetadata'):
+            self.usage = gemini_usage(chunk['usageMetadata'])
+        if not chunk.get('candidates'):
+            block_reason = chunk.get('promptFeedback', {}).get('blockReason')
+            if block_reason:
+                raise ValueError(f"Запрос заблокирован: {block_reason}")
+            return []
+        
+        candidate = chunk['candidates'][0]
+        self.finish_reason = candidate.get('finishReason') or self.finish_reason
+        if self.finish_reason == 'SAFETY':
+            raise ValueError("Ответ заблокирован фильтрами безопасности")
+        return [part.get('text') for part in candidate.get('content', {}).get('parts', [])]
+
+
+def retry_after(response: httpx.Response) -> Optional[float]:
+    """Get delay requested by the Retry-After header (seconds or HTTP date)"""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(attempt: int, response: Optional[httpx.Response] = None) -> Optional[float]:
+    """
+    Get delay before the next attempt
+    
+    Args:
+        attempt: Number of the failed attempt (0 - first)
+        response: Response with a retryable status (None for a connection error)
+    
+    Returns:
+        Seconds to wait or None if the request should not be retried
+    """
+    if attempt >= config.API_MAX_RETRIES:
+        return None
+    if response is not None:
+        requested = retry_after(response)
+        if requested is not None:
+            # Провайдер просит ждать дольше, чем готов ждать пользователь: сразу отдаем ошибку
+            return requested if requested <= config.API_RETRY_MAX_DELAY else None
+    # Экспоненциальная задержка с полным джиттером, чтобы клиенты не повторяли запросы одновременно
+    return random.uniform(0, min(config.API_RETRY_MAX_DELAY, config.API_RETRY_BASE_DELAY * 2 ** attempt))
+
+
+_DURATION = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+
+
+class TokenBucket:
+    """Per-minute budget refilled continuously (rate 0 - unlimited)"""
+    
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+    
+    def _refill(self, now: float) -> None:
+        if self.per_minute:
+            self.tokens = min(self.per_minute, self.tokens + (now - self.updated) * self.per_minute / 60)
+        self.updated = now
+    
+    def wait_time(self, amount: float, now: float) -> float:
+        """Get seconds until amount is available (a request larger than the bucket waits for a full one)"""
+        if not self.per_minute:
+            return 0.0
+        self._refill(now)
+        missing = min(amount, self.per_minute) - self.tokens
+        return max(missing * 60 / self.per_minute, 0.0)
+    
+    def take(self, amount: float) -> None:
+        if self.per_minute:
+            self.tokens -= min(amount, self.per_minute)
+    
+    def refund(self, amount: float) -> None:
+        if self.per_minute:
+            self.tokens = min(self.per_minute, self.tokens + amount)
+    
+    def set_limit(self, per_minute: float, remaining: Optional[float] = None) -> None:
+        """Adopt limits reported by the provider"""
+        now = time.monotonic()
+        self._refill(now)
+        if per_minute and per_minute != self.per_minute:
+            self.tokens = per_minute if not self.per_minute else min(self.tokens, per_minute)
+            self.per_minute = per_minute
+        if remaining is not None and self.per_minute:
+            self.tokens = min(self.tokens, remaining)
+
+
+class SchedulerTimeout(RuntimeError):
+    """Request waited in the provider queue longer than API_QUEUE_TIMEOUT"""
+
+
+class ProviderScheduler:
+    """
+    Admission control for one API provider
+    
+    Requests are admitted strictly in arrival order when a concurrency slot,
+    a request from the RPM bucket and the estimated tokens from the TPM bucket
+    are available. Limits are updated from rate-limit response headers, and a
+    429 pauses the whole queue for the requested time instead of letting every
+    queued request fail in turn.
+    """
+    
+    # Шаг ожидания, когда время освобождения слота неизвестно
+    POLL_INTERVAL = 0.05
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.max_concurrency = config.API_MAX_CONCURRENCY
+        self.requests = TokenBucket(config.API_RPM)
+        self.tokens = TokenBucket(config.API_TPM)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._queue: deque = deque()
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+    
+    def _grant(self, ticket: Dict) -> Optional[float]:
+        """Admit ticket if it is its turn and limits allow, returns None or seconds to wait"""
+        with self._lock:
+            now = time.monotonic()
+            if self._queue[0] is not ticket:
+                return self.POLL_INTERVAL
+            if now < self.paused_until:
+                return self.paused_until - now
+            if self.in_flight >= self.max_concurrency:
+                return self.POLL_INTERVAL
+            wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(ticket["cost"], now))
+            if wait > 0:
+                return wait
+            self._queue.popleft()
+            self.requests.take(1)
+            self.tokens.take(ticket["cost"])
+            self.in_flight += 1
+            return None
+    
+    def _enqueue(self, cost: int) -> Dict:
+        ticket = {"cost": cost, "deadline": time.monotonic() + config.API_QUEUE_TIMEOUT}
+        with self._lock:
+            self._queue.append(ticket)
+        return ticket
+    
+    def _abandon(self, ticket: Dict) -> None:
+        with self._lock:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+            self._released.notify_all()
+    
+    def _check_timeout(self, ticket: Dict) -> None:
+        if time.monotonic() > ticket["deadline"]:
+            raise SchedulerTimeout(f"Превышено время ожидания очереди к API {self.name}")
+    
+    def acquire(self, cost: int) -> Dict:
+        """Wait for admission (blocking)"""
+        ticket = self._enqueue(cost)
+        try:
+            while True:
+                wait = self._grant(ticket)
+                if wait is None:
+                    return ticket
+                self._check_timeout(ticket)
+                with self._released:
+                    self._released.wait(timeout=min(wait, ticket["deadline"] - time.monotonic(), 1.0))
+        except BaseException:
+            self._abandon(ticket)
+            raise
+    
+    async def aacquire(self, cost: int) -> Dict:
+        """Wait for admission without blocking the event loop"""
+        ticket = self._enqueue(cost)
+        try:
+            while True:
+                wait = self._grant(ticket)
+                if wait is None:
+                    return ticket
+                self._check_timeout(ticket)
+                await asyncio.sleep(min(wait, self.POLL_INTERVAL))
+        except BaseException:
+            self._abandon(ticket)
+            raise
+    
+    def release(self, ticket: Dict, used_tokens: Optional[int] = None) -> None:
+        """Free the concurrency slot, correcting the token estimate with actual usage"""
+        with self._lock:
+            self.in_flight -= 1
+            if used_tokens is not None:
+                self.tokens.refund(ticket["cost"] - used_tokens)
+            self._released.notify_all()
+    
+    def observe(self, response: httpx.Response) -> None:
+        """Adapt limits to rate-limit headers and pause on 429"""
+        headers = response.headers
+        with self._lock:
+            for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+                # OpenAI: x-ratelimit-limit-requests, Anthropic: anthropic-ratelimit-requests-limit
+                limit = headers.get(f"x-ratelimit-limit-{kind}") or headers.get(f"anthropic-ratelimit-{kind}-limit")
+                remaining = (headers.get(f"x-ratelimit-remaining-{kind}")
+                             or headers.get(f"anthropic-ratelimit-{kind}-remaining"))
+                try:
+                    bucket.set_limit(float(limit) if limit else 0, float(remaining) if remaining else None)
+                except ValueError:
+                    pass
+            
+            if response.status_code == 429:
+                pause = retry_after(response)
+                if pause is None:
+                    pause = _reset_seconds(headers)
+                self.paused_until = max(self.paused_until, time.monotonic() + min(pause, config.API_RETRY_MAX_DELAY))
+                logger.warning(f"{self.name} rate limited, queue paused for {min(pause, config.API_RETRY_MAX_DELAY):.1f}s")
+    
+    def stats(self) -> Dict:
+        """Get queue state"""
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "name": self.name,
+                "in_flight": self.in_flight,
+                "queued": len(self._queue),
+                "max_concurrency": self.max_concurrency,
+                "rpm": self.requests.per_minute,
+                "tpm": self.tokens.per_minute,
+                "tokens_available": round(self.tokens.tokens) if self.tokens.per_minute else None,
+                "paused_for": round(max(self.paused_until - now, 0.0), 2)
+            }
+
+
+def _reset_seconds(headers: httpx.Headers) -> float:
+    """Get time until the request limit resets (OpenAI durations like 6m0s or Anthropic RFC 3339 time)"""
+    value = headers.get("x-ratelimit-reset-requests")
+    if value:
+        units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        return sum(float(number) * units[unit] for number, unit in _DURATION.findall(value))
+    value = headers.get("anthropic-ratelimit-requests-reset")
+    if value:
+        try:
+            return max(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() - time.time(), 0.0)
+        except ValueError:
+            pass
+    return config.API_RETRY_BASE_DELAY
+
+
+# Один планировщик на провайдера (тип API и адрес): лимиты общие для всех коннекторов
+_schedulers: Dict[Tuple[str, str], ProviderScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(api_type: str, api_url: str) -> ProviderScheduler:
+    """Get shared scheduler of a provider"""
+    with _schedulers_lock:
+        key = (api_type, api_url)
+        if key not in _schedulers:
+            _schedulers[key] = ProviderScheduler(f"{api_type}:{api_url}")
+        return _schedulers[key]
+
+
+def scheduler_stats() -> List[Dict]:
+    """Get state of all provider schedulers"""
+    with _schedulers_lock:
+        schedulers = list(_schedulers.values())
+    return [scheduler.stats() for scheduler in schedulers]
+
 
 class APIModelConnector:
     """Connector for external LLM APIs"""
@@ -34,6 +491,28 @@ class APIModelConnector:
             self.api_url = 'https://generativelanguage.googleapis.com/v1beta'
         else:
             self.api_url = api_url or 'http://localhost:8000/v1'
+        
+        self.scheduler = get_scheduler(api_type, self.api_url)
+    
+    @staticmethod
+    def generation_defaults(api_type: str) -> Tuple[float, int]:
+        """Get temperature and max tokens that work well for an API type"""
+        # Оптимальные параметры для API моделей (не ограничиваем пользовательскими настройками)
+        api_temperature = 0.7  # Оптимально для большинства API
+        api_max_tokens = 2000  # Достаточно для полного ответа
+        
+        # Специфичные настройки для разных API
+        api_type = (api_type or '').lower()
+        if api_type == 'gemini':
+            # Gemini 2.5 нужно больше токенов из-за thinking
+            api_max_tokens = 2000
+        elif api_type == 'openai':
+            # OpenAI хорошо работает с меньшими значениями
+            api_max_tokens = 1000
+        elif api_type == 'anthropic':
+            # Claude хорошо работает с умеренными значениями
+            api_max_tokens = 1500
+        return api_temperature, api_max_tokens
     
     def generate(self, prompt: str, temperature: float = 0.7, max_tokens: int = 256) -> str:
         """
@@ -50,17 +529,207 @@ class APIModelConnector:
         Raises:
             Exception: If API call fails
         """
+        return self.complete(prompt, temperature, max_tokens)["text"]
+    
+    async def agenerate(self, prompt: str, temperature: float = 0.7, max_tokens: int = 256) -> str:
+        """Generate response without blocking the event loop (see generate)"""
+        return (await self.acomplete(prompt, temperature, max_tokens))["text"]
+    
+    def complete(self, prompt: str, temperature: float = 0.7, max_tokens: int = 256) -> Dict:
+        """
+        Generate response with token usage (see generate)
+        
+        Returns:
+            Dict with text and usage (prompt, completion, cache read and cache write tokens)
+        """
+        url, headers, data = self.build_request(prompt, temperature, max_tokens)
+        response, ticket = self._send(url, headers, data, self._cost(prompt, max_tokens))
+        used_tokens = None
+        try:
+            result = response.json()
+            usage = self.parse_usage(result)
+            used_tokens = total_tokens(usage)
+            return {"text": self.parse_response(result), "usage": usage}
+        finally:
+            self.scheduler.release(ticket, used_tokens)
+    
+    async def acomplete(self, prompt: str, temperature: float = 0.7, max_tokens: int = 256) -> Dict:
+        """Generate response with token usage without blocking the event loop (see complete)"""
+        url, headers, data = self.build_request(prompt, temperature, max_tokens)
+        response, ticket = await self._asend(url, headers, data, self._cost(prompt, max_tokens))
+        used_tokens = None
+        try:
+            result = response.json()
+            usage = self.parse_usage(result)
+            used_tokens = total_tokens(usage)
+            return {"text": self.parse_response(result), "usage": usage}
+        finally:
+            self.scheduler.release(ticket, used_tokens)
+    
+    def generate_stream(self, prompt: str, temperature: float = 0.7, max_tokens: int = 256) -> Iterator[Dict]:
+        """
+        Generate response as a stream of events
+        
+        Yields:
+            {"type": "delta", "text": ...} for each text fragment, then
+            {"type": "done", "finish_reason": ..., "usage": {"prompt_tokens": ..., "completion_tokens": ...,
+            "cache_read_tokens": ..., "cache_write_tokens": ...}}
+        
+        Raises:
+            Exception: If API call fails (retries happen only before the first event)
+        """
+        url, headers, data = self.build_stream_request(prompt, temperature, max_tokens)
+        decoder = StreamDecoder(self.api_type)
+        response, ticket = self._send(url, headers, data, self._cost(prompt, max_tokens), stream=True)
+        try:
+            for event, payload in sse_events(response.iter_lines()):
+                yield from decoder.feed(event, payload)
+        finally:
+            response.close()
+            self.scheduler.release(ticket, total_tokens(decoder.usage))
+        yield decoder.finish()
+    
+    async def agenerate_stream(self, prompt: str, temperature: float = 0.7,
+                               max_tokens: int = 256) -> AsyncIterator[Dict]:
+        """Generate response as a stream of events without blocking the event loop (see generate_stream)"""
+        url, headers, data = self.build_stream_request(prompt, temperature, max_tokens)
+        decoder = StreamDecoder(self.api_type)
+        response, ticket = await self._asend(url, headers, data, self._cost(prompt, max_tokens), stream=True)
+        try:
+            async for event, payload in asse_events(response.aiter_lines()):
+                for item in decoder.feed(event, payload):
+                    yield item
+        finally:
+            await response.aclose()
+            self.scheduler.release(ticket, total_tokens(decoder.usage))
+        yield decoder.finish()
+    
+    @staticmethod
+    def _cost(prompt: str, max_tokens: int) -> int:
+        """Estimate tokens a request takes from the per-minute budget"""
+        return len(prompt) // config.CHARS_PER_TOKEN + max_tokens
+    
+    def _send(self, url: str, headers: Dict, data: Dict, cost: int,
+              stream: bool = False) -> Tuple[httpx.Response, Dict]:
+        """
+        POST through the provider scheduler with retries
+        
+        Returns:
+            Successful response (body not read yet when streaming) and the
+            scheduler ticket, which the caller releases when done
+        """
+        client = get_http_client()
+        for attempt in range(config.API_MAX_RETRIES + 1):
+            ticket = self.scheduler.acquire(cost)
+            try:
+                response = client.send(client.build_request("POST", url, headers=headers, json=data), stream=stream)
+            except BaseException as e:
+                self.scheduler.release(ticket, 0)
+                delay = self._retry_delay(attempt, error=e) if isinstance(e, RETRY_ERRORS) else None
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            
+            self.scheduler.observe(response)
+            delay = self._retry_delay(attempt, response=response)
+            if delay is None and not response.is_error:
+                return response, ticket
+            self.scheduler.release(ticket, 0)
+            if delay is None:
+                response.read()
+                response.close()
+                response.raise_for_status()
+            response.close()
+            # После 429 ждет вся очередь провайдера, а не только этот запрос
+            if response.status_code != 429:
+                time.sleep(delay)
+    
+    async def _asend(self, url: str, headers: Dict, data: Dict, cost: int,
+                     stream: bool = False) -> Tuple[httpx.Response, Dict]:
+        """Async POST through the provider scheduler with retries (see _send)"""
+        client = get_async_http_client()
+        for attempt in range(config.API_MAX_RETRIES + 1):
+            ticket = await self.scheduler.aacquire(cost)
+            try:
+                response = await client.send(
+                    client.build_request("POST", url, headers=headers, json=data), stream=stream
+                )
+            except BaseException as e:
+                self.scheduler.release(ticket, 0)
+                delay = self._retry_delay(attempt, error=e) if isinstance(e, RETRY_ERRORS) else None
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            
+            self.scheduler.observe(response)
+            delay = self._retry_delay(attempt, response=response)
+            if delay is None and not response.is_error:
+                return response, ticket
+            self.scheduler.release(ticket, 0)
+            if delay is None:
+                await response.aread()
+                await response.aclose()
+                response.raise_for_status()
+            await response.aclose()
+            if response.status_code != 429:
+                await asyncio.sleep(delay)
+    
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response] = None,
+                     error: Optional[Exception] = None) -> Optional[float]:
+        """Get delay before retrying a failed call, None to stop (successful responses are not retried)"""
+        if response is not None and response.status_code not in RETRY_STATUSES:
+            return None
+        delay = retry_delay(attempt, response)
+        if delay is not None:
+            reason = f"status {response.status_code}" if response is not None else type(error).__name__
+            logger.warning(f"{self.api_type} API call failed ({reason}), retry {attempt + 1} in {delay:.2f}s")
+        return delay
+    
+    def build_request(self, prompt: str, temperature: float, max_tokens: int) -> Tuple[str, Dict, Dict]:
+        """Get URL, headers and body of a generation request"""
         if self.api_type == 'openai':
-            return self._generate_openai(prompt, temperature, max_tokens)
+            return self._openai_request(prompt, temperature, max_tokens)
         elif self.api_type == 'anthropic':
-            return self._generate_anthropic(prompt, temperature, max_tokens)
+            return self._anthropic_request(prompt, temperature, max_tokens)
         elif self.api_type == 'gemini':
-            return self._generate_gemini(prompt, temperature, max_tokens)
+            return self._gemini_request(prompt, temperature, max_tokens)
         else:
-            return self._generate_custom(prompt, temperature, max_tokens)
+            return self._custom_request(prompt, temperature, max_tokens)
     
-    def _generate_openai(self, prompt: str, temperature: float, max_tokens: int) -> str:
-        """Generate using OpenAI API"""
+    def build_stream_request(self, prompt: str, temperature: float, max_tokens: int) -> Tuple[str, Dict, Dict]:
+        """Get URL, headers and body of a streaming generation request"""
+        url, headers, data = self.build_request(prompt, temperature, max_tokens)
+        if self.api_type == 'gemini':
+            # Потоковый метод Gemini отдает SSE при alt=sse
+            return url.replace(':generateContent?', ':streamGenerateContent?alt=sse&'), headers, data
+        data = {**data, 'stream': True}
+        if self.api_type == 'openai':
+            # Расход токенов приходит последним событием (совместимые серверы поддерживают это не всегда)
+            data['stream_options'] = {'include_usage': True}
+        return url, headers, data
+    
+    def parse_usage(self, result: Dict) -> Dict:
+        """Get token usage from a response body (or a usage part of a stream)"""
+        if self.api_type == 'anthropic':
+            return anthropic_usage(result.get('usage') or {})
+        elif self.api_type == 'gemini':
+            return gemini_usage(result.get('usageMetadata') or {})
+        else:
+            return openai_usage(result.get('usage') or {})
+    
+    def parse_response(self, result: Dict) -> str:
+        """Get generated text from a response body"""
+        if self.api_type == 'anthropic':
+            return result['content'][0]['text']
+        elif self.api_type == 'gemini':
+            return self._parse_gemini(result)
+        else:
+            return result['choices'][0]['message']['content']
+    
+    def _openai_request(self, prompt: str, temperature: float, max_tokens: int) -> Tuple[str, Dict, Dict]:
+        """Build OpenAI API request"""
         headers = {
             'Authorization': f'Bearer {self.api_key}',
             'Content-Type': 'application/json'
@@ -72,20 +741,10 @@ class APIModelConnector:
             'temperature': temperature,
             'max_tokens': max_tokens
         }
-        
-        response = requests.post(
-            f"{self.api_url}/chat/completions",
-            headers=headers,
-            json=data,
-            timeout=60
-        )
-        response.raise_for_status()
-        
-        result = response.json()
-        return result['choices'][0]['message']['content']
+        return f"{self.api_url}/chat/completions", headers, data
     
-    def _generate_anthropic(self, prompt: str, temperature: float, max_tokens: int) -> str:
-        """Generate using Anthropic API"""
+    def _anthropic_request(self, prompt: str, temperature: float, max_tokens: int) -> Tuple[str, Dict, Dict]:
+        """Build Anthropic API request"""
         headers = {
             'x-api-key': self.api_key,
             'anthropic-version': '2023-06-01',
@@ -98,20 +757,10 @@ class APIModelConnector:
             'temperature': temperature,
             'max_tokens': max_tokens
         }
-        
-        response = requests.post(
-            f"{self.api_url}/messages",
-            headers=headers,
-            json=data,
-            timeout=60
-        )
-        response.raise_for_status()
-        
-        result = response.json()
-        return result['content'][0]['text']
+        return f"{self.api_url}/messages", headers, data
     
-    def _generate_gemini(self, prompt: str, temperature: float, max_tokens: int) -> str:
-        """Generate using Google Gemini API"""
+    def _gemini_request(self, prompt: str, temperature: float, max_tokens: int) -> Tuple[str, Dict, Dict]:
+        """Build Google Gemini API request"""
         # Gemini использует API key в URL
         # Добавляем префикс models/ если его нет
         model_name = self.model_name
@@ -141,17 +790,10 @@ class APIModelConnector:
         # Логируем запрос
         logger.debug(f"Gemini request - Model: {model_name}, Prompt length: {len(prompt)}, Temperature: {temperature}, MaxTokens: {max_tokens}")
         logger.debug(f"Gemini prompt preview: {prompt[:200]}...")
-        
-        response = requests.post(
-            url,
-            headers=headers,
-            json=data,
-            timeout=60
-        )
-        response.raise_for_status()
-        
-        result = response.json()
-        
+        return url, headers, data
+    
+    def _parse_gemini(self, result: Dict) -> str:
+        """Get text from Google Gemini response"""
         # Логируем ответ для отладки
         logger.debug(f"Gemini response: {result}")
         
@@ -201,8 +843,8 @@ class APIModelConnector:
         
         return first_part['text']
     
-    def _generate_custom(self, prompt: str, temperature: float, max_tokens: int) -> str:
-        """Generate using custom API (OpenAI-compatible)"""
+    def _custom_request(self, prompt: str, temperature: float, max_tokens: int) -> Tuple[str, Dict, Dict]:
+        """Build custom API request (OpenAI-compatible)"""
         headers = {
             'Authorization': f'Bearer {self.api_key}',
             'Content-Type': 'application/json'
@@ -214,17 +856,7 @@ class APIModelConnector:
             'temperature': temperature,
             'max_tokens': max_tokens
         }
-        
-        response = requests.post(
-            f"{self.api_url}/chat/completions",
-            headers=headers,
-            json=data,
-            timeout=60
-        )
-        response.raise_for_status()
-        
-        result = response.json()
-        return result['choices'][0]['message']['content']
+        return f"{self.api_url}/chat/completions", headers, data
     
     def test_connection(self) -> bool:
         """Test API connection"""
@@ -235,3 +867,12 @@ class APIModelConnector:
         except Exception as e:
             logger.error(f"API connection test failed: {e}")
             return False
+    
+    async def atest_connection(self) -> bool:
+        """Test API connection without blocking the event loop (see test_connection)"""
+        try:
+            result = await self.agenerate("Hello", temperature=0.1, max_tokens=10)
+            return bool(result)
+        except Exception as e:
+            logger.error(f"API connection test failed: {e}")
+            return False
@@ -0,0 +1,247 @@
+"""Token-budget-aware packing of retrieved chunks into the prompt context"""
+import re
+from typing import Callable, Dict, List, Optional, Set
+
+import config
+
+CONTEXT_SEPARATOR = "\n\n"
+
+# Граница предложения для обрезки единственного не помещающегося чанка
+_SENTENCE_END = re.compile(r'[.!?…]\s|\n')
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?…])\s+|\n+')
+_WORD = re.compile(r'\w+')
+
+# Размер шингла (в словах) для поиска почти одинаковых чанков
+SHINGLE_SIZE = 5
+# Совпадения короче считаются случайными и не склеиваются
+MIN_OVERLAP_CHARS = 20
+
+
+def overlap_length(left: str, right: str, max_overlap: int) -> int:
+    """Get length of the longest suffix of left that is a prefix of right"""
+    for size in range(min(len(left), len(right), max_overlap), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def stitch(left: str, right: str, max_overlap: int) -> str:
+    """Join two adjacent chunks without repeating their overlap"""
+    size = overlap_length(left, right, max_overlap)
+    if size:
+        return left + right[size:]
+    return f"{left} {right}"
+
+
+def shingles(text: str) -> Set[tuple]:
+    """Get word shingles of a text"""
+    words = text.lower().split()
+    if len(words) <= SHINGLE_SIZE:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def jaccard(a: Set, b: Set) -> float:
+    """Jaccard similarity of two sets"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _stems(text: str) -> Set[str]:
+    """Get crude word stems (first 5 letters) so that inflected forms match"""
+    return {word[:5] for word in _WORD.findall(text.lower()) if len(word) > 2}
+
+
+def extract_sentences(question: str, chunks: List[str], max_sentences: int) -> List[str]:
+    """
+    Pick sentences of the chunks sharing most words with the question
+    
+    Ties go to more relevant chunks; picked sentences keep their order in the chunks.
+    """
+    question_stems = _stems(question)
+    candidates = []
+    for rank, chunk in enumerate(chunks):
+        for position, sentence in enumerate(_SENTENCE_SPLIT.split(chunk)):
+            sentence = sentence.strip()
+            if len(sentence) >= MIN_OVERLAP_CHARS:
+                candidates.append((-len(question_stems & _stems(sentence)), rank, position, sentence))
+    if not candidates:
+        return [chunk.strip() for chunk in chunks[:1] if chunk.strip()]
+    best = sorted(candidates)[:max_sentences]
+    return [sentence for _, _, _, sentence in sorted(best, key=lambda candidate: candidate[1:3])]
+
+
+def source_key(metadata: Optional[Dict]) -> Optional[str]:
+    """Get key identifying the document a chunk belongs to"""
+    if not metadata:
+        return None
+    return metadata.get('file_hash') or metadata.get('source')
+
+
+class ContextBuilder:
+    """Pack whole chunks in relevance order into a token budget"""
+    
+    def __init__(self, count_tokens: Callable[[str], int]):
+        """
+        Initialize context builder
+        
+        Args:
+            count_tokens: Function returning number of tokens in a text
+        """
+        self.count_tokens = count_tokens
+        # Перекрытие чанков не превышает CHUNK_OVERLAP с точностью до одного предложения
+        overlap = config.CHUNK_OVERLAP
+        if config.CHUNK_TOKENS:
+            # Перекрытие задано в токенах: переводим в символы с запасом
+            overlap = config.CHUNK_TOKEN_OVERLAP * config.CHARS_PER_TOKEN * 2
+        self.max_overlap = overlap * 2
+    
+    def budget(self, prompt_overhead: str, num_ctx: int, num_predict: int) -> int:
+        """
+        Get number of context tokens that fit into the model window
+        
+        Args:
+            prompt_overhead: Prompt with empty context (template and question)
+            num_ctx: Model context window
+            num_predict: Tokens reserved for the answer
+        """
+        # Токенизатор эмбеддингов не совпадает с токенизатором LLM, поэтому оставляем запас
+        window = int(num_ctx / config.CONTEXT_TOKEN_SAFETY)
+        return max(window - self.count_tokens(prompt_overhead) - num_predict, 0)
+    
+    def pack(self, chunks: List[str], budget: int, metadatas: Optional[List[Dict]] = None) -> Dict:
+        """
+        Select chunks that fit into the budget
+        
+        Chunks are taken in relevance order; a chunk that does not fit is
+        skipped so that a smaller, less relevant one can still use the room.
+        With metadatas, neighbouring chunks of the same document are stitched
+        without their overlap (and only pay for the new text), and chunks that
+        nearly repeat an already packed one are dropped.
+        
+        Returns:
+            Dict with context text, block texts, chunk indices of each block and token usage
+        """
+        metadatas = metadatas or [None] * len(chunks)
+        dedup = config.CONTEXT_DEDUP
+        separator_tokens = self.count_tokens(CONTEXT_SEPARATOR)
+        positions = {}
+        if dedup:
+            for i, metadata in enumerate(metadatas):
+                key = source_key(metadata)
+                if key is not None and isinstance(metadata.get('chunk'), int):
+                    positions[(key, metadata['chunk'])] = i
+        
+        selected = []
+        selected_shingles = []
+        used = 0
+        duplicates = 0
+        duplicate_tokens = 0
+        for i, chunk in enumerate(chunks):
+            tokens = self.count_tokens(chunk)
+            chunk_shingles = shingles(chunk) if dedup else None
+            if dedup and any(jaccard(chunk_shingles, other) >= config.DEDUP_SIMILARITY for other in selected_shingles):
+                duplicates += 1
+                duplicate_tokens += tokens
+                continue
+            
+            # Соседний уже выбранный чанк того же документа: платим только за новый текст
+            cost = tokens + (separator_tokens if selected else 0)
+            for neighbour in self._neighbours(i, metadatas, positions):
+                if neighbour in selected:
+                    left, right = sorted((neighbour, i), key=lambda j: metadatas[j]['chunk'])
+                    size = overlap_length(chunks[left], chunks[right], self.max_overlap)
+                    cost -= separator_tokens + (self.count_tokens(chunks[right][:size]) if size else 0)
+            
+            if used + cost <= budget:
+                selected.append(i)
+                if dedup:
+                    selected_shingles.append(chunk_shingles)
+                used += cost
+        
+        if not selected:
+            if not chunks or budget <= 0:
+                return {"text": "", "texts": [], "blocks": [], "tokens": 0, "budget": budget,
+                        "saved_tokens": 0, "duplicates": 0}
+            # Ни один чанк не помещается целиком: берем начало самого релевантного по границе предложения
+            text = self.truncate(chunks[0], budget)
+            return {
+                "text": text,
+                "texts": [text],
+                "blocks": [[0]],
+                "tokens": self.count_tokens(text),
+                "budget": budget,
+                "saved_tokens": 0,
+                "duplicates": 0
+            }
+        
+        blocks = self._blocks(selected, metadatas)
+        texts = [self._stitch_block(block, chunks) for block in blocks]
+        text = CONTEXT_SEPARATOR.join(texts)
+        tokens = self.count_tokens(text)
+        naive_tokens = sum(self.count_tokens(chunks[i]) for i in selected) + separator_tokens * (len(selected) - 1)
+        return {
+            "text": text,
+            "texts": texts,
+            "blocks": blocks,
+            "tokens": tokens,
+            "budget": budget,
+            # Экономия на склейке перекрытий и на отброшенных дубликатах
+            "saved_tokens": max(naive_tokens - tokens, 0) + duplicate_tokens,
+            "duplicates": duplicates
+        }
+    
+    @staticmethod
+    def _neighbours(i: int, metadatas: List[Optional[Dict]], positions: Dict) -> List[int]:
+        """Get indices of retrieved chunks adjacent to chunk i in its document"""
+        key = source_key(metadatas[i])
+        if key is None or (key, metadatas[i].get('chunk')) not in positions:
+            return []
+        number = metadatas[i]['chunk']
+        return [positions[(key, n)] for n in (number - 1, number + 1) if (key, n) in positions]
+    
+    @staticmethod
+    def _blocks(selected: List[int], metadatas: List[Optional[Dict]]) -> List[List[int]]:
+        """Group selected chunks into runs of adjacent chunks, ordered by best relevance"""
+        rank = {i: r for r, i in enumerate(selected)}
+        blocks = []
+        documents: Dict[str, List[int]] = {}
+        for i in selected:
+            key = source_key(metadatas[i])
+            if config.CONTEXT_DEDUP and key is not None and isinstance(metadatas[i].get('chunk'), int):
+                documents.setdefault(key, []).append(i)
+            else:
+                blocks.append([i])
+        
+        for members in documents.values():
+            members.sort(key=lambda j: metadatas[j]['chunk'])
+            block = [members[0]]
+            for i in members[1:]:
+                if metadatas[i]['chunk'] == metadatas[block[-1]]['chunk'] + 1:
+                    block.append(i)
+                else:
+                    blocks.append(block)
+                    block = [i]
+            blocks.append(block)
+        
+        blocks.sort(key=lambda block: min(rank[i] for i in block))
+        return blocks
+    
+    def _stitch_block(self, block: List[int], chunks: List[str]) -> str:
+        """Join a run of adjacent chunks into one text"""
+        text = chunks[block[0]]
+        for i in block[1:]:
+            text = stitch(text, chunks[i], self.max_overlap)
+        return text
+    
+    def truncate(self, text: str, budget: int) -> str:
+        """Cut text to the budget at a sentence boundary"""
+        tokens = self.count_tokens(text)
+        while tokens > budget and text:
+            # Оценка длины по среднему числу символов на токен
+            limit = int(len(text) * budget / tokens * 0.95)
+            boundaries = [m.end() for m in _SENTENCE_END.finditer(text, 0, limit)]
+            text = text[:boundaries[-1]].rstrip() if boundaries else text[:limit].rstrip()
+            tokens = self.count_tokens(text)
+        return text
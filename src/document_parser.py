@@ -1,38 +1,135 @@
 """Document parsing for PDF, DOC, and Excel files"""
+import datetime
+import itertools
+import re
+from collections import deque
 from pathlib import Path
-from typing import List
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 import PyPDF2
 import docx
 import openpyxl
 import pandas as pd
 
+# Граница предложения при разбиении на чанки
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+')
+
+NO_PDF_TEXT_ERROR = ("Error parsing PDF: PDF contains no extractable text. The file might be image-based "
+                     "(scanned document) or password-protected. Please use a text-based PDF or convert "
+                     "scanned documents using OCR.")
+
+
+def sentence_spans(text: str) -> Iterator[Tuple[int, int]]:
+    """Get (start, end) offsets of sentences in text"""
+    start = 0
+    for match in _SENTENCE_SPLIT.finditer(text):
+        if match.start() > start:
+            yield start, match.start()
+        start = match.end()
+    if start < len(text):
+        yield start, len(text)
+
+
+def _windows(units: Iterable[Tuple[Any, int]], chunk_size: int, overlap: int) -> Iterator[List]:
+    """
+    Group sized units into overlapping windows in one pass
+    
+    A window is emitted when the next unit would exceed chunk_size; the
+    next window starts with the longest tail of it that fits into overlap.
+    
+    Yields:
+        Units of each window
+    """
+    window = deque()
+    size = 0
+    for unit, unit_size in units:
+        if size + unit_size > chunk_size and window:
+            yield [item for item, _ in window]
+            while window and size > overlap:
+                size -= window.popleft()[1]
+        window.append((unit, unit_size))
+        size += unit_size
+    if window:
+        yield [item for item, _ in window]
+
+
+def chunk_spans(text: str, chunk_size: int = 500, overlap: int = 50,
+                count_tokens: Optional[Callable[[str], int]] = None) -> Iterator[Tuple[int, int]]:
+    """
+    Split text into overlapping chunks by sentences without copying it
+    
+    Args:
+        chunk_size: Chunk size in characters (or tokens with count_tokens)
+        overlap: Size of the text repeated at the start of the next chunk
+        count_tokens: Tokenizer to size chunks in tokens instead of characters
+    
+    Yields:
+        (start, end) offsets of chunks, chunk text is text[start:end]
+    """
+    if count_tokens is None:
+        units = ((span, span[1] - span[0]) for span in sentence_spans(text))
+    else:
+        units = ((span, count_tokens(text[span[0]:span[1]])) for span in sentence_spans(text))
+    for window in _windows(units, chunk_size, overlap):
+        yield window[0][0], window[-1][1]
+
 
 class DocumentParser:
     """Parse documents and extract text content"""
     
     @staticmethod
-    def parse_pdf(file_path: Path) -> str:
-        """Extract text from PDF file"""
-        text = []
+    def pdf_page_count(file_path: Path) -> int:
+        """Get number of pages in PDF file"""
+        try:
+            with open(file_path, 'rb') as file:
+                return len(PyPDF2.PdfReader(file).pages)
+        except Exception as e:
+            raise ValueError(f"Error parsing PDF: {str(e)}")
+    
+    @staticmethod
+    def read_pdf_pages(file_path: Path, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+        """
+        Extract text of PDF pages start..end-1 one page at a time
+        
+        Yields:
+            Page number (from 1) and page text, pages without text are skipped
+        """
         try:
             with open(file_path, 'rb') as file:
                 pdf_reader = PyPDF2.PdfReader(file)
-                for page_num, page in enumerate(pdf_reader.pages):
+                end = len(pdf_reader.pages) if end is None else min(end, len(pdf_reader.pages))
+                for page_num in range(start, end):
                     try:
-                        page_text = page.extract_text()
-                        if page_text:
-                            text.append(page_text)
+                        page_text = pdf_reader.pages[page_num].extract_text()
                     except Exception as e:
                         print(f"Warning: Could not extract text from page {page_num}: {e}")
                         continue
-            
-            result = "\n".join(text)
-            if not result.strip():
-                raise ValueError("PDF contains no extractable text. The file might be image-based (scanned document) or password-protected. Please use a text-based PDF or convert scanned documents using OCR.")
-            return result
+                    if page_text and page_text.strip():
+                        yield page_num + 1, page_text
         except Exception as e:
             raise ValueError(f"Error parsing PDF: {str(e)}")
     
+    @classmethod
+    def iter_pdf_pages(cls, file_path: Path) -> Iterator[Tuple[int, str]]:
+        """
+        Extract text from PDF file page by page
+        
+        Only the current page text is kept in memory.
+        
+        Yields:
+            Page number (from 1) and page text, pages without text are skipped
+        """
+        has_text = False
+        for page in cls.read_pdf_pages(file_path):
+            has_text = True
+            yield page
+        if not has_text:
+            raise ValueError(NO_PDF_TEXT_ERROR)
+    
+    @classmethod
+    def parse_pdf(cls, file_path: Path) -> str:
+        """Extract text from PDF file"""
+        return "\n".join(page_text for _, page_text in cls.iter_pdf_pages(file_path))
+    
     @staticmethod
     def parse_docx(file_path: Path) -> str:
         """Extract text from DOCX file"""
@@ -47,25 +144,84 @@ class DocumentParser:
         raise NotImplementedError("Legacy .doc format requires additional tools")
     
     @staticmethod
-    def parse_excel(file_path: Path) -> str:
-        """Extract text from Excel file (xlsx, xls)"""
+    def _cell_text(value) -> str:
+        """Format cell value compactly (no padding, whole numbers without .0, dates without zero time)"""
+        if value is None:
+            return ""
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        if isinstance(value, datetime.datetime):
+            return value.date().isoformat() if value.time() == datetime.time() else value.isoformat(sep=' ')
+        if isinstance(value, (datetime.date, datetime.time)):
+            return value.isoformat()
+        return " ".join(str(value).split())
+    
+    @classmethod
+    def _sheet_records(cls, rows: Iterable[Iterable]) -> Iterator[Tuple[int, str]]:
+        """
+        Convert sheet rows into "header: value" records
+        
+        The first non-empty row is the header; empty cells are left out.
+        
+        Yields:
+            Row number (from 1) and record text
+        """
+        header = None
+        for row_num, values in enumerate(rows, 1):
+            cells = [cls._cell_text(value) for value in values]
+            if not any(cells):
+                continue
+            if header is None:
+                header = [cell or f"Столбец {i + 1}" for i, cell in enumerate(cells)]
+                continue
+            fields = [
+                f"{header[i] if i < len(header) else f'Столбец {i + 1}'}: {cell}"
+                for i, cell in enumerate(cells) if cell
+            ]
+            yield row_num, "; ".join(fields)
+    
+    @classmethod
+    def iter_excel_rows(cls, file_path: Path) -> Iterator[Tuple[str, int, str]]:
+        """
+        Read Excel file row by row
+        
+        .xlsx is streamed by openpyxl in read-only mode, so only the current
+        row is in memory; legacy .xls is read with pandas.
+        
+        Yields:
+            Sheet name, row number and row record
+        """
         try:
-            # Читаем Excel файл
-            df = pd.read_excel(file_path, sheet_name=None)  # Читаем все листы
-            
-            text_parts = []
-            for sheet_name, sheet_df in df.items():
-                text_parts.append(f"=== Лист: {sheet_name} ===\n")
-                
-                # Конвертируем DataFrame в текст
-                # Включаем заголовки столбцов
-                text_parts.append(sheet_df.to_string(index=False))
-                text_parts.append("\n\n")
+            if file_path.suffix.lower() == '.xls':
+                for sheet_name, sheet_df in pd.read_excel(file_path, sheet_name=None, header=None, dtype=object).items():
+                    rows = (tuple(None if pd.isna(value) else value for value in row)
+                            for row in sheet_df.itertuples(index=False))
+                    for row_num, record in cls._sheet_records(rows):
+                        yield str(sheet_name), row_num, record
+                return
             
-            return "\n".join(text_parts)
+            workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+            try:
+                for sheet in workbook.worksheets:
+                    for row_num, record in cls._sheet_records(sheet.iter_rows(values_only=True)):
+                        yield sheet.title, row_num, record
+            finally:
+                workbook.close()
         except Exception as e:
             raise ValueError(f"Error parsing Excel file: {str(e)}")
     
+    @classmethod
+    def parse_excel(cls, file_path: Path) -> str:
+        """Extract text from Excel file (xlsx, xls)"""
+        text_parts = []
+        current_sheet = None
+        for sheet_name, _, record in cls.iter_excel_rows(file_path):
+            if sheet_name != current_sheet:
+                text_parts.append(f"=== Лист: {sheet_name} ===")
+                current_sheet = sheet_name
+            text_parts.append(record)
+        return "\n".join(text_parts)
+    
     def parse_document(self, file_path: Path) -> str:
         """Parse document based on file extension"""
         suffix = file_path.suffix.lower()
@@ -81,42 +237,95 @@ class DocumentParser:
         else:
             raise ValueError(f"Unsupported file format: {suffix}")
     
-    def chunk_text(self, text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
-        """Split text into overlapping chunks by sentences"""
-        import re
+    def iter_sections(self, file_path: Path) -> Iterator[Tuple[Dict, str]]:
+        """
+        Parse document as a stream of sections
         
-        # Разбиваем на предложения
-        sentences = re.split(r'(?<=[.!?])\s+', text)
+        Yields:
+            Section info and text: {"page": n} with page text for PDF,
+            {"sheet": name, "row": n} with row record for Excel,
+            {} with the whole text for other formats
+        """
+        suffix = file_path.suffix.lower()
+        if suffix == '.pdf':
+            for page, text in self.iter_pdf_pages(file_path):
+                yield {"page": page}, text
+        elif suffix in ['.xlsx', '.xls']:
+            for sheet_name, row_num, record in self.iter_excel_rows(file_path):
+                yield {"sheet": sheet_name, "row": row_num}, record
+        else:
+            yield {}, self.parse_document(file_path)
+    
+    def iter_chunks(self, file_path: Path, chunk_size: int = 500, overlap: int = 50,
+                    sections: Optional[Iterable[Tuple[Dict, str]]] = None,
+                    count_tokens: Optional[Callable[[str], int]] = None) -> Iterator[Tuple[str, Dict]]:
+        """
+        Parse and chunk document lazily
         
-        chunks = []
-        current_chunk = []
-        current_size = 0
+        Text sections are split into sentences; Excel rows are kept whole,
+        one per line, and a chunk never spans two sheets.
         
-        for sentence in sentences:
-            sentence_len = len(sentence)
-            
-            if current_size + sentence_len > chunk_size and current_chunk:
-                # Сохраняем текущий чанк
-                chunks.append(' '.join(current_chunk))
-                
-                # Начинаем новый чанк с overlap
-                overlap_sentences = []
-                overlap_size = 0
-                for s in reversed(current_chunk):
-                    if overlap_size + len(s) <= overlap:
-                        overlap_sentences.insert(0, s)
-                        overlap_size += len(s)
-                    else:
-                        break
-                
-                current_chunk = overlap_sentences
-                current_size = overlap_size
+        Args:
+            sections: Already parsed sections (see iter_sections), e.g. from the parse pool
+            count_tokens: Tokenizer to size chunks in tokens instead of characters
+        
+        Yields:
+            Chunk text and its metadata: pages (PDF) or sheet and rows (Excel)
+            it spans and length of the document text parsed so far
+        """
+        parsed = {"length": 0}
+        
+        def counted(group):
+            for info, text in group:
+                parsed["length"] += len(text)
+                yield info, text
+        
+        if sections is None:
+            sections = self.iter_sections(file_path)
+        for sheet, group in itertools.groupby(sections, key=lambda section: section[0].get("sheet")):
+            if sheet is None:
+                units = ((sentence, info) for info, text in counted(group) for sentence in _SENTENCE_SPLIT.split(text))
+                chunks = self._chunk_units(units, chunk_size, overlap, count_tokens=count_tokens)
+            else:
+                units = ((text, info) for info, text in counted(group))
+                chunks = self._chunk_units(units, chunk_size, overlap, separator='\n', count_tokens=count_tokens)
             
-            current_chunk.append(sentence)
-            current_size += sentence_len
+            for chunk, infos in chunks:
+                metadata = {"text_length": parsed["length"]}
+                pages = sorted({info["page"] for info in infos if "page" in info})
+                if pages:
+                    metadata["page"] = pages[0]
+                    metadata["page_end"] = pages[-1]
+                if sheet is not None:
+                    # Каждый чанк таблицы помнит свой лист
+                    chunk = f"Лист: {sheet}\n{chunk}"
+                    metadata["sheet"] = sheet
+                    metadata["row"] = infos[0]["row"]
+                    metadata["row_end"] = infos[-1]["row"]
+                yield chunk, metadata
+    
+    def chunk_text(self, text: str, chunk_size: int = 500, overlap: int = 50,
+                   count_tokens: Optional[Callable[[str], int]] = None) -> List[str]:
+        """Split text into overlapping chunks by sentences"""
+        return [text[start:end] for start, end in chunk_spans(text, chunk_size, overlap, count_tokens)
+                if text[start:end].strip()]
+    
+    @staticmethod
+    def _chunk_units(units: Iterable[Tuple[str, Dict]], chunk_size: int, overlap: int, separator: str = ' ',
+                     count_tokens: Optional[Callable[[str], int]] = None) -> Iterator[Tuple[str, List[Dict]]]:
+        """
+        Group sentences (or rows) of several sections into overlapping chunks
         
-        # Добавляем последний чанк
-        if current_chunk:
-            chunks.append(' '.join(current_chunk))
+        Args:
+            units: Sentences with info of the section they come from
+            separator: Joins units of a chunk
+            count_tokens: Tokenizer to size chunks in tokens instead of characters
         
-        return [c for c in chunks if c.strip()]
+        Yields:
+            Chunk text and section infos of its units
+        """
+        measure = count_tokens or len
+        for window in _windows((((unit, info), measure(unit)) for unit, info in units), chunk_size, overlap):
+            chunk = separator.join(unit for unit, _ in window)
+            if chunk.strip():
+                yield chunk, [info for _, info in window]
@@ -0,0 +1,160 @@
+"""Registry of uploaded documents and cache of their parsed text"""
+import gzip
+import hashlib
+import json
+import sqlite3
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Поля записи реестра в порядке столбцов таблицы
+RECORD_FIELDS = ("file_hash", "digest", "filename", "path", "content_hash", "signature",
+                 "chunks", "text_length", "uploaded_at")
+
+
+class DocumentRegistry:
+    """SQLite-backed registry of indexed files by content hash"""
+    
+    def __init__(self, db_path: Path):
+        """
+        Initialize document registry
+        
+        Args:
+            db_path: Path to SQLite database file
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS documents (
+                file_hash TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                path TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                signature TEXT NOT NULL,
+                chunks INTEGER NOT NULL,
+                text_length INTEGER NOT NULL,
+                uploaded_at TEXT NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_documents_content ON documents (content_hash, signature)"
+        )
+    
+    def get(self, file_hash: str) -> Optional[Dict]:
+        """Get record of a file by file_hash"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(RECORD_FIELDS)} FROM documents WHERE file_hash = ?", (file_hash,)
+            ).fetchone()
+        return dict(zip(RECORD_FIELDS, row)) if row else None
+    
+    def find_content(self, content_hash: str, signature: str) -> List[Dict]:
+        """Get records of files with the same parsed text indexed under the same settings"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(RECORD_FIELDS)} FROM documents WHERE content_hash = ? AND signature = ? "
+                "ORDER BY uploaded_at",
+                (content_hash, signature)
+            ).fetchall()
+        return [dict(zip(RECORD_FIELDS, row)) for row in rows]
+    
+    def put(self, record: Dict) -> None:
+        """Add or replace record of a file"""
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO documents ({', '.join(RECORD_FIELDS)}) "
+                f"VALUES ({', '.join('?' * len(RECORD_FIELDS))})",
+                [record[field] for field in RECORD_FIELDS]
+            )
+    
+    def remove(self, file_hashes: Iterable[str]) -> List[str]:
+        """Forget files, returns digests of the removed records"""
+        digests = []
+        with self._lock:
+            for file_hash in file_hashes:
+                row = self._conn.execute("SELECT digest FROM documents WHERE file_hash = ?", (file_hash,)).fetchone()
+                if row:
+                    digests.append(row[0])
+                    self._conn.execute("DELETE FROM documents WHERE file_hash = ?", (file_hash,))
+        return digests
+    
+    def clear(self) -> None:
+        """Remove all records"""
+        with self._lock:
+            self._conn.execute("DELETE FROM documents")
+
+
+class ParseCache:
+    """Parsed document sections stored on disk as gzipped JSON lines, keyed by file digest"""
+    
+    def __init__(self, directory: Path):
+        """
+        Initialize parse cache
+        
+        Args:
+            directory: Directory for cache files
+        """
+        self.directory = Path(directory)
+    
+    def _path(self, digest: str) -> Path:
+        return self.directory / f"{digest}.jsonl.gz"
+    
+    def has(self, digest: str) -> bool:
+        """Check whether parsed sections of a file are cached"""
+        return self._path(digest).exists()
+    
+    def store(self, digest: str, sections: Iterable[Tuple[Dict, str]]) -> str:
+        """
+        Write sections to the cache as they are parsed
+        
+        The entry appears only when the whole document is parsed, so a failed
+        parse never leaves a truncated entry behind.
+        
+        Returns:
+            Content hash of the sections (same as content_hash of the stored entry)
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        content_digest = hashlib.md5()
+        temp_path = self.directory / f".{digest}_{uuid.uuid4().hex}.part"
+        try:
+            # Быстрое сжатие: кэш пишется на каждой загрузке
+            with gzip.open(temp_path, "wb", compresslevel=1) as f:
+                for info, text in sections:
+                    line = json.dumps([info, text], ensure_ascii=False).encode() + b"\n"
+                    content_digest.update(line)
+                    f.write(line)
+            temp_path.replace(self._path(digest))
+        finally:
+            temp_path.unlink(missing_ok=True)
+        return content_digest.hexdigest()
+    
+    def sections(self, digest: str) -> Iterator[Tuple[Dict, str]]:
+        """Read cached sections one by one"""
+        with gzip.open(self._path(digest), "rb") as f:
+            for line in f:
+                info, text = json.loads(line)
+                yield info, text
+    
+    def content_hash(self, digest: str) -> str:
+        """Get content hash of a cached entry"""
+        content_digest = hashlib.md5()
+        with gzip.open(self._path(digest), "rb") as f:
+            for line in f:
+                content_digest.update(line)
+        return content_digest.hexdigest()
+    
+    def remove(self, digests: Iterable[str]) -> None:
+        """Remove cache entries"""
+        for digest in digests:
+            self._path(digest).unlink(missing_ok=True)
+    
+    def clear(self) -> None:
+        """Remove all cache entries"""
+        if self.directory.exists():
+            for path in self.directory.glob("*.jsonl.gz"):
+                path.unlink(missing_ok=True)
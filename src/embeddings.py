@@ -1,4 +1,5 @@
 """Embedding generation using sentence-transformers"""
+from functools import lru_cache
 from sentence_transformers import SentenceTransformer
 from typing import List
 import config
@@ -11,6 +12,9 @@ class EmbeddingGenerator:
         """Initialize embedding model"""
         print(f"Loading embedding model: {model_name}")
         self.model = SentenceTransformer(model_name)
+        self.tokenizer = getattr(self.model, 'tokenizer', None)
+        # Одни и те же чанки попадают в контекст многих вопросов
+        self.count_tokens = lru_cache(maxsize=config.TOKEN_CACHE_SIZE)(self.count_text_tokens)
     
     def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
         """Generate embeddings for list of texts"""
@@ -21,3 +25,9 @@ class EmbeddingGenerator:
         """Generate embedding for single text"""
         embedding = self.model.encode([text])[0]
         return embedding.tolist()
+    
+    def count_text_tokens(self, text: str) -> int:
+        """Count tokens with the model tokenizer (character estimate without it), not cached"""
+        if self.tokenizer is None:
+            return len(text) // config.CHARS_PER_TOKEN + 1
+        return len(self.tokenizer.encode(text, add_special_tokens=False, verbose=False))
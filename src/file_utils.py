@@ -1,8 +1,12 @@
 """File utilities for RAG agent"""
 import hashlib
+import uuid
 from pathlib import Path
 from typing import Tuple
 
+# Размер блока при потоковой записи загружаемого файла
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+
 
 def generate_safe_filename(original_filename: str, content: bytes) -> Tuple[str, str]:
     """
@@ -33,6 +37,48 @@ def save_file(file_path: Path, content: bytes) -> None:
         f.write(content)
 
 
+async def save_upload(upload, directory: Path, original_filename: str, max_size: int) -> Tuple[Path, str, int, str]:
+    """
+    Stream uploaded file to disk block by block, hashing it on the way
+    
+    Args:
+        upload: Uploaded file with async read(size) (e.g. FastAPI UploadFile)
+        directory: Directory to save the file to
+        original_filename: Original file name
+        max_size: Maximum file size in bytes
+    
+    Returns:
+        Tuple of (file_path, file_hash, size, digest); file name is the same as from
+        generate_safe_filename, digest is the full MD5 of the content
+    
+    Raises:
+        ValueError: File is larger than max_size
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.md5()
+    size = 0
+    temp_path = directory / f".upload_{uuid.uuid4().hex}.part"
+    try:
+        with open(temp_path, 'wb') as f:
+            while True:
+                block = await upload.read(UPLOAD_BLOCK_SIZE)
+                if not block:
+                    break
+                size += len(block)
+                if size > max_size:
+                    raise ValueError(f"File too large. Max size: {int(max_size / 1024 / 1024)}MB")
+                digest.update(block)
+                f.write(block)
+        
+        file_digest = digest.hexdigest()
+        file_hash = file_digest[:8]
+        file_path = directory / f"{file_hash}_{original_filename}"
+        temp_path.replace(file_path)
+        return file_path, file_hash, size, file_digest
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+
 def format_file_size(size_bytes: int) -> str:
     """
     Format file size in human-readable format
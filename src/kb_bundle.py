@@ -0,0 +1,236 @@
+"""Portable knowledge-base bundles with precomputed embeddings"""
+import json
+import tempfile
+import zipfile
+from contextlib import ExitStack
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List
+import numpy as np
+import config
+from src.quantization import ScalarQuantizer
+
+BUNDLE_FORMAT = "rag-agent-kb"
+BUNDLE_VERSION = 1
+
+# Колонки бандла: строковые колонки хранятся как uint64 смещения + UTF-8 данные
+STRING_COLUMNS = ("ids", "documents", "metadatas")
+
+
+class _StringColumnWriter:
+    """Write a string column as an offsets array and a concatenated UTF-8 blob"""
+
+    def __init__(self, directory: Path, name: str):
+        self.name = name
+        self.data_path = directory / f"{name}.data"
+        self.offsets_path = directory / f"{name}.offsets"
+        self._data = open(self.data_path, 'wb')
+        self._offsets = [0]
+
+    def extend(self, values: List[str]) -> None:
+        for value in values:
+            encoded = value.encode('utf-8')
+            self._data.write(encoded)
+            self._offsets.append(self._offsets[-1] + len(encoded))
+
+    def close(self) -> None:
+        self._data.close()
+        np.asarray(self._offsets, dtype='<u8').tofile(self.offsets_path)
+
+
+def _read_strings(f: BinaryIO, offsets: np.ndarray, start: int, stop: int) -> List[str]:
+    """Read rows [start, stop) of a string column from a sequential stream"""
+    blob = f.read(int(offsets[stop] - offsets[start]))
+    base = int(offsets[start])
+    return [
+        blob[int(offsets[i]) - base:int(offsets[i + 1]) - base].decode('utf-8')
+        for i in range(start, stop)
+    ]
+
+
+def export_bundle(vector_store, output_path: Path, quantize: bool = False) -> Dict:
+    """
+    Export every chunk with its metadata and embedding into a bundle
+
+    Args:
+        vector_store: VectorStore instance
+        output_path: Path of the bundle file to write
+        quantize: Store embeddings as 8-bit codes instead of float32
+
+    Returns:
+        Bundle manifest
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    batch_size = config.DELETE_BATCH_SIZE
+    shards = {shard: collection.count() for shard, collection in vector_store.collections.items()}
+
+    with tempfile.TemporaryDirectory(dir=output_path.parent) as tmp:
+        tmp_dir = Path(tmp)
+        writers = {name: _StringColumnWriter(tmp_dir, name) for name in STRING_COLUMNS}
+        embeddings_path = tmp_dir / "embeddings.f32"
+        count = 0
+        dim = 0
+
+        # Первый проход: строковые колонки и float32 эмбеддинги постранично
+        with open(embeddings_path, 'wb') as embeddings_file:
+            for shard, collection in vector_store.collections.items():
+                for offset in range(0, shards[shard], batch_size):
+                    batch = collection.get(
+                        include=["embeddings", "documents", "metadatas"],
+                        limit=batch_size,
+                        offset=offset
+                    )
+                    vectors = np.asarray(batch['embeddings'], dtype='<f4')
+                    if len(vectors):
+                        dim = vectors.shape[1]
+                    vectors.tofile(embeddings_file)
+                    writers["ids"].extend(batch['ids'])
+                    writers["documents"].extend([document or "" for document in batch['documents']])
+                    writers["metadatas"].extend([
+                        json.dumps(metadata or {}, ensure_ascii=False) for metadata in batch['metadatas']
+                    ])
+                    count += len(batch['ids'])
+
+        for writer in writers.values():
+            writer.close()
+
+        manifest = {
+            "format": BUNDLE_FORMAT,
+            "version": BUNDLE_VERSION,
+            "created_at": datetime.now().isoformat(),
+            "embedding_model": config.EMBEDDING_MODEL,
+            "metric": config.VECTOR_METRIC,
+            "count": count,
+            "dim": dim,
+            "embedding_dtype": "uint8" if quantize else "float32",
+            "source_shards": shards
+        }
+
+        with zipfile.ZipFile(output_path, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as bundle:
+            bundle.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2))
+            for writer in writers.values():
+                bundle.write(writer.offsets_path, f"{writer.name}.offsets")
+                bundle.write(writer.data_path, f"{writer.name}.data")
+
+            if not quantize:
+                bundle.write(embeddings_path, "embeddings.f32")
+            elif count:
+                # Второй проход: 8-битное квантование по диапазону каждого измерения
+                vectors = np.memmap(embeddings_path, dtype='<f4', mode='r').reshape(count, dim)
+                quantizer = ScalarQuantizer()
+                quantizer.fit(vectors)
+                bundle.writestr("embeddings.offset.f32", quantizer.offset.astype('<f4').tobytes())
+                bundle.writestr("embeddings.scale.f32", quantizer.scale.astype('<f4').tobytes())
+                with bundle.open("embeddings.u8", 'w') as f:
+                    for start in range(0, count, batch_size):
+                        f.write(quantizer.encode(vectors[start:start + batch_size]).tobytes())
+                del vectors
+
+    print(f"Exported {count} chunks to {output_path}")
+    return manifest
+
+
+def read_manifest(bundle_path: Path) -> Dict:
+    """Read and validate bundle manifest"""
+    with zipfile.ZipFile(bundle_path) as bundle:
+        manifest = json.loads(bundle.read("manifest.json"))
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise ValueError("Not a knowledge-base bundle")
+    if manifest.get("version", 0) > BUNDLE_VERSION:
+        raise ValueError(f"Unsupported bundle version: {manifest.get('version')}")
+    return manifest
+
+
+def iter_bundle(bundle_path: Path, batch_size: int) -> Iterator[Dict]:
+    """Read bundle in batches of ids, documents, metadatas and float32 embeddings"""
+    manifest = read_manifest(bundle_path)
+    count, dim = manifest["count"], manifest["dim"]
+    quantized = manifest["embedding_dtype"] == "uint8"
+
+    with zipfile.ZipFile(bundle_path) as bundle, ExitStack() as stack:
+        offsets = {
+            name: np.frombuffer(bundle.read(f"{name}.offsets"), dtype='<u8')
+            for name in STRING_COLUMNS
+        }
+        if not count:
+            return
+
+        quantizer = None
+        if quantized:
+            quantizer = ScalarQuantizer()
+            quantizer.offset = np.frombuffer(bundle.read("embeddings.offset.f32"), dtype='<f4')
+            quantizer.scale = np.frombuffer(bundle.read("embeddings.scale.f32"), dtype='<f4')
+
+        # Колонки читаются последовательно, по одному потоку на колонку
+        streams = {name: stack.enter_context(bundle.open(f"{name}.data")) for name in STRING_COLUMNS}
+        embeddings_file = stack.enter_context(bundle.open("embeddings.u8" if quantized else "embeddings.f32"))
+        row_size = dim if quantized else dim * 4
+
+        for start in range(0, count, batch_size):
+            stop = min(start + batch_size, count)
+            raw = embeddings_file.read((stop - start) * row_size)
+            if quantized:
+                vectors = quantizer.decode(np.frombuffer(raw, dtype=np.uint8).reshape(-1, dim))
+            else:
+                vectors = np.frombuffer(raw, dtype='<f4').reshape(-1, dim)
+            columns = {
+                name: _read_strings(streams[name], offsets[name], start, stop)
+                for name in STRING_COLUMNS
+            }
+            yield {
+                "ids": columns["ids"],
+                "documents": columns["documents"],
+                "metadatas": [json.loads(value) for value in columns["metadatas"]],
+                "embeddings": vectors.tolist()
+            }
+
+
+def import_bundle(vector_store, bundle_path: Path, replace: bool = False, force: bool = False) -> Dict:
+    """
+    Bulk-load a bundle into the vector store without the embedding model
+
+    Args:
+        vector_store: VectorStore instance
+        bundle_path: Path of the bundle file
+        replace: Clear the vector store before import (otherwise chunks whose IDs already exist are skipped)
+        force: Import even if the bundle was built with another embedding model
+
+    Returns:
+        Import summary
+    """
+    manifest = read_manifest(bundle_path)
+    if manifest["embedding_model"] != config.EMBEDDING_MODEL and not force:
+        raise ValueError(
+            f"Bundle embeddings were built with {manifest['embedding_model']}, "
+            f"but this server uses {config.EMBEDDING_MODEL}"
+        )
+
+    if replace:
+        vector_store.clear_collection()
+
+    imported = 0
+    skipped = 0
+    for batch in iter_bundle(bundle_path, config.DELETE_BATCH_SIZE):
+        # Повторный импорт того же бандла не должен дублировать записи сжатого индекса
+        existing = set() if replace else vector_store.existing_ids(batch["ids"])
+        keep = [i for i, chunk_id in enumerate(batch["ids"]) if chunk_id not in existing]
+        skipped += len(batch["ids"]) - len(keep)
+        if not keep:
+            continue
+        vector_store.add_documents(
+            [batch["documents"][i] for i in keep],
+            [batch["embeddings"][i] for i in keep],
+            [batch["metadatas"][i] for i in keep],
+            ids=[batch["ids"][i] for i in keep]
+        )
+        imported += len(keep)
+
+    print(f"Imported {imported} chunks from {bundle_path}, skipped {skipped} existing")
+    return {
+        "imported_chunks": imported,
+        "skipped_chunks": skipped,
+        "embedding_model": manifest["embedding_model"],
+        "embedding_dtype": manifest["embedding_dtype"],
+        "created_at": manifest["created_at"]
+    }
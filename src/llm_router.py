@@ -0,0 +1,403 @@
+"""Latency-aware routing of generations across LLM backends"""
+import asyncio
+import logging
+import statistics
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+import config
+from src.api_model_connector import APIModelConnector
+from src.ollama_client import get_ollama_pool
+
+logger = logging.getLogger(__name__)
+
+
+class NoBackendAvailable(Exception):
+    """All backends failed, are circuit-broken or the deadline expired"""
+
+
+class BackendStats:
+    """Rolling latency, error rate, in-flight count and circuit breaker of one backend"""
+    
+    def __init__(self, window: int = config.LLM_STATS_WINDOW):
+        self.latencies: deque = deque(maxlen=window)
+        self.outcomes: deque = deque(maxlen=window)
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.last_failure = 0.0
+        self.half_open_probe = False
+        self.prompt_tokens = 0
+        self.cache_read_tokens = 0
+    
+    def latency_ms(self) -> Optional[float]:
+        """Get median latency of recent successful calls"""
+        return statistics.median(self.latencies) if self.latencies else None
+    
+    def error_rate(self) -> float:
+        """Get share of failed calls in the window"""
+        if not self.outcomes:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+    
+    def state(self, now: float) -> str:
+        """Get circuit state: closed, open or half_open"""
+        if self.consecutive_failures < config.LLM_CIRCUIT_FAILURES:
+            return "closed"
+        return "open" if now < self.open_until else "half_open"
+    
+    def available(self, now: float) -> bool:
+        """Check whether a call may be sent (one probe at a time while half-open)"""
+        state = self.state(now)
+        if state == "open":
+            return False
+        return state == "closed" or not self.half_open_probe
+    
+    def record_success(self, latency_ms: float) -> None:
+        self.latencies.append(latency_ms)
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+        self.half_open_probe = False
+    
+    def record_failure(self) -> None:
+        self.outcomes.append(False)
+        self.last_failure = time.monotonic()
+        self.consecutive_failures += 1
+        self.half_open_probe = False
+        if self.consecutive_failures >= config.LLM_CIRCUIT_FAILURES:
+            # Открываем цепь: бэкенд отдыхает, потом получает один пробный запрос
+            self.open_until = time.monotonic() + config.LLM_CIRCUIT_COOLDOWN
+    
+    def record_usage(self, usage: Optional[Dict]) -> None:
+        """Count prompt tokens and how many of them the provider read from its prompt cache"""
+        if usage:
+            self.prompt_tokens += usage.get("prompt_tokens") or 0
+            self.cache_read_tokens += usage.get("cache_read_tokens") or 0
+    
+    def to_dict(self, now: float) -> Dict:
+        return {
+            "latency_ms": self.latency_ms(),
+            "error_rate": round(self.error_rate(), 3),
+            "in_flight": self.in_flight,
+            "circuit": self.state(now),
+            "calls": len(self.outcomes),
+            "prompt_tokens": self.prompt_tokens,
+            "cache_read_tokens": self.cache_read_tokens,
+            "cache_hit_ratio": round(self.cache_read_tokens / self.prompt_tokens, 3) if self.prompt_tokens else None
+        }
+
+
+def ollama_usage(data: Dict) -> Dict:
+    """Get token usage of an Ollama response"""
+    return {
+        "prompt_tokens": data.get("prompt_eval_count"),
+        "completion_tokens": data.get("eval_count"),
+        "cache_read_tokens": None,
+        "cache_write_tokens": None
+    }
+
+
+class LLMBackend:
+    """Generation backend: subclasses implement generate()"""
+    
+    kind = ""
+    
+    def __init__(self, name: str, max_in_flight: int, default_latency_ms: float):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.default_latency_ms = default_latency_ms
+        self.stats = BackendStats()
+    
+    async def generate(self, prompt: str, params: Dict, ollama_state: Optional[List[int]] = None) -> Dict:
+        """
+        Generate answer
+        
+        Returns:
+            Dict with answer, token usage, raw response data and Ollama token state
+        
+        Raises:
+            Exception: If the backend fails
+        """
+        raise NotImplementedError
+    
+    def stream(self, prompt: str, params: Dict, ollama_state: Optional[List[int]] = None) -> AsyncIterator[Dict]:
+        """
+        Generate answer as a stream
+        
+        Yields:
+            {"type": "delta", "text": ...} fragments, then {"type": "done"} with
+            finish_reason, usage, raw final data and Ollama token state
+        """
+        raise NotImplementedError
+    
+    def score(self) -> float:
+        """Expected latency of a new call: queueing behind in-flight calls, inflated by errors"""
+        latency = self.stats.latency_ms() or self.default_latency_ms
+        # Старые ошибки не учитываются, иначе бэкенд без новых вызовов никогда не вернет трафик
+        recent_errors = time.monotonic() - self.stats.last_failure < config.LLM_CIRCUIT_COOLDOWN
+        reliability = max(1 - self.stats.error_rate(), 0.1) if recent_errors else 1.0
+        return latency * (1 + self.stats.in_flight) / reliability
+
+
+class OllamaBackend(LLMBackend):
+    """Local Ollama servers (balanced by the Ollama pool)"""
+    
+    kind = "ollama"
+    
+    def __init__(self):
+        super().__init__(
+            "ollama",
+            config.LLM_OLLAMA_MAX_IN_FLIGHT * len(config.OLLAMA_BASE_URLS),
+            config.LLM_DEFAULT_LATENCY_MS
+        )
+    
+    async def generate(self, prompt: str, params: Dict, ollama_state: Optional[List[int]] = None) -> Dict:
+        payload = {
+            "model": params["model"],
+            "prompt": prompt,
+            "options": params["options"]
+        }
+        if ollama_state:
+            # Ollama продолжает с сохраненного состояния: prefill только для нового хода
+            payload["context"] = ollama_state
+        
+        data = await get_ollama_pool().generate(payload)
+        if "response" not in data:
+            raise ValueError("Ошибка генерации ответа")
+        return {"answer": data["response"], "usage": ollama_usage(data), "data": data, "state": data.get("context")}
+    
+    async def stream(self, prompt: str, params: Dict, ollama_state: Optional[List[int]] = None) -> AsyncIterator[Dict]:
+        payload = {
+            "model": params["model"],
+            "prompt": prompt,
+            "options": params["options"]
+        }
+        if ollama_state:
+            payload["context"] = ollama_state
+        
+        async for chunk in get_ollama_pool().generate_stream(payload):
+            if chunk.get("error"):
+                raise ValueError(chunk["error"])
+            if chunk.get("response"):
+                yield {"type": "delta", "text": chunk["response"]}
+            if chunk.get("done"):
+                yield {
+                    "type": "done",
+                    "finish_reason": chunk.get("done_reason"),
+                    "usage": ollama_usage(chunk),
+                    "data": chunk,
+                    "state": chunk.get("context")
+                }
+
+
+class APIBackend(LLMBackend):
+    """External API model (OpenAI, Anthropic, Gemini, custom)"""
+    
+    kind = "api"
+    
+    def __init__(self, api_config: Dict):
+        super().__init__(
+            f"api:{api_config.get('api_type')}:{api_config.get('model_name')}",
+            config.LLM_API_MAX_IN_FLIGHT,
+            config.LLM_DEFAULT_LATENCY_MS
+        )
+        self.api_config = dict(api_config)
+        self.connector = APIModelConnector(
+            api_type=api_config.get('api_type'),
+            api_key=api_config.get('api_key'),
+            api_url=api_config.get('api_url'),
+            model_name=api_config.get('model_name')
+        )
+    
+    async def generate(self, prompt: str, params: Dict, ollama_state: Optional[List[int]] = None) -> Dict:
+        temperature, max_tokens = APIModelConnector.generation_defaults(self.connector.api_type)
+        result = await self.connector.acomplete(prompt, temperature, max_tokens)
+        if not result["text"] or not result["text"].strip():
+            raise ValueError("API returned empty result")
+        return {"answer": result["text"], "usage": result["usage"], "data": {}, "state": None}
+    
+    async def stream(self, prompt: str, params: Dict, ollama_state: Optional[List[int]] = None) -> AsyncIterator[Dict]:
+        temperature, max_tokens = APIModelConnector.generation_defaults(self.connector.api_type)
+        stream = self.connector.agenerate_stream(prompt, temperature, max_tokens)
+        async for event in stream:
+            if event["type"] == "done":
+                event = {**event, "data": {}, "state": None}
+            yield event
+
+
+class LLMRouter:
+    """Route each generation to the best available backend, failing over within a deadline"""
+    
+    def __init__(self):
+        self.ollama = OllamaBackend()
+        self.api: Optional[APIBackend] = None
+    
+    def configure(self, use_api: bool, api_config: Optional[Dict]) -> None:
+        """Sync backends with current settings (API backend is rebuilt when its config changes)"""
+        # Отключенная API модель не вызывается, пока переход на платный API не разрешен явно
+        if not use_api and not config.LLM_FAILOVER_TO_API:
+            api_config = None
+        if api_config and (self.api is None or self.api.api_config != api_config):
+            self.api = APIBackend(api_config)
+        elif not api_config:
+            self.api = None
+    
+    def backends(self, use_api: bool) -> List[LLMBackend]:
+        """Get backends allowed for a request, preferred first"""
+        if use_api and self.api:
+            preferred, secondary = self.api, self.ollama
+        else:
+            preferred, secondary = self.ollama, self.api
+        if secondary and config.LLM_FAILOVER:
+            return [preferred, secondary]
+        return [preferred]
+    
+    def ranked(self, use_api: bool) -> List[LLMBackend]:
+        """
+        Get available backends, best first
+        
+        Closed, unsaturated backends are ordered by score (rolling latency,
+        queueing and recent errors). The preferred backend keeps first place
+        unless another one scores better by more than LLM_SWITCH_MARGIN, so
+        traffic does not flap between backends with close scores. Saturated
+        and half-open backends go last.
+        """
+        now = time.monotonic()
+        allowed = self.backends(use_api)
+        available = [backend for backend in allowed if backend.stats.available(now)]
+        ready = sorted(
+            (backend for backend in available
+             if backend.stats.state(now) == "closed" and backend.stats.in_flight < backend.max_in_flight),
+            key=lambda backend: backend.score()
+        )
+        preferred = allowed[0]
+        if preferred in ready and ready[0] is not preferred:
+            if ready[0].score() * (1 + config.LLM_SWITCH_MARGIN) >= preferred.score():
+                # Выигрыш меньше запаса: трафик остается на основном бэкенде
+                ready.remove(preferred)
+                ready.insert(0, preferred)
+        return ready + [backend for backend in available if backend not in ready]
+    
+    async def run(self, attempt: Callable[[LLMBackend], Awaitable[Dict]], use_api: bool,
+                  timeout: float) -> Dict:
+        """
+        Run attempt(backend) on ranked backends until one succeeds
+        
+        Args:
+            attempt: Builds the prompt for a backend and calls its generate()
+            use_api: Whether the API model is the preferred backend
+            timeout: Seconds left for generation
+        
+        Returns:
+            Result of the successful attempt with the backend name
+        
+        Raises:
+            NoBackendAvailable: If every backend failed or the deadline expired
+        """
+        deadline = time.monotonic() + timeout
+        # Дедлайн запроса короче LLM_DEADLINE: таймаут означает нехватку времени, а не зависший бэкенд
+        caller_deadline = timeout < config.LLM_DEADLINE
+        errors = []
+        last_error: Optional[Exception] = None
+        for backend in self.ranked(use_api):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            
+            stats = backend.stats
+            now = time.monotonic()
+            if not stats.available(now):
+                continue
+            if stats.state(now) == "half_open":
+                stats.half_open_probe = True
+            stats.in_flight += 1
+            start = time.monotonic()
+            try:
+                result = await asyncio.wait_for(attempt(backend), remaining)
+            except Exception as e:
+                last_error = e
+                if isinstance(e, asyncio.TimeoutError) and caller_deadline:
+                    # Истек дедлайн запроса, а не таймаут бэкенда: предохранитель не срабатывает
+                    stats.half_open_probe = False
+                else:
+                    stats.record_failure()
+                reason = "timeout" if isinstance(e, asyncio.TimeoutError) else str(e) or type(e).__name__
+                errors.append(f"{backend.name}: {reason}")
+                logger.warning(f"LLM backend {backend.name} failed ({reason}), trying next")
+                continue
+            finally:
+                stats.in_flight -= 1
+            
+            stats.record_success((time.monotonic() - start) * 1000)
+            stats.record_usage(result.get("usage"))
+            return {**result, "backend": backend.name}
+        
+        raise NoBackendAvailable("; ".join(errors) or "No LLM backend available") from last_error
+    
+    async def stream(self, attempt: Callable[[LLMBackend], AsyncIterator[Dict]],
+                     use_api: bool) -> AsyncIterator[Dict]:
+        """
+        Stream events of attempt(backend) from the best backend
+        
+        A backend that fails before its first text delta is replaced by the next
+        one; once text has been sent to the client the error is raised.
+        
+        Raises:
+            NoBackendAvailable: If every backend failed before producing text
+        """
+        errors = []
+        last_error: Optional[Exception] = None
+        for backend in self.ranked(use_api):
+            stats = backend.stats
+            now = time.monotonic()
+            if not stats.available(now):
+                continue
+            if stats.state(now) == "half_open":
+                stats.half_open_probe = True
+            stats.in_flight += 1
+            start = time.monotonic()
+            started = False
+            try:
+                async for event in attempt(backend):
+                    started = started or event.get("type") == "delta"
+                    if event.get("type") == "done":
+                        stats.record_usage(event.get("usage"))
+                    yield {**event, "backend": backend.name}
+            except Exception as e:
+                stats.record_failure()
+                if started:
+                    raise
+                last_error = e
+                reason = str(e) or type(e).__name__
+                errors.append(f"{backend.name}: {reason}")
+                logger.warning(f"LLM backend {backend.name} failed ({reason}), trying next")
+                continue
+            finally:
+                stats.in_flight -= 1
+            
+            stats.record_success((time.monotonic() - start) * 1000)
+            return
+        
+        raise NoBackendAvailable("; ".join(errors) or "No LLM backend available") from last_error
+    
+    def stats(self) -> List[Dict]:
+        """Get per-backend routing stats"""
+        now = time.monotonic()
+        backends = [self.ollama] + ([self.api] if self.api else [])
+        return [
+            {"name": backend.name, "kind": backend.kind, "score_ms": round(backend.score(), 1),
+             **backend.stats.to_dict(now)}
+            for backend in backends
+        ]
+
+
+# Общий роутер: статистика бэкендов едина для API сервера и Telegram бота
+_llm_router: Optional[LLMRouter] = None
+
+
+def get_llm_router() -> LLMRouter:
+    """Get shared LLM router"""
+    global _llm_router
+    if _llm_router is None:
+        _llm_router = LLMRouter()
+    return _llm_router
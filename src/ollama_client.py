@@ -0,0 +1,310 @@
+"""Async HTTP client for Ollama with connection pooling and load balancing across instances"""
+import asyncio
+import json
+import logging
+import time
+from typing import AsyncIterator, Dict, List, Optional, Set
+import httpx
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class OllamaClient:
+    """Long-lived async client for the Ollama HTTP API with keep-alive connections"""
+    
+    def __init__(self, base_url: str = None):
+        """
+        Initialize client
+        
+        Args:
+            base_url: Ollama server URL (defaults to OLLAMA_BASE_URL)
+        """
+        self.base_url = (base_url or config.OLLAMA_BASE_URL).rstrip('/')
+        # Отдельные таймауты: соединение должно устанавливаться быстро, генерация может идти долго
+        self.timeout = httpx.Timeout(
+            config.OLLAMA_TIMEOUT,
+            connect=config.OLLAMA_CONNECT_TIMEOUT
+        )
+        self.limits = httpx.Limits(
+            max_connections=config.OLLAMA_POOL_SIZE,
+            max_keepalive_connections=config.OLLAMA_POOL_SIZE,
+            keepalive_expiry=config.OLLAMA_POOL_IDLE_TIMEOUT
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Get pooled HTTP client, creating it on first use"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=self.limits
+            )
+        return self._client
+    
+    async def generate(self, payload: Dict) -> Dict:
+        """
+        Call /api/generate without streaming
+        
+        Args:
+            payload: Request body (model, prompt, options)
+        
+        Returns:
+            Ollama response JSON
+        """
+        # keep_alive продлевается каждым запросом, иначе Ollama выгрузит модель через 5 минут
+        body = {"keep_alive": config.OLLAMA_KEEP_ALIVE, **payload, "stream": False}
+        response = await self.client.post("/api/generate", json=body)
+        response.raise_for_status()
+        return response.json()
+    
+    async def generate_stream(self, payload: Dict) -> AsyncIterator[Dict]:
+        """Call /api/generate with streaming, yields response chunks (the last one has done=True)"""
+        body = {"keep_alive": config.OLLAMA_KEEP_ALIVE, **payload, "stream": True}
+        async with self.client.stream("POST", "/api/generate", json=body) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line:
+                    yield json.loads(line)
+    
+    async def preload(self, model: str) -> Dict:
+        """
+        Load model into memory with a one-token warmup generation
+        
+        Returns:
+            Warmup timings (see ollama_timings)
+        """
+        data = await self.generate({
+            "model": model,
+            "prompt": "Привет",
+            "options": {"num_predict": 1}
+        })
+        timings = ollama_timings(data)
+        logger.info(f"Model {model} preloaded: load {timings['load_ms']} ms, total {timings['total_ms']} ms")
+        return timings
+    
+    async def unload(self, model: str) -> None:
+        """Unload model from memory (keep_alive=0)"""
+        response = await self.client.post("/api/generate", json={"model": model, "keep_alive": 0})
+        response.raise_for_status()
+        logger.info(f"Model {model} unloaded")
+    
+    async def tags(self) -> Set[str]:
+        """Get names of models installed on the server (/api/tags)"""
+        response = await self.client.get("/api/tags", timeout=config.OLLAMA_CONNECT_TIMEOUT)
+        response.raise_for_status()
+        return {model.get("name") for model in response.json().get("models", [])}
+    
+    async def aclose(self) -> None:
+        """Close pooled connections"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+
+def ollama_timings(data: Dict) -> Dict:
+    """Convert Ollama nanosecond durations into milliseconds"""
+    def ms(key: str) -> float:
+        return round(data.get(key, 0) / 1e6, 1)
+    
+    return {
+        "load_ms": ms("load_duration"),
+        "prompt_eval_ms": ms("prompt_eval_duration"),
+        "generation_ms": ms("eval_duration"),
+        "total_ms": ms("total_duration"),
+        "prompt_tokens": data.get("prompt_eval_count", 0),
+        "generated_tokens": data.get("eval_count", 0)
+    }
+
+
+class OllamaNode:
+    """One Ollama instance with its outstanding requests, models and health"""
+    
+    def __init__(self, base_url: str):
+        self.client = OllamaClient(base_url)
+        self.url = self.client.base_url
+        self.outstanding = 0
+        self.requests = 0
+        # None - список моделей еще не получен
+        self.models: Optional[Set[str]] = None
+        self.failures = 0
+        self.ejected_until = 0.0
+    
+    def healthy(self, now: float) -> bool:
+        return now >= self.ejected_until
+    
+    def has_model(self, model: Optional[str]) -> bool:
+        """Check whether the model is installed (unknown until the first probe)"""
+        if self.models is None or not model:
+            return True
+        return model in self.models or f"{model}:latest" in self.models
+    
+    def mark_success(self) -> None:
+        self.failures = 0
+        self.ejected_until = 0.0
+    
+    def mark_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= config.OLLAMA_EJECT_FAILURES:
+            # Узел исключается из балансировки до следующей успешной проверки или истечения срока
+            if self.healthy(time.monotonic()):
+                logger.warning(f"Ollama node {self.url} ejected after {self.failures} failures")
+            self.ejected_until = time.monotonic() + config.OLLAMA_EJECT_TIME
+    
+    def to_dict(self, now: float) -> Dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy(now),
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "models": sorted(self.models) if self.models is not None else None
+        }
+
+
+class OllamaPool:
+    """Least-outstanding-requests balancing across Ollama instances with health probing"""
+    
+    def __init__(self, base_urls: Optional[List[str]] = None):
+        """
+        Initialize pool
+        
+        Args:
+            base_urls: Ollama server URLs (defaults to OLLAMA_BASE_URLS)
+        """
+        self.nodes = [OllamaNode(url) for url in (base_urls or config.OLLAMA_BASE_URLS)]
+        self._health_task: Optional[asyncio.Task] = None
+    
+    def ordered(self, model: Optional[str]) -> List[OllamaNode]:
+        """
+        Get nodes in the order to try them
+        
+        Healthy nodes with the model come first, the least loaded of them
+        first; ejected nodes are kept last so a request is still attempted
+        when every node is down.
+        """
+        now = time.monotonic()
+        return sorted(
+            self.nodes,
+            key=lambda node: (not node.healthy(now), not node.has_model(model), node.outstanding, node.requests)
+        )
+    
+    async def generate(self, payload: Dict) -> Dict:
+        """
+        Call /api/generate on the best node, retrying on the next one if it fails
+        
+        Raises:
+            httpx.HTTPError: Error of the last node tried
+        """
+        last_error: Optional[Exception] = None
+        for node in self.ordered(payload.get("model")):
+            node.outstanding += 1
+            node.requests += 1
+            try:
+                data = await node.client.generate(payload)
+            except httpx.HTTPStatusError as e:
+                # Ошибка 4xx (например, модели нет на узле) не делает узел нездоровым
+                if e.response.status_code >= 500:
+                    node.mark_failure()
+                last_error = e
+                logger.warning(f"Ollama node {node.url} returned {e.response.status_code}, trying next")
+                continue
+            except httpx.TransportError as e:
+                node.mark_failure()
+                last_error = e
+                logger.warning(f"Ollama node {node.url} failed ({type(e).__name__}), trying next")
+                continue
+            finally:
+                node.outstanding -= 1
+            
+            node.mark_success()
+            return data
+        raise last_error
+    
+    async def generate_stream(self, payload: Dict) -> AsyncIterator[Dict]:
+        """Stream /api/generate from the best node (no retry: the output may have started)"""
+        node = self.ordered(payload.get("model"))[0]
+        node.outstanding += 1
+        node.requests += 1
+        try:
+            async for chunk in node.client.generate_stream(payload):
+                yield chunk
+        except httpx.TransportError:
+            node.mark_failure()
+            raise
+        else:
+            node.mark_success()
+        finally:
+            node.outstanding -= 1
+    
+    async def probe(self) -> List[Dict]:
+        """Check every node via /api/tags, updating its health and installed models"""
+        async def check(node: OllamaNode) -> None:
+            try:
+                node.models = await node.client.tags()
+                node.mark_success()
+            except Exception as e:
+                logger.debug(f"Ollama node {node.url} probe failed: {str(e)}")
+                node.mark_failure()
+        
+        await asyncio.gather(*(check(node) for node in self.nodes))
+        return self.stats()
+    
+    async def _health_loop(self) -> None:
+        while True:
+            await self.probe()
+            await asyncio.sleep(config.OLLAMA_HEALTH_INTERVAL)
+    
+    def start_health_checks(self) -> None:
+        """Start periodic background probing"""
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._health_loop())
+    
+    async def preload(self, model: str) -> List[Dict]:
+        """Preload model on every healthy node that has it"""
+        now = time.monotonic()
+        nodes = [node for node in self.nodes if node.healthy(now) and node.has_model(model)]
+        results = await asyncio.gather(*(node.client.preload(model) for node in nodes), return_exceptions=True)
+        for node, result in zip(nodes, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Could not preload {model} on {node.url}: {str(result)}")
+        return [result for result in results if not isinstance(result, Exception)]
+    
+    async def unload(self, model: str) -> None:
+        """Unload model from every node"""
+        await asyncio.gather(*(node.client.unload(model) for node in self.nodes), return_exceptions=True)
+    
+    def stats(self) -> List[Dict]:
+        """Get per-node state"""
+        now = time.monotonic()
+        return [node.to_dict(now) for node in self.nodes]
+    
+    async def aclose(self) -> None:
+        """Stop probing and close connections of all nodes"""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for node in self.nodes:
+            await node.client.aclose()
+
+
+# Общий пул для API сервера и Telegram бота
+_ollama_pool: Optional[OllamaPool] = None
+
+
+def get_ollama_pool() -> OllamaPool:
+    """Get shared Ollama pool"""
+    global _ollama_pool
+    if _ollama_pool is None:
+        _ollama_pool = OllamaPool()
+    return _ollama_pool
+
+
+async def close_ollama_pool() -> None:
+    """Close shared Ollama pool"""
+    global _ollama_pool
+    if _ollama_pool is not None:
+        await _ollama_pool.aclose()
+        _ollama_pool = None
@@ -0,0 +1,148 @@
+"""Document parsing in a pool of worker processes"""
+import logging
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import config
+from src.document_parser import NO_PDF_TEXT_ERROR, DocumentParser
+
+logger = logging.getLogger(__name__)
+
+
+def parse_pdf_range(file_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """Extract text of PDF pages start..end-1 (runs in a worker process)"""
+    return list(DocumentParser.read_pdf_pages(Path(file_path), start, end))
+
+
+def parse_file(file_path: str) -> str:
+    """Parse a whole non-PDF document (runs in a worker process)"""
+    return DocumentParser().parse_document(Path(file_path))
+
+
+class ParsePool:
+    """Process pool for CPU-bound text extraction, reused across uploads"""
+    
+    def __init__(self, workers: int = config.PARSE_WORKERS, pages_per_task: int = config.PARSE_PAGES_PER_TASK):
+        """
+        Initialize pool (worker processes are started on first use)
+        
+        Args:
+            workers: Number of worker processes
+            pages_per_task: PDF pages parsed by one task
+        """
+        self.workers = workers
+        self.pages_per_task = pages_per_task
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+    
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        """Get process pool, starting it on first use"""
+        with self._lock:
+            if self._executor is None:
+                # spawn: форк процесса с загруженными моделями и потоками может зависнуть
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+                logger.info(f"Parse pool started with {self.workers} workers")
+            return self._executor
+    
+    def _submit(self, fn, *args) -> Future:
+        try:
+            return self.executor.submit(fn, *args)
+        except BrokenProcessPool:
+            # Упавший воркер ломает весь пул: пересоздаем его для следующих задач
+            self._reset()
+            return self.executor.submit(fn, *args)
+    
+    def _reset(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+    
+    def iter_pdf_pages(self, file_path: Path) -> Iterator[Tuple[int, str]]:
+        """
+        Extract PDF pages in parallel, yielding them in page order
+        
+        Page ranges are parsed by the workers; at most two ranges per worker
+        are in flight, so memory stays bounded for any document size.
+        """
+        page_count = DocumentParser.pdf_page_count(file_path)
+        ranges = iter(range(0, page_count, self.pages_per_task))
+        pending: "deque[Future]" = deque()
+        has_text = False
+        try:
+            while True:
+                while len(pending) < self.workers * 2:
+                    start = next(ranges, None)
+                    if start is None:
+                        break
+                    pending.append(self._submit(parse_pdf_range, str(file_path), start, start + self.pages_per_task))
+                if not pending:
+                    break
+                try:
+                    pages = pending.popleft().result()
+                except BrokenProcessPool:
+                    self._reset()
+                    raise
+                for page in pages:
+                    has_text = True
+                    yield page
+        finally:
+            for future in pending:
+                future.cancel()
+        
+        if not has_text:
+            raise ValueError(NO_PDF_TEXT_ERROR)
+    
+    def iter_sections(self, file_path: Path) -> Iterator[Tuple[Dict, str]]:
+        """
+        Parse document in the pool, same sections as DocumentParser.iter_sections
+        
+        Excel rows are streamed in the calling thread: a worker would have
+        to return the whole workbook at once.
+        """
+        suffix = file_path.suffix.lower()
+        if suffix == '.pdf':
+            for page, text in self.iter_pdf_pages(file_path):
+                yield {"page": page}, text
+        elif suffix in ['.xlsx', '.xls']:
+            yield from DocumentParser().iter_sections(file_path)
+        else:
+            yield {}, self._submit(parse_file, str(file_path)).result()
+    
+    def shutdown(self) -> None:
+        """Stop worker processes"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+
+# Общий пул для всех загрузок
+_parse_pool: Optional[ParsePool] = None
+_parse_pool_lock = threading.Lock()
+
+
+def get_parse_pool() -> Optional[ParsePool]:
+    """Get shared parse pool (None when PARSE_WORKERS is 0 and parsing runs in the calling thread)"""
+    global _parse_pool
+    # Загрузки индексируются в разных потоках
+    with _parse_pool_lock:
+        if _parse_pool is None and config.PARSE_WORKERS > 0:
+            _parse_pool = ParsePool()
+    return _parse_pool
+
+
+def close_parse_pool() -> None:
+    """Stop shared parse pool"""
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown()
+        _parse_pool = None
@@ -0,0 +1,481 @@
+"""Compressed vector index (int8 scalar / product quantization) with exact re-ranking"""
+import json
+import shutil
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+# Размер блока при грубом скоринге, чтобы не распаковывать весь индекс в float32
+SCORE_BLOCK_SIZE = 8192
+# Квантизатор переобучается, когда индекс вырос во столько раз с момента обучения:
+# первая маленькая загрузка не задает диапазоны int8 и центры PQ навсегда
+RETRAIN_GROWTH = 2
+
+
+def exact_distances(query: np.ndarray, vectors: np.ndarray, metric: str) -> np.ndarray:
+    """
+    Compute distances the same way hnswlib/Chroma does
+    
+    Args:
+        query: Query vector (dim,)
+        vectors: Matrix of vectors (n, dim)
+        metric: l2 (squared), ip or cosine
+    
+    Returns:
+        Distances (n,)
+    """
+    if metric == "l2":
+        diff = vectors - query
+        return np.einsum('ij,ij->i', diff, diff)
+    if metric == "ip":
+        return 1.0 - vectors @ query
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+    return 1.0 - (vectors @ query) / np.maximum(norms, 1e-12)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows"""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class ScalarQuantizer:
+    """Per-dimension 8-bit scalar quantization (4x smaller than float32)"""
+    
+    method = "int8"
+    
+    def __init__(self):
+        self.offset: Optional[np.ndarray] = None
+        self.scale: Optional[np.ndarray] = None
+    
+    def fit(self, vectors: np.ndarray) -> None:
+        """Fit per-dimension range"""
+        low = vectors.min(axis=0)
+        high = vectors.max(axis=0)
+        self.offset = low.astype(np.float32)
+        self.scale = np.maximum((high - low) / 255.0, 1e-12).astype(np.float32)
+    
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Encode vectors into uint8 codes"""
+        codes = np.rint((vectors - self.offset) / self.scale)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+    
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """Reconstruct approximate float32 vectors"""
+        return codes.astype(np.float32) * self.scale + self.offset
+    
+    def code_size(self, dim: int) -> int:
+        """Bytes per encoded vector"""
+        return dim
+    
+    def distances(self, query: np.ndarray, codes: np.ndarray, metric: str) -> np.ndarray:
+        """Approximate distances from query to encoded vectors"""
+        result = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_BLOCK_SIZE):
+            block = self.decode(codes[start:start + SCORE_BLOCK_SIZE])
+            # cosine считается по нормированным векторам как ip
+            result[start:start + len(block)] = exact_distances(
+                query, block, "l2" if metric == "l2" else "ip"
+            )
+        return result
+    
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"offset": self.offset, "scale": self.scale}
+    
+    def load_state(self, state: Dict[str, np.ndarray]) -> None:
+        self.offset = state["offset"]
+        self.scale = state["scale"]
+
+
+class ProductQuantizer:
+    """Product quantization: one byte per subvector, scored with lookup tables"""
+    
+    method = "pq"
+    
+    def __init__(self, n_subvectors: int = 48, n_iter: int = 10, sample_size: int = 10000, seed: int = 0):
+        """
+        Initialize product quantizer
+        
+        Args:
+            n_subvectors: Number of subspaces (must divide vector dimension)
+            n_iter: k-means iterations per subspace
+            sample_size: Max vectors used for training
+            seed: Random seed
+        """
+        self.n_subvectors = n_subvectors
+        self.n_iter = n_iter
+        self.sample_size = sample_size
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None  # (m, k, dim / m)
+    
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        """Reshape (n, dim) -> (n, m, dim / m)"""
+        n, dim = vectors.shape
+        if dim % self.n_subvectors:
+            raise ValueError(f"Vector dimension {dim} is not divisible by {self.n_subvectors} subvectors")
+        return vectors.reshape(n, self.n_subvectors, dim // self.n_subvectors)
+    
+    @staticmethod
+    def _assign(points: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """Nearest centroid for every point"""
+        dists = (
+            np.einsum('ij,ij->i', points, points)[:, None]
+            - 2.0 * points @ centroids.T
+            + np.einsum('ij,ij->i', centroids, centroids)[None, :]
+        )
+        return dists.argmin(axis=1)
+    
+    def fit(self, vectors: np.ndarray) -> None:
+        """Train a k-means codebook for every subspace"""
+        rng = np.random.default_rng(self.seed)
+        if len(vectors) > self.sample_size:
+            vectors = vectors[rng.choice(len(vectors), self.sample_size, replace=False)]
+        
+        subvectors = self._split(vectors)
+        n_centroids = min(256, len(vectors))
+        codebooks = []
+        for j in range(self.n_subvectors):
+            points = subvectors[:, j, :]
+            centroids = points[rng.choice(len(points), n_centroids, replace=False)].copy()
+            for _ in range(self.n_iter):
+                assignment = self._assign(points, centroids)
+                members = np.zeros((n_centroids, len(points)), dtype=np.float32)
+                members[assignment, np.arange(len(points))] = 1.0
+                sums = members @ points
+                counts = np.bincount(assignment, minlength=n_centroids)
+                # Пустые кластеры сохраняют прежний центр
+                filled = counts > 0
+                centroids[filled] = sums[filled] / counts[filled, None]
+            codebooks.append(centroids)
+        self.centroids = np.stack(codebooks).astype(np.float32)
+    
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Encode vectors into (n, m) uint8 codes"""
+        subvectors = self._split(vectors)
+        codes = np.empty((len(vectors), self.n_subvectors), dtype=np.uint8)
+        for j in range(self.n_subvectors):
+            codes[:, j] = self._assign(subvectors[:, j, :], self.centroids[j])
+        return codes
+    
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """Reconstruct approximate float32 vectors"""
+        parts = [self.centroids[j][codes[:, j]] for j in range(self.n_subvectors)]
+        return np.concatenate(parts, axis=1)
+    
+    def code_size(self, dim: int) -> int:
+        """Bytes per encoded vector"""
+        return self.n_subvectors
+    
+    def distances(self, query: np.ndarray, codes: np.ndarray, metric: str) -> np.ndarray:
+        """Asymmetric distances via per-subspace lookup tables"""
+        sub_query = query.reshape(self.n_subvectors, -1)
+        if metric == "l2":
+            diff = self.centroids - sub_query[:, None, :]
+            table = np.einsum('mkd,mkd->mk', diff, diff)
+        else:
+            table = -np.einsum('mkd,md->mk', self.centroids, sub_query)
+        
+        result = np.empty(len(codes), dtype=np.float32)
+        columns = np.arange(self.n_subvectors)
+        for start in range(0, len(codes), SCORE_BLOCK_SIZE):
+            block = codes[start:start + SCORE_BLOCK_SIZE]
+            result[start:start + len(block)] = table[columns, block].sum(axis=1)
+        if metric != "l2":
+            result += 1.0
+        return result
+    
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"centroids": self.centroids}
+    
+    def load_state(self, state: Dict[str, np.ndarray]) -> None:
+        self.centroids = state["centroids"]
+        self.n_subvectors = self.centroids.shape[0]
+
+
+def make_quantizer(method: str, n_subvectors: int = 48):
+    """Create quantizer by method name (int8 or pq)"""
+    if method == "int8":
+        return ScalarQuantizer()
+    if method == "pq":
+        return ProductQuantizer(n_subvectors=n_subvectors)
+    raise ValueError(f"Unknown quantization method: {method}")
+
+
+class QuantizedIndex:
+    """
+    Compressed in-memory index with full-precision vectors kept on disk
+    
+    Only the quantized codes live in RAM. Coarse scoring runs on the codes,
+    then a small shortlist is re-ranked exactly from a float32 memmap.
+    Files are append-only; deletions are tombstoned and compacted lazily.
+    """
+    
+    _instances: Dict[Path, "QuantizedIndex"] = {}
+    _instances_lock = threading.Lock()
+    
+    def __init__(self, directory: Path, method: str, metric: str = "l2", n_subvectors: int = 48):
+        """
+        Initialize quantized index
+        
+        Args:
+            directory: Directory for index files
+            method: int8 or pq
+            metric: l2, ip or cosine (same semantics as Chroma)
+            n_subvectors: Number of PQ subspaces
+        """
+        self.directory = Path(directory)
+        self.method = method
+        self.metric = metric
+        self.n_subvectors = n_subvectors
+        self.quantizer = None
+        self.dim: Optional[int] = None
+        self.trained_on = 0
+        self.codes = np.empty((0, 0), dtype=np.uint8)
+        self.ids: List[str] = []
+        self.deleted = np.zeros(0, dtype=bool)
+        self._positions: Dict[str, int] = {}
+        self._vectors: Optional[np.memmap] = None
+        self.lock = threading.RLock()
+        self._load()
+    
+    @classmethod
+    def open(cls, directory: Path, method: str, metric: str = "l2", n_subvectors: int = 48) -> "QuantizedIndex":
+        """Get shared index instance for a directory"""
+        directory = Path(directory)
+        with cls._instances_lock:
+            index = cls._instances.get(directory)
+            if index is None or index.method != method or index.metric != metric:
+                index = cls(directory, method, metric, n_subvectors)
+                cls._instances[directory] = index
+            return index
+    
+    @property
+    def _meta_file(self) -> Path:
+        return self.directory / "meta.json"
+    
+    @property
+    def _vectors_file(self) -> Path:
+        return self.directory / "vectors.f32"
+    
+    @property
+    def _codes_file(self) -> Path:
+        return self.directory / "codes.u8"
+    
+    @property
+    def _ids_file(self) -> Path:
+        return self.directory / "ids.txt"
+    
+    @property
+    def _deleted_file(self) -> Path:
+        return self.directory / "deleted.txt"
+    
+    def _load(self) -> None:
+        """Load index from disk if it matches current method and metric"""
+        if not self._meta_file.exists():
+            return
+        meta = json.loads(self._meta_file.read_text())
+        if meta.get("method") != self.method or meta.get("metric") != self.metric:
+            return
+        
+        self.dim = meta["dim"]
+        # Индексы без trained_on переобучаются при следующем росте
+        self.trained_on = meta.get("trained_on", 0)
+        self.quantizer = make_quantizer(self.method, self.n_subvectors)
+        state = np.load(self.directory / "quantizer.npz")
+        self.quantizer.load_state({key: state[key] for key in state.files})
+        
+        code_size = self.quantizer.code_size(self.dim)
+        self.ids = self._ids_file.read_text(encoding="utf-8").splitlines() if self._ids_file.exists() else []
+        self.codes = np.fromfile(self._codes_file, dtype=np.uint8).reshape(-1, code_size)
+        # После сбоя файлы могут иметь разную длину - обрезаем до общей
+        n = min(len(self.ids), len(self.codes))
+        self.ids = self.ids[:n]
+        self.codes = self.codes[:n]
+        self._positions = {chunk_id: i for i, chunk_id in enumerate(self.ids)}
+        
+        self.deleted = np.zeros(n, dtype=bool)
+        if self._deleted_file.exists():
+            for chunk_id in self._deleted_file.read_text(encoding="utf-8").splitlines():
+                position = self._positions.pop(chunk_id, None)
+                if position is not None:
+                    self.deleted[position] = True
+        self._open_vectors()
+    
+    def _open_vectors(self) -> None:
+        """Memory-map full-precision vectors"""
+        self._vectors = None
+        if self.dim and self._vectors_file.exists() and self._vectors_file.stat().st_size:
+            self._vectors = np.memmap(self._vectors_file, dtype=np.float32, mode='r').reshape(-1, self.dim)
+    
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        """Vectors as seen by the quantizer (normalized for cosine)"""
+        return _normalize(vectors) if self.metric == "cosine" else vectors
+    
+    @property
+    def count(self) -> int:
+        """Number of live vectors"""
+        return len(self._positions)
+    
+    def build(self, ids: List[str], vectors: np.ndarray) -> None:
+        """Train quantizer and rewrite the whole index"""
+        with self.lock:
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+            if self.directory.exists():
+                shutil.rmtree(self.directory)
+            self.directory.mkdir(parents=True, exist_ok=True)
+            
+            self.dim = vectors.shape[1] if len(vectors) else None
+            self.trained_on = len(vectors)
+            self.quantizer = make_quantizer(self.method, self.n_subvectors)
+            self.ids = []
+            self.codes = np.empty((0, 0), dtype=np.uint8)
+            self.deleted = np.zeros(0, dtype=bool)
+            self._positions = {}
+            self._vectors = None
+            if not len(vectors):
+                return
+            
+            self.quantizer.fit(self._prepare(vectors))
+            np.savez(self.directory / "quantizer.npz", **self.quantizer.state())
+            self._meta_file.write_text(json.dumps({
+                "method": self.method,
+                "metric": self.metric,
+                "dim": self.dim,
+                "trained_on": self.trained_on
+            }))
+            self._append(ids, vectors)
+    
+    def _append(self, ids: List[str], vectors: np.ndarray) -> None:
+        """Append encoded vectors to memory and disk"""
+        codes = self.quantizer.encode(self._prepare(vectors))
+        with open(self._vectors_file, 'ab') as f:
+            vectors.tofile(f)
+        with open(self._codes_file, 'ab') as f:
+            codes.tofile(f)
+        with open(self._ids_file, 'a', encoding='utf-8') as f:
+            f.write("".join(f"{chunk_id}\n" for chunk_id in ids))
+        
+        start = len(self.ids)
+        self.codes = np.concatenate([self.codes, codes]) if len(self.codes) else codes
+        self.ids.extend(ids)
+        self.deleted = np.concatenate([self.deleted, np.zeros(len(ids), dtype=bool)])
+        for offset, chunk_id in enumerate(ids):
+            self._positions[chunk_id] = start + offset
+        self._open_vectors()
+    
+    def add(self, ids: List[str], vectors: List[List[float]]) -> None:
+        """Add vectors, retraining the quantizer on all of them once the index has grown RETRAIN_GROWTH times"""
+        if not ids:
+            return
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self.lock:
+            # Уже проиндексированные ID (повторная запись тех же чанков) не дублируем
+            new = [i for i, chunk_id in enumerate(ids) if chunk_id not in self._positions]
+            if len(new) < len(ids):
+                ids = [ids[i] for i in new]
+                vectors = vectors[new]
+                if not ids:
+                    return
+            if self.quantizer is None:
+                self.build(ids, vectors)
+                return
+            self._append(ids, vectors)
+            if self.count >= RETRAIN_GROWTH * max(self.trained_on, 1):
+                self._retrain()
+    
+    def _retrain(self) -> None:
+        """Train the quantizer on all live vectors and re-encode them"""
+        keep = np.flatnonzero(~self.deleted)
+        ids = [self.ids[i] for i in keep]
+        # Копия в памяти: build удаляет файлы, на которые смотрит memmap
+        vectors = np.array(self._vectors[keep])
+        self.build(ids, vectors)
+    
+    def remove(self, ids: List[str]) -> None:
+        """Tombstone vectors and compact when too many are deleted"""
+        with self.lock:
+            removed = []
+            for chunk_id in ids:
+                position = self._positions.pop(chunk_id, None)
+                if position is not None:
+                    self.deleted[position] = True
+                    removed.append(chunk_id)
+            if not removed:
+                return
+            with open(self._deleted_file, 'a', encoding='utf-8') as f:
+                f.write("".join(f"{chunk_id}\n" for chunk_id in removed))
+            
+            if self.deleted.sum() > 0.25 * len(self.deleted):
+                self._compact()
+    
+    def _compact(self) -> None:
+        """Rewrite files without deleted vectors, keeping the trained quantizer"""
+        keep = np.flatnonzero(~self.deleted)
+        ids = [self.ids[i] for i in keep]
+        vectors = np.array(self._vectors[keep]) if self._vectors is not None else np.empty((0, self.dim or 0), np.float32)
+        
+        for path in (self._vectors_file, self._codes_file, self._ids_file, self._deleted_file):
+            path.unlink(missing_ok=True)
+        self.ids = []
+        self.codes = np.empty((0, 0), dtype=np.uint8)
+        self.deleted = np.zeros(0, dtype=bool)
+        self._positions = {}
+        self._vectors = None
+        if ids:
+            self._append(ids, vectors)
+    
+    def search(self, query: List[float], top_k: int, rerank_k: int = 50) -> List[Tuple[str, float]]:
+        """
+        Search nearest vectors
+        
+        Args:
+            query: Query vector
+            top_k: Number of results
+            rerank_k: Shortlist size re-ranked with full-precision vectors
+        
+        Returns:
+            List of (chunk_id, distance) sorted by distance
+        """
+        with self.lock:
+            if not self.count:
+                return []
+            query = np.asarray(query, dtype=np.float32)
+            coarse = self.quantizer.distances(self._prepare(query[None, :])[0], self.codes, self.metric)
+            coarse[self.deleted] = np.inf
+            
+            shortlist_size = min(max(rerank_k, top_k), self.count)
+            shortlist = np.argpartition(coarse, shortlist_size - 1)[:shortlist_size]
+            shortlist = np.sort(shortlist)  # последовательное чтение с диска
+            
+            exact = exact_distances(query, np.asarray(self._vectors[shortlist]), self.metric)
+            order = np.argsort(exact)[:top_k]
+            return [(self.ids[shortlist[i]], float(exact[i])) for i in order]
+    
+    def stats(self) -> Dict:
+        """Memory usage of codes versus uncompressed float32 vectors"""
+        with self.lock:
+            dim = self.dim or 0
+            float32_bytes = len(self.ids) * dim * 4
+            code_bytes = int(self.codes.nbytes)
+            return {
+                "method": self.method,
+                "metric": self.metric,
+                "vectors": self.count,
+                "dim": dim,
+                "code_bytes": code_bytes,
+                "float32_bytes": float32_bytes,
+                "compression": round(float32_bytes / code_bytes, 1) if code_bytes else None
+            }
+    
+    def destroy(self) -> None:
+        """Remove index files"""
+        with self.lock:
+            self._vectors = None
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.quantizer = None
+            self.dim = None
+            self.ids = []
+            self.codes = np.empty((0, 0), dtype=np.uint8)
+            self.deleted = np.zeros(0, dtype=bool)
+            self._positions = {}
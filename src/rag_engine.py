@@ -1,11 +1,17 @@
 """RAG engine for question answering"""
-import requests
+import asyncio
 import logging
-from typing import List, Dict
+import time
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+import httpx
 import config
 from src.embeddings import EmbeddingGenerator
-from src.vector_store import VectorStore
-from src.api_model_connector import APIModelConnector
+from src.vector_store import VectorStore, get_vector_store
+from src.ollama_client import ollama_timings
+from src.llm_router import LLMBackend, NoBackendAvailable, get_llm_router
+from src.context_builder import ContextBuilder, extract_sentences
+from src.reranker import Reranker
+from src.session_store import ChatSession
 
 logger = logging.getLogger(__name__)
 
@@ -13,58 +19,295 @@ logger = logging.getLogger(__name__)
 class RAGEngine:
     """Retrieval-Augmented Generation engine"""
     
-    def __init__(self, settings_manager=None):
-        """Initialize RAG components"""
+    def __init__(self, settings_manager=None, vector_store: Optional[VectorStore] = None):
+        """Initialize RAG components (the shared vector store is used unless one is given)"""
         self.embedding_generator = EmbeddingGenerator()
-        self.vector_store = VectorStore()
+        self.vector_store = vector_store or get_vector_store()
         self.settings_manager = settings_manager
-        self.api_connector = None
+        self.context_builder = ContextBuilder(self.embedding_generator.count_tokens)
+        self.reranker = Reranker() if config.ENABLE_RERANK else None
     
-    def query(self, question: str) -> Dict:
-        """Process question and generate answer"""
+    async def aquery(self, question: str, source_types: Optional[List[str]] = None,
+                     session: Optional[ChatSession] = None, deadline_ms: Optional[int] = None) -> Dict:
+        """
+        Process question without blocking the event loop, optionally as a turn of a chat session
+        
+        Args:
+            deadline_ms: Time limit for the whole request (defaults to QUERY_DEADLINE_MS).
+                Generation gets what retrieval left; if it cannot answer in time,
+                an extractive answer from the retrieved chunks is returned
+        """
         try:
-            # Generate embedding for question
-            question_embedding = self.embedding_generator.generate_embedding(question)
-            
-            # Search for relevant documents
-            search_results = self.vector_store.search(question_embedding)
-            
-            # Extract context from search results
-            context_docs = search_results.get('documents', [[]])[0]
-            metadatas = search_results.get('metadatas', [[]])[0]
+            deadline_ms = deadline_ms or config.QUERY_DEADLINE_MS or None
+            start = time.perf_counter()
+            deadline = rerank_by = None
+            if deadline_ms:
+                deadline = time.monotonic() + deadline_ms / 1000
+                rerank_by = time.monotonic() + deadline_ms * config.RETRIEVAL_DEADLINE_SHARE / 1000
             
+            # Эмбеддинг и поиск нагружают CPU, поэтому выполняются в пуле потоков
+            search_question = session.retrieval_query(question) if session else question
+            try:
+                context_docs, metadatas, retrieval_timings = await asyncio.wait_for(
+                    asyncio.to_thread(self._retrieve, search_question, source_types, rerank_by, deadline),
+                    timeout=deadline - time.monotonic() if deadline else None
+                )
+            except asyncio.TimeoutError:
+                result = self._empty_result(question, "Превышено время ожидания поиска документов.")
+                result["deadline_exceeded"] = True
+                return result
+            retrieval_ms = round((time.perf_counter() - start) * 1000, 1)
             if not context_docs:
-                return {
-                    "question": question,
-                    "answer": "Не найдено релевантных документов для ответа на вопрос.",
-                    "context": [],
-                    "sources": [],
-                    "sources_count": 0
-                }
-            
-            context = "\n\n".join(context_docs)
-            
-            # Extract unique sources with full context
-            sources = self._extract_sources_with_context(metadatas, context_docs)
+                return self._empty_result(question, "Не найдено релевантных документов для ответа на вопрос.")
             
-            # Generate answer using Ollama
-            answer = self._generate_answer(question, context)
-            
-            return {
-                "question": question,
-                "answer": answer,
-                "context": context_docs,
-                "sources": sources,
-                "sources_count": len(sources)
-            }
+            params = self._generation_settings()
+            generation = await self._route_answer(question, context_docs, metadatas, params, session, deadline)
+            answer, timings = generation["answer"], generation["timings"]
+            context_docs, metadatas = generation["context_docs"], generation["metadatas"]
+            context_stats = generation["context_stats"]
+            if session and generation["backend"]:
+                session.add_turn(question, answer, generation["state"], params["model"])
+            timings = {"retrieval_ms": retrieval_ms, **retrieval_timings, **timings}
+            result = self._build_result(question, answer, context_docs, metadatas, timings, context_stats)
+            result["backend"] = generation["backend"]
+            if generation.get("usage"):
+                result["usage"] = generation["usage"]
+            if generation.get("fallback"):
+                result["fallback"] = generation["fallback"]
+                result["deadline_exceeded"] = True
+            if deadline_ms:
+                result["deadline_ms"] = deadline_ms
+            if session:
+                result["session_id"] = session.session_id
+            return result
         except Exception as e:
-            return {
-                "question": question,
-                "answer": f"Ошибка обработки запроса: {str(e)}",
-                "context": [],
-                "sources": [],
-                "sources_count": 0
-            }
+            return self._empty_result(question, f"Ошибка обработки запроса: {str(e)}")
+    
+    async def astream_query(self, question: str, source_types: Optional[List[str]] = None,
+                            session: Optional[ChatSession] = None) -> AsyncIterator[Dict]:
+        """
+        Process question streaming the answer
+        
+        Yields:
+            {"type": "sources"} with sources and context stats once the prompt is built
+            (sent again if the backend fails before answering and another one takes over),
+            {"type": "delta", "text": ...} answer fragments, then {"type": "done"} with
+            the full answer, timings, finish reason, usage and backend, or {"type": "error"}
+        """
+        start = time.perf_counter()
+        search_question = session.retrieval_query(question) if session else question
+        try:
+            context_docs, metadatas, retrieval_timings = await asyncio.to_thread(
+                self._retrieve, search_question, source_types
+            )
+        except Exception as e:
+            yield {"type": "error", "message": f"Ошибка обработки запроса: {str(e)}"}
+            return
+        retrieval_ms = round((time.perf_counter() - start) * 1000, 1)
+        if not context_docs:
+            yield {"type": "done", **self._empty_result(question, "Не найдено релевантных документов для ответа на вопрос.")}
+            return
+        
+        params = self._generation_settings()
+        router = get_llm_router()
+        router.configure(params["use_api"], params["api_config"] or None)
+        
+        async def attempt(backend: LLMBackend) -> AsyncIterator[Dict]:
+            prompt, backend_params, ollama_state, docs, metas, context_stats = self._backend_prompt(
+                backend, question, context_docs, metadatas, params, session
+            )
+            sources = self._extract_sources_with_context(metas, docs)
+            yield {"type": "sources", "sources": sources, "sources_count": len(sources),
+                   "context_stats": context_stats}
+            async for event in backend.stream(prompt, backend_params, ollama_state):
+                yield event
+        
+        parts = []
+        first_token_ms = None
+        # Поток может оборваться без финального события
+        final = {"data": {}, "state": None, "finish_reason": None, "usage": {}, "backend": None}
+        generation_start = time.perf_counter()
+        try:
+            async for event in router.stream(attempt, params["use_api"]):
+                if event["type"] == "delta":
+                    if first_token_ms is None:
+                        first_token_ms = round((time.perf_counter() - start) * 1000, 1)
+                    parts.append(event["text"])
+                    yield {"type": "delta", "text": event["text"]}
+                elif event["type"] == "sources":
+                    yield event
+                elif event["type"] == "done":
+                    final = event
+        except NoBackendAvailable as e:
+            logger.error(f"LLM generation failed: {e}")
+            yield {"type": "error", "message": self._generation_error(e)}
+            return
+        except Exception as e:
+            logger.error(f"LLM stream failed: {e}")
+            yield {"type": "error", "message": f"Ошибка при обращении к модели: {str(e)}"}
+            return
+        
+        answer = "".join(parts)
+        if final["data"]:
+            timings = self._ollama_timings(final["data"])
+        else:
+            timings = {"generation_ms": round((time.perf_counter() - generation_start) * 1000, 1)}
+        if session:
+            session.add_turn(question, answer, final["state"], params["model"])
+        done = {
+            "type": "done",
+            "question": question,
+            "answer": answer,
+            "timings": {"retrieval_ms": retrieval_ms, **retrieval_timings, "first_token_ms": first_token_ms, **timings},
+            "finish_reason": final["finish_reason"],
+            "usage": final["usage"],
+            "backend": final["backend"]
+        }
+        if session:
+            done["session_id"] = session.session_id
+        yield done
+    
+    @staticmethod
+    def _session_state(session: Optional[ChatSession], params: Dict) -> Optional[List[int]]:
+        """Get Ollama token state to continue the session from, if it is still usable"""
+        if not session or not session.ollama_context or params["use_api"]:
+            return None
+        if session.ollama_model != params["model"]:
+            session.reset_context()
+            return None
+        # Длинное состояние вытеснило бы контекст документов: переходим на текстовое резюме
+        if len(session.ollama_context) > params["options"]["num_ctx"] * config.SESSION_CONTEXT_SHARE:
+            session.reset_context()
+            return None
+        return session.ollama_context
+    
+    def _retrieve(self, question: str, source_types: Optional[List[str]] = None,
+                  rerank_by: Optional[float] = None,
+                  deadline: Optional[float] = None) -> Tuple[List[str], List[Dict], Dict]:
+        """
+        Embed question and search for relevant chunks, returns chunks, metadatas and rerank timings
+        
+        Args:
+            rerank_by: time.monotonic() after which reranking is skipped to meet the request deadline
+            deadline: time.monotonic() of the request deadline, checked between stages
+        
+        Raises:
+            asyncio.TimeoutError: If the deadline passed before a stage started
+        """
+        # wait_for не останавливает поток: после дедлайна следующие этапы не запускаются
+        self._check_deadline(deadline, "embedding")
+        # Generate embedding for question
+        question_embedding = self.embedding_generator.generate_embedding(question)
+        self._check_deadline(deadline, "search")
+        
+        if self.reranker:
+            # Берем больше кандидатов, отбор делает кросс-энкодер
+            search_results = self.vector_store.search(
+                question_embedding,
+                top_k=config.RERANK_CANDIDATES,
+                source_types=source_types,
+                max_distance=config.RETRIEVAL_MAX_DISTANCE
+            )
+        else:
+            # Search for relevant documents (only in shards of requested source types).
+            # Нерелевантный хвост отсекается, простые вопросы получают меньше чанков
+            search_results = self.vector_store.search(
+                question_embedding,
+                top_k=config.RETRIEVAL_MAX_K,
+                source_types=source_types,
+                max_distance=config.RETRIEVAL_MAX_DISTANCE,
+                relative_gap=config.RETRIEVAL_RELATIVE_GAP,
+                min_k=config.RETRIEVAL_MIN_K
+            )
+        
+        # Extract context from search results
+        context_docs = search_results.get('documents', [[]])[0]
+        metadatas = search_results.get('metadatas', [[]])[0]
+        if not self.reranker or not context_docs:
+            return context_docs, metadatas, {}
+        self._check_deadline(deadline, "rerank")
+        if rerank_by is not None and time.monotonic() + config.RERANK_BUDGET_MS / 1000 > rerank_by:
+            # Поиск исчерпал свою долю дедлайна: оставляем порядок плотного поиска
+            logger.info("Rerank skipped to meet request deadline")
+            return context_docs[:config.RERANK_TOP_K], metadatas[:config.RERANK_TOP_K], {}
+        
+        order, rerank_stats = self.reranker.rerank(
+            question, search_results['ids'][0], context_docs, config.RERANK_TOP_K
+        )
+        logger.debug(f"Rerank: {rerank_stats}")
+        timings = {"rerank_ms": rerank_stats["rerank_ms"]} if rerank_stats["reranked"] else {}
+        return [context_docs[i] for i in order], [metadatas[i] for i in order], timings
+    
+    def _prepare_prompt(self, question: str, context_docs: List[str], metadatas: List[Dict], params: Dict,
+                        history: str = "", reserved_tokens: int = 0) -> Tuple[str, List[str], List[Dict], Dict]:
+        """
+        Fit retrieved chunks into the prompt
+        
+        Args:
+            history: Dialogue history to include in the prompt
+            reserved_tokens: Window tokens already taken by continued Ollama state
+        
+        Returns:
+            Prompt, chunks and metadatas that made it into the prompt, context stats
+        """
+        if not config.CONTEXT_PACKING:
+            # Старый режим: обрезка склеенного контекста по context_length символов
+            context = "\n\n".join(context_docs)[:params["context_length"]]
+            return self._build_prompt(question, context, history), context_docs, metadatas, {}
+        
+        if params["use_api"] and params["api_config"]:
+            num_ctx, num_predict = config.API_CONTEXT_TOKENS, 0
+        else:
+            num_ctx, num_predict = params["options"]["num_ctx"] - reserved_tokens, params["options"]["num_predict"]
+        
+        budget = self.context_builder.budget(self._build_prompt(question, "", history), num_ctx, num_predict)
+        packed = self.context_builder.pack(context_docs, budget, metadatas)
+        
+        # Склеенные соседние чанки одного документа возвращаются как один фрагмент
+        packed_metadatas = []
+        for block in packed["blocks"]:
+            metadata = dict(metadatas[block[0]] or {})
+            if len(block) > 1:
+                metadata['merged_chunks'] = [metadatas[i].get('chunk') for i in block]
+            packed_metadatas.append(metadata)
+        
+        context_stats = {
+            "tokens": packed["tokens"],
+            "budget": budget,
+            "chunks_used": sum(len(block) for block in packed["blocks"]),
+            "chunks_retrieved": len(context_docs),
+            "duplicates_dropped": packed["duplicates"],
+            "saved_tokens": packed["saved_tokens"]
+        }
+        if packed["saved_tokens"]:
+            logger.info(f"Context dedup saved {packed['saved_tokens']} prompt tokens")
+        return self._build_prompt(question, packed["text"], history), packed["texts"], packed_metadatas, context_stats
+    
+    def _build_result(self, question: str, answer: str, context_docs: List[str], metadatas: List[Dict],
+                      timings: Dict, context_stats: Dict) -> Dict:
+        """Build query result with unique sources"""
+        # Extract unique sources with full context
+        sources = self._extract_sources_with_context(metadatas, context_docs)
+        return {
+            "question": question,
+            "answer": answer,
+            "context": context_docs,
+            "sources": sources,
+            "sources_count": len(sources),
+            "timings": timings,
+            "context_stats": context_stats
+        }
+    
+    @staticmethod
+    def _empty_result(question: str, answer: str) -> Dict:
+        """Build result without sources"""
+        return {
+            "question": question,
+            "answer": answer,
+            "context": [],
+            "sources": [],
+            "sources_count": 0
+        }
     
     def _extract_sources(self, metadatas: List[Dict]) -> List[Dict]:
         """Extract unique sources from metadata"""
@@ -99,10 +342,13 @@ class RAGEngine:
                         'chunks': []
                     }
                 
-                sources_dict[source_name]['chunks'].append({
+                chunk = {
                     'chunk_id': metadata.get('chunk', i),
                     'content': context
-                })
+                }
+                if 'page' in metadata:
+                    chunk['page'] = metadata['page']
+                sources_dict[source_name]['chunks'].append(chunk)
         
         # Сортируем чанки по ID
         for source in sources_dict.values():
@@ -110,114 +356,133 @@ class RAGEngine:
         
         return list(sources_dict.values())
     
-    def _generate_answer(self, question: str, context: str) -> str:
-        """Generate answer using Ollama or external API"""
-        # Получаем настройки
-        if self.settings_manager:
-            # Общие настройки
-            context_length = self.settings_manager.get('context_length', 300)
-            
+    def _generation_settings(self) -> Dict:
+        """Collect generation parameters from settings"""
+        # Без менеджера настроек используются значения по умолчанию
+        get = self.settings_manager.get if self.settings_manager else {}.get
+        
+        return {
+            "context_length": get('context_length', 300),
             # Проверяем, используется ли API модель
-            use_api = self.settings_manager.get('use_api_model', False)
-            api_config = self.settings_manager.get('api_model_config', {})
-            
+            "use_api": get('use_api_model', False),
+            "api_config": get('api_model_config', {}),
             # Параметры для Ollama (применяются только к локальным моделям)
-            if not use_api:
-                temperature = self.settings_manager.get('temperature', 0.1)
-                num_predict = self.settings_manager.get('num_predict', 80)
-                num_ctx = self.settings_manager.get('num_ctx', 512)
-                top_k = self.settings_manager.get('top_k', 10)
-                top_p = self.settings_manager.get('top_p', 0.5)
-                repeat_penalty = self.settings_manager.get('repeat_penalty', 1.1)
-                model = self.settings_manager.get('model', config.OLLAMA_MODEL)
-        else:
-            context_length = 300
-            use_api = False
-            api_config = {}
-            # Параметры по умолчанию для Ollama
-            temperature = 0.1
-            num_predict = 80
-            num_ctx = 512
-            top_k = 10
-            top_p = 0.5
-            repeat_penalty = 1.1
-            model = config.OLLAMA_MODEL
-        
-        # Сокращаем контекст
-        short_context = context[:context_length] if len(context) > context_length else context
-        
+            "model": get('model', config.OLLAMA_MODEL),
+            "options": {
+                "temperature": get('temperature', 0.1),
+                "num_predict": get('num_predict', 80),
+                "num_ctx": get('num_ctx', 512),
+                "num_thread": 4,
+                "top_k": get('top_k', 10),
+                "top_p": get('top_p', 0.5),
+                "repeat_penalty": get('repeat_penalty', 1.1)
+            }
+        }
+    
+    @staticmethod
+    def _build_prompt(question: str, context: str, history: str = "") -> str:
+        """Build short prompt for fast generation"""
         # Упрощенный промпт для быстрой генерации
-        prompt = f"""Контекст: {short_context}
+        prompt = f"""Контекст: {context}
 
 Вопрос: {question}
 Краткий ответ:"""
+        if history:
+            prompt = f"История диалога:\n{history}\n\n{prompt}"
+        return prompt
+    
+    @staticmethod
+    def _check_deadline(deadline: Optional[float], stage: str) -> None:
+        """Raise asyncio.TimeoutError if the request deadline has passed"""
+        if deadline is not None and time.monotonic() >= deadline:
+            raise asyncio.TimeoutError(f"Request deadline passed before {stage}")
+    
+    async def _route_answer(self, question: str, context_docs: List[str], metadatas: List[Dict], params: Dict,
+                            session: Optional[ChatSession] = None, deadline: Optional[float] = None) -> Dict:
+        """
+        Generate answer on the best available LLM backend, failing over to the other one
         
-        # Используем API модель, если настроена
-        if use_api and api_config:
-            try:
-                if not self.api_connector:
-                    self.api_connector = APIModelConnector(
-                        api_type=api_config.get('api_type'),
-                        api_key=api_config.get('api_key'),
-                        api_url=api_config.get('api_url'),
-                        model_name=api_config.get('model_name')
-                    )
-                
-                logger.info(f"Using API model: {api_config.get('api_type')} - {api_config.get('model_name')}")
-                logger.debug(f"Prompt length: {len(prompt)}, Context length: {len(short_context)}, Question: {question[:100]}")
-                
-                # Оптимальные параметры для API моделей (не ограничиваем пользовательскими настройками)
-                api_temperature = 0.7  # Оптимально для большинства API
-                api_max_tokens = 2000  # Достаточно для полного ответа
-                
-                # Специфичные настройки для разных API
-                api_type = api_config.get('api_type', '').lower()
-                if api_type == 'gemini':
-                    # Gemini 2.5 нужно больше токенов из-за thinking
-                    api_max_tokens = 2000
-                elif api_type == 'openai':
-                    # OpenAI хорошо работает с меньшими значениями
-                    api_max_tokens = 1000
-                elif api_type == 'anthropic':
-                    # Claude хорошо работает с умеренными значениями
-                    api_max_tokens = 1500
-                
-                result = self.api_connector.generate(prompt, api_temperature, api_max_tokens)
-                
-                if not result or result.strip() == "":
-                    logger.warning("API returned empty result")
-                    return "Не удалось получить ответ от модели. Попробуйте переформулировать вопрос."
-                
-                return result
-            except Exception as e:
-                logger.error(f"API error: {str(e)}")
-                return f"Ошибка при обращении к API: {str(e)}"
+        The prompt is built for each backend tried: context budget and dialogue
+        history depend on whether it is Ollama (with saved token state) or an API model.
         
-        # Используем Ollama
-        try:
-            response = requests.post(
-                f"{config.OLLAMA_BASE_URL}/api/generate",
-                json={
-                    "model": model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": temperature,
-                        "num_predict": num_predict,
-                        "num_ctx": num_ctx,
-                        "num_thread": 4,
-                        "top_k": top_k,
-                        "top_p": top_p,
-                        "repeat_penalty": repeat_penalty
-                    }
-                },
-                timeout=config.OLLAMA_TIMEOUT
+        Args:
+            deadline: time.monotonic() by which the answer is needed; if generation
+                runs out of time, an extractive answer is returned instead
+        
+        Returns:
+            Dict with answer, timings, packed context, Ollama token state and backend name
+        """
+        router = get_llm_router()
+        router.configure(params["use_api"], params["api_config"] or None)
+        
+        async def attempt(backend: LLMBackend) -> Dict:
+            prompt, backend_params, ollama_state, docs, metas, context_stats = self._backend_prompt(
+                backend, question, context_docs, metadatas, params, session
             )
-            response.raise_for_status()
-            return response.json().get("response", "Ошибка генерации ответа")
-        except requests.exceptions.Timeout:
+            start = time.perf_counter()
+            generated = await backend.generate(prompt, backend_params, ollama_state)
+            if backend.kind == "ollama":
+                timings = self._ollama_timings(generated["data"])
+            else:
+                timings = {"generation_ms": round((time.perf_counter() - start) * 1000, 1)}
+            return {
+                "answer": generated["answer"],
+                "usage": generated["usage"],
+                "timings": timings,
+                "context_docs": docs,
+                "metadatas": metas,
+                "context_stats": context_stats,
+                "state": generated["state"]
+            }
+        
+        timeout = config.LLM_DEADLINE
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+        try:
+            return await router.run(attempt, params["use_api"], timeout=timeout)
+        except NoBackendAvailable as e:
+            logger.error(f"LLM generation failed: {e}")
+            # Извлеченный ответ - только при истекшем дедлайне; отказ бэкендов показывается как ошибка
+            if deadline is not None and deadline - time.monotonic() <= 0:
+                sentences = extract_sentences(question, context_docs, config.EXTRACTIVE_SENTENCES)
+                answer = "Модель не успела сформировать ответ. Наиболее релевантные фрагменты документов:\n"
+                answer += "\n".join(f"- {sentence}" for sentence in sentences)
+                return {"answer": answer, "timings": {}, "context_docs": context_docs, "metadatas": metadatas,
+                        "context_stats": {}, "state": None, "backend": None, "fallback": "extractive"}
+            return {"answer": self._generation_error(e), "timings": {}, "context_docs": context_docs,
+                    "metadatas": metadatas, "context_stats": {}, "state": None, "backend": None}
+    
+    def _backend_prompt(self, backend: LLMBackend, question: str, context_docs: List[str], metadatas: List[Dict],
+                        params: Dict, session: Optional[ChatSession]) -> Tuple:
+        """
+        Build prompt for a backend
+        
+        Returns:
+            Prompt, backend params, Ollama state to continue from, packed chunks, their metadatas, context stats
+        """
+        backend_params = {**params, "use_api": backend.kind == "api"}
+        ollama_state = self._session_state(session, backend_params) if backend.kind == "ollama" else None
+        # История передается текстом, только если Ollama не продолжает сохраненное состояние
+        history = session.history_text() if session and ollama_state is None else ""
+        prompt, docs, metas, context_stats = self._prepare_prompt(
+            question, context_docs, metadatas, backend_params, history, reserved_tokens=len(ollama_state or [])
+        )
+        return prompt, backend_params, ollama_state, docs, metas, context_stats
+    
+    @staticmethod
+    def _generation_error(error: NoBackendAvailable) -> str:
+        """Get user-facing message for a failed generation"""
+        cause = error.__cause__
+        if isinstance(cause, (asyncio.TimeoutError, httpx.TimeoutException)):
             return "Превышено время ожидания ответа от модели"
-        except requests.exceptions.ConnectionError:
+        if isinstance(cause, httpx.ConnectError):
             return "Ошибка подключения к Ollama. Убедитесь, что сервис запущен"
-        except Exception as e:
-            return f"Ошибка при обращении к Ollama: {str(e)}"
+        return f"Ошибка при обращении к модели: {str(error)}"
+    
+    @staticmethod
+    def _ollama_timings(data: Dict) -> Dict:
+        """Get generation timings, warning when the request paid for a model load"""
+        timings = ollama_timings(data)
+        if timings["load_ms"] >= config.OLLAMA_COLD_LOAD_MS:
+            logger.warning(f"Model {data.get('model')} was loaded during request: {timings['load_ms']} ms")
+        return timings
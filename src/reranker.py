@@ -0,0 +1,109 @@
+"""Cross-encoder reranking of retrieved chunks"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class Reranker:
+    """Rescore dense retrieval candidates with a small CPU cross-encoder"""
+    
+    def __init__(self, model_name: str = config.RERANK_MODEL):
+        """
+        Initialize reranker (model is loaded on first use)
+        
+        Args:
+            model_name: sentence-transformers CrossEncoder model
+        """
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._in_flight = 0
+        # Скользящая оценка времени на одну пару (вопрос, чанк)
+        self._pair_ms: Optional[float] = None
+    
+    @property
+    def model(self):
+        """Get cross-encoder, loading it on first use"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    logger.info(f"Loading rerank model: {self.model_name}")
+                    self._model = CrossEncoder(self.model_name, max_length=config.RERANK_MAX_LENGTH, device="cpu")
+        return self._model
+    
+    def rerank(self, question: str, ids: List[str], documents: List[str], top_k: int) -> Tuple[List[int], Dict]:
+        """
+        Order candidates by cross-encoder score
+        
+        Args:
+            question: User question
+            ids: Chunk IDs in dense retrieval order (cache keys)
+            documents: Chunk texts
+            top_k: Number of candidates to keep
+        
+        Returns:
+            Indices of the best candidates and rerank stats
+        """
+        start = time.perf_counter()
+        with self._lock:
+            if self._in_flight >= config.RERANK_MAX_IN_FLIGHT:
+                # CPU занят другим реранкингом: оставляем порядок плотного поиска
+                logger.info("Rerank skipped under load, using dense order")
+                return list(range(min(top_k, len(ids)))), {"reranked": False, "skipped": "busy"}
+            
+            scores = {}
+            for i, chunk_id in enumerate(ids):
+                key = (question, chunk_id)
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[i] = self._cache[key]
+            
+            # В бюджет времени укладываем только лучших кандидатов плотного поиска
+            candidates = len(ids)
+            if self._pair_ms:
+                affordable = int(config.RERANK_BUDGET_MS / self._pair_ms)
+                while candidates > 0 and sum(1 for i in range(candidates) if i not in scores) > affordable:
+                    candidates -= 1
+            uncached = [i for i in range(candidates) if i not in scores]
+            if uncached:
+                self._in_flight += 1
+        
+        if uncached:
+            try:
+                # Один батчевый проход по всем некэшированным парам
+                pair_start = time.perf_counter()
+                predicted = self.model.predict(
+                    [(question, documents[i]) for i in uncached],
+                    batch_size=len(uncached),
+                    show_progress_bar=False
+                )
+                pair_ms = (time.perf_counter() - pair_start) * 1000 / len(uncached)
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+            
+            with self._lock:
+                self._pair_ms = pair_ms if self._pair_ms is None else 0.8 * self._pair_ms + 0.2 * pair_ms
+                for i, score in zip(uncached, predicted):
+                    scores[i] = float(score)
+                    self._cache[(question, ids[i])] = float(score)
+                while len(self._cache) > config.RERANK_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        
+        # Переоцененные кандидаты идут первыми, остальные - в порядке плотного поиска
+        reranked = sorted((i for i in range(candidates) if i in scores), key=lambda i: scores[i], reverse=True)
+        order = (reranked + [i for i in range(len(ids)) if i not in reranked])[:top_k]
+        return order, {
+            "reranked": True,
+            "candidates": len(ids),
+            "scored": len(reranked),
+            "cached": len(reranked) - len(uncached),
+            "rerank_ms": round((time.perf_counter() - start) * 1000, 1)
+        }
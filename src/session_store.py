@@ -0,0 +1,157 @@
+"""Multi-turn chat sessions kept in memory"""
+import asyncio
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+import config
+
+_SENTENCE = re.compile(r'(?<=[.!?…])\s+')
+
+
+def _first_sentence(text: str, limit: int = 200) -> str:
+    """Get first sentence of a text, cut to limit characters"""
+    sentence = _SENTENCE.split(text.strip(), maxsplit=1)[0]
+    return sentence[:limit]
+
+
+class ChatSession:
+    """Bounded dialogue history with an extractive summary of older turns"""
+    
+    def __init__(self, session_id: str, max_turns: int = config.SESSION_MAX_TURNS):
+        self.session_id = session_id
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.turns: deque = deque(maxlen=max_turns)
+        self.summary = ""
+        # Состояние токенов Ollama после последнего ответа (действительно только для той же модели)
+        self.ollama_context: Optional[List[int]] = None
+        self.ollama_model: Optional[str] = None
+        # Ходы одной сессии выполняются по очереди
+        self.lock = asyncio.Lock()
+    
+    def add_turn(self, question: str, answer: str, ollama_context: Optional[List[int]] = None,
+                 model: Optional[str] = None) -> None:
+        """Append a turn, folding the oldest one into the summary when history is full"""
+        if len(self.turns) == self.turns.maxlen:
+            oldest = self.turns[0]
+            line = f"- {_first_sentence(oldest['question'])} — {_first_sentence(oldest['answer'])}"
+            lines = [item for item in self.summary.split("\n") if item] + [line]
+            # Резюме ограничено по длине: старые строки вытесняются
+            while len(lines) > 1 and sum(len(item) + 1 for item in lines) > config.SESSION_SUMMARY_CHARS:
+                lines.pop(0)
+            self.summary = "\n".join(lines)
+        
+        self.turns.append({"question": question, "answer": answer, "time": time.time()})
+        self.ollama_context = ollama_context
+        self.ollama_model = model if ollama_context else None
+        self.last_used = time.time()
+    
+    def reset_context(self) -> None:
+        """Forget Ollama token state, history is then sent as text"""
+        self.ollama_context = None
+        self.ollama_model = None
+    
+    def history_text(self) -> str:
+        """Get summary and recent turns for the prompt"""
+        parts = []
+        if self.summary:
+            parts.append(f"Ранее обсуждалось:\n{self.summary}")
+        for turn in self.turns:
+            parts.append(f"Вопрос: {turn['question']}\nОтвет: {turn['answer']}")
+        return "\n\n".join(parts)
+    
+    def retrieval_query(self, question: str) -> str:
+        """Get search query for a follow-up (short questions depend on the previous one)"""
+        if not self.turns:
+            return question
+        return f"{self.turns[-1]['question']} {question}"
+    
+    def to_dict(self) -> Dict:
+        """Get session state for the API"""
+        return {
+            "session_id": self.session_id,
+            "created_at": self.created_at,
+            "last_used": self.last_used,
+            "turns": list(self.turns),
+            "summary": self.summary,
+            "ollama_context_tokens": len(self.ollama_context or [])
+        }
+
+
+class SessionStore:
+    """LRU store of chat sessions with idle expiry"""
+    
+    def __init__(self, max_sessions: int = config.SESSION_MAX_COUNT, idle_ttl: int = config.SESSION_IDLE_TTL):
+        """
+        Initialize session store
+        
+        Args:
+            max_sessions: Sessions kept before the least recently used is evicted
+            idle_ttl: Seconds of inactivity after which a session expires
+        """
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _expired(self, session: ChatSession) -> bool:
+        return time.time() - session.last_used > self.idle_ttl
+    
+    def create(self, session_id: Optional[str] = None) -> ChatSession:
+        """Create a new session"""
+        session = ChatSession(session_id or uuid.uuid4().hex)
+        with self._lock:
+            self._sessions[session.session_id] = session
+            self._sessions.move_to_end(session.session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+    
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        """Get session by ID (None if unknown or expired)"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if self._expired(session):
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            session.last_used = time.time()
+            return session
+    
+    def get_or_create(self, session_id: str) -> ChatSession:
+        """Get session by ID, creating it if needed"""
+        return self.get(session_id) or self.create(session_id)
+    
+    def delete(self, session_id: str) -> bool:
+        """Delete session"""
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+    
+    def cleanup_expired(self) -> int:
+        """Remove expired sessions, returns number removed"""
+        with self._lock:
+            expired = [session_id for session_id, session in self._sessions.items() if self._expired(session)]
+            for session_id in expired:
+                del self._sessions[session_id]
+        return len(expired)
+    
+    def size(self) -> int:
+        """Get number of stored sessions"""
+        return len(self._sessions)
+
+
+# Общее хранилище для API сервера и Telegram бота
+_session_store: Optional[SessionStore] = None
+
+
+def get_session_store() -> SessionStore:
+    """Get shared session store"""
+    global _session_store
+    if _session_store is None:
+        _session_store = SessionStore()
+    return _session_store
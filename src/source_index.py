@@ -0,0 +1,136 @@
+"""Reverse index from sources to chunk IDs"""
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# Поля метаданных, по которым удаляются источники
+SOURCE_KEYS = ("file_hash", "web_site")
+
+
+class SourceIndex:
+    """SQLite-backed mapping of source keys (file_hash, web_site) to chunk IDs"""
+
+    def __init__(self, db_path: Path):
+        """
+        Initialize source index
+
+        Args:
+            db_path: Path to SQLite database file
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        
+        # Индекс производный от коллекций: старую схему без шардов просто пересоздаем
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(source_chunks)")]
+        if columns and "shard" not in columns:
+            self._conn.execute("DROP TABLE source_chunks")
+        
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS source_chunks (
+                key_type TEXT NOT NULL,
+                key TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                shard TEXT NOT NULL,
+                PRIMARY KEY (key_type, key, chunk_id)
+            ) WITHOUT ROWID"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_source_chunks_chunk ON source_chunks (chunk_id)"
+        )
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Open a write transaction
+
+        The transaction is rolled back if the block raises, so callers can
+        wrap the matching vector store write and keep both sides consistent.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            else:
+                self._conn.execute("COMMIT")
+
+    @staticmethod
+    def _rows(shard: str, ids: List[str], metadatas: List[Dict]) -> Iterator[tuple]:
+        """Build (key_type, key, chunk_id, shard) rows from chunk metadata"""
+        for chunk_id, metadata in zip(ids, metadatas):
+            if not metadata:
+                continue
+            for key_type in SOURCE_KEYS:
+                value = metadata.get(key_type)
+                if value:
+                    yield (key_type, str(value), chunk_id, shard)
+
+    def add(self, conn: sqlite3.Connection, shard: str, ids: List[str], metadatas: List[Dict]) -> None:
+        """Record chunk IDs of one shard under their source keys (inside a transaction)"""
+        conn.executemany(
+            "INSERT OR REPLACE INTO source_chunks (key_type, key, chunk_id, shard) VALUES (?, ?, ?, ?)",
+            self._rows(shard, ids, metadatas)
+        )
+
+    def remove_ids(self, conn: sqlite3.Connection, ids: Iterable[str]) -> None:
+        """Forget chunk IDs under every source key (inside a transaction)"""
+        conn.executemany(
+            "DELETE FROM source_chunks WHERE chunk_id = ?",
+            ((chunk_id,) for chunk_id in ids)
+        )
+
+    def get_ids(self, key_type: str, keys: Iterable[str]) -> Dict[str, List[str]]:
+        """Get chunk IDs grouped by shard for one or more sources of the same key type"""
+        keys = list(keys)
+        if not keys:
+            return {}
+
+        ids: Dict[str, List[str]] = {}
+        seen = set()
+        with self._lock:
+            # SQLite ограничивает число параметров в запросе
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                cursor = self._conn.execute(
+                    f"SELECT chunk_id, shard FROM source_chunks WHERE key_type = ? AND key IN ({placeholders})",
+                    [key_type, *batch]
+                )
+                for chunk_id, shard in cursor:
+                    if chunk_id not in seen:
+                        seen.add(chunk_id)
+                        ids.setdefault(shard, []).append(chunk_id)
+        return ids
+
+    def chunk_count(self) -> int:
+        """Get number of distinct chunk IDs in the index"""
+        with self._lock:
+            row = self._conn.execute("SELECT COUNT(DISTINCT chunk_id) FROM source_chunks").fetchone()
+        return row[0] if row else 0
+
+    def shard_chunk_count(self, shard: str) -> int:
+        """Get number of distinct chunk IDs recorded for a shard"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(DISTINCT chunk_id) FROM source_chunks WHERE shard = ?", (shard,)
+            ).fetchone()
+        return row[0] if row else 0
+    
+    def clear(self, conn: Optional[sqlite3.Connection] = None, shard: Optional[str] = None) -> None:
+        """Remove all entries, or only the entries of one shard"""
+        if conn is None:
+            with self.transaction() as conn:
+                self.clear(conn, shard)
+            return
+        if shard is None:
+            conn.execute("DELETE FROM source_chunks")
+        else:
+            conn.execute("DELETE FROM source_chunks WHERE shard = ?", (shard,))
@@ -1,11 +1,14 @@
 """Telegram Bot для RAG Agent"""
 import logging
 import asyncio
+import time
 from typing import Optional
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 from src.rag_engine import RAGEngine
 from src.settings_manager import SettingsManager
+from src.session_store import ChatSession, get_session_store
+import config
 
 logger = logging.getLogger(__name__)
 
@@ -36,7 +39,8 @@ class TelegramBot:
             "Команды:\n"
             "/start - Показать это сообщение\n"
             "/help - Помощь\n"
-            "/stats - Статистика системы"
+            "/stats - Статистика системы\n"
+            "/reset - Начать новый диалог"
         )
         await update.message.reply_text(welcome_message)
         logger.info(f"User {update.effective_user.id} started the bot")
@@ -55,7 +59,8 @@ class TelegramBot:
             "Команды:\n"
             "/start - Начать работу\n"
             "/help - Эта справка\n"
-            "/stats - Статистика"
+            "/stats - Статистика\n"
+            "/reset - Забыть историю диалога"
         )
         await update.message.reply_text(help_message)
     
@@ -65,21 +70,21 @@ class TelegramBot:
             if not self.rag_engine:
                 self.rag_engine = RAGEngine(settings_manager=self.settings_manager)
             
-            from src.vector_store import VectorStore
-            vector_store = VectorStore()
+            from src.vector_store import get_vector_store
+            vector_store = get_vector_store()
             
             chunks_count = vector_store.get_collection_count()
             
             # Получаем статистику
-            collection_data = vector_store.collection.get()
+            all_metadatas = vector_store.get_all_metadatas()
             documents_count = 0
             websites_count = 0
             
-            if collection_data and collection_data.get('metadatas'):
+            if all_metadatas:
                 unique_files = set()
                 unique_sites = set()
                 
-                for metadata in collection_data['metadatas']:
+                for metadata in all_metadatas:
                     if metadata:
                         if metadata.get('web_url'):
                             unique_sites.add(metadata.get('web_site', 'Unknown'))
@@ -103,6 +108,16 @@ class TelegramBot:
             logger.error(f"Error getting stats: {e}")
             await update.message.reply_text("❌ Ошибка получения статистики")
     
+    @staticmethod
+    def _session_id(update: Update) -> str:
+        """Get chat session ID for a Telegram chat"""
+        return f"telegram:{update.effective_chat.id}"
+    
+    async def reset_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /reset"""
+        get_session_store().delete(self._session_id(update))
+        await update.message.reply_text("🔄 История диалога очищена")
+    
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик текстовых сообщений"""
         try:
@@ -118,22 +133,18 @@ class TelegramBot:
             if not self.rag_engine:
                 self.rag_engine = RAGEngine(settings_manager=self.settings_manager)
             
-            # Получаем ответ от RAG системы
-            result = self.rag_engine.query(user_message)
-            
-            # Формируем ответ
-            answer = result.get('answer', 'Не удалось найти ответ')
-            sources_count = result.get('sources_count', 0)
-            
-            response = f"{answer}\n\n"
-            
-            if sources_count > 0:
-                response += f"📚 Источников использовано: {sources_count}"
-            else:
-                response += "ℹ️ Ответ сгенерирован без использования документов"
-            
-            # Отправляем ответ
-            await update.message.reply_text(response)
+            # Получаем ответ от RAG системы (каждый чат - отдельный диалог)
+            session = get_session_store().get_or_create(self._session_id(update))
+            async with session.lock:
+                if config.TELEGRAM_STREAM:
+                    sources_count = await self._stream_answer(update, user_message, session)
+                else:
+                    result = await self.rag_engine.aquery(user_message, session=session)
+                    sources_count = result.get('sources_count', 0)
+                    # Отправляем ответ
+                    await update.message.reply_text(
+                        self._format_answer(result.get('answer', 'Не удалось найти ответ'), sources_count)
+                    )
             
             logger.info(f"Answered user {user_id} with {sources_count} sources")
             
@@ -144,6 +155,51 @@ class TelegramBot:
                 "Пожалуйста, попробуйте еще раз."
             )
     
+    async def _stream_answer(self, update: Update, question: str, session: ChatSession) -> int:
+        """Отправка ответа по мере генерации: одно сообщение редактируется, пока приходит текст"""
+        message = None
+        text = ""
+        last_edit = 0.0
+        sources_count = 0
+        result = {}
+        async for event in self.rag_engine.astream_query(question, session=session):
+            if event["type"] == "sources":
+                sources_count = event["sources_count"]
+            elif event["type"] == "delta":
+                text += event["text"]
+                # Telegram ограничивает частоту редактирования сообщений
+                if time.monotonic() - last_edit >= config.TELEGRAM_STREAM_EDIT_INTERVAL:
+                    last_edit = time.monotonic()
+                    try:
+                        if message is None:
+                            message = await update.message.reply_text(f"{text} …")
+                        else:
+                            await message.edit_text(f"{text} …")
+                    except Exception as e:
+                        logger.debug(f"Could not update streamed message: {e}")
+            else:
+                result = event
+        
+        answer = result.get('answer') or result.get('message') or text or 'Не удалось найти ответ'
+        sources_count = result.get('sources_count', sources_count)
+        response = self._format_answer(answer, sources_count)
+        if message is None:
+            await update.message.reply_text(response)
+        else:
+            await message.edit_text(response)
+        return sources_count
+    
+    @staticmethod
+    def _format_answer(answer: str, sources_count: int) -> str:
+        """Формирование текста ответа со сводкой по источникам"""
+        response = f"{answer}\n\n"
+        
+        if sources_count > 0:
+            response += f"📚 Источников использовано: {sources_count}"
+        else:
+            response += "ℹ️ Ответ сгенерирован без использования документов"
+        return response
+    
     async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик ошибок"""
         logger.error(f"Update {update} caused error {context.error}")
@@ -160,6 +216,7 @@ class TelegramBot:
             self.application.add_handler(CommandHandler("start", self.start_command))
             self.application.add_handler(CommandHandler("help", self.help_command))
             self.application.add_handler(CommandHandler("stats", self.stats_command))
+            self.application.add_handler(CommandHandler("reset", self.reset_command))
             self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
             self.application.add_error_handler(self.error_handler)
             
@@ -1,8 +1,21 @@
 """Vector store management using ChromaDB"""
 import chromadb
 from chromadb.config import Settings
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Iterable, Optional
+import hashlib
+import re
+import threading
+import numpy as np
 import config
+from src.source_index import SourceIndex
+from src.quantization import QuantizedIndex, exact_distances
+
+# Шард по умолчанию - исходная коллекция config.COLLECTION_NAME
+DEFAULT_SHARD = "default"
+SOURCE_TYPES = ("files", "web", "xwiki")
+# Во сколько раз больше кандидатов берется из шарда со старой метрикой перед пересчетом расстояний
+RESCORE_CANDIDATES = 4
 
 
 class VectorStore:
@@ -17,86 +30,606 @@ class VectorStore:
                 allow_reset=True
             )
         )
-        # Всегда используем одну и ту же коллекцию
-        self.collection = self.client.get_or_create_collection(
-            name=config.COLLECTION_NAME
+        # Шарды: имя шарда -> коллекция Chroma
+        self.collections: Dict[str, chromadb.Collection] = {}
+        self._discover_shards()
+        # Основная коллекция остается доступной для совместимости
+        self.collection = self._get_collection(DEFAULT_SHARD)
+        self._search_executor: Optional[ThreadPoolExecutor] = None
+        
+        # Обратный индекс источник -> ID чанков для удаления без сканирования метаданных
+        self.source_index = SourceIndex(config.SOURCE_INDEX_DB)
+        self._sync_source_index()
+        
+        outdated = self.outdated_shards()
+        if outdated:
+            print(f"Shards {outdated} use HNSW parameters different from config, "
+                  f"run scripts/rebuild_index.py to migrate them")
+    
+    @staticmethod
+    def _collection_name(shard: str) -> str:
+        """Get Chroma collection name for a shard"""
+        if shard == DEFAULT_SHARD:
+            return config.COLLECTION_NAME
+        return f"{config.COLLECTION_NAME}_{shard}"
+    
+    @staticmethod
+    def _shard_of(collection_name: str) -> Optional[str]:
+        """Get shard name of a Chroma collection (None for collections of other stores)"""
+        prefix = f"{config.COLLECTION_NAME}_"
+        if collection_name.endswith("__rebuild"):
+            return None
+        if collection_name == config.COLLECTION_NAME:
+            return DEFAULT_SHARD
+        if collection_name.startswith(prefix):
+            return collection_name[len(prefix):]
+        return None
+    
+    def _discover_shards(self):
+        """Load shards that already exist in the database"""
+        for collection in self.client.list_collections():
+            shard = self._shard_of(collection.name)
+            if shard is not None:
+                self.collections[shard] = collection
+    
+    def refresh_shards(self):
+        """
+        Re-read shards from the database
+        
+        Shards created or dropped through another client (a script, another
+        process) appear here, and handles of recreated collections are replaced.
+        """
+        collections = {}
+        for collection in self.client.list_collections():
+            shard = self._shard_of(collection.name)
+            if shard is None:
+                continue
+            current = self.collections.get(shard)
+            collections[shard] = current if current is not None and current.id == collection.id else collection
+        self.collections = collections
+        # Без основной коллекции (например, во время rebuild_shard) остается прежняя ссылка
+        self.collection = collections.get(DEFAULT_SHARD, self.collection)
+    
+    @staticmethod
+    def collection_metadata() -> Dict:
+        """HNSW index parameters for new collections"""
+        return {
+            "hnsw:space": config.VECTOR_METRIC,
+            "hnsw:M": config.HNSW_M,
+            "hnsw:construction_ef": config.HNSW_EF_CONSTRUCTION,
+            "hnsw:search_ef": config.HNSW_EF_SEARCH
+        }
+    
+    def _get_collection(self, shard: str):
+        """Get or create the collection of a shard"""
+        collection = self.collections.get(shard)
+        if collection is None:
+            # Для существующей коллекции Chroma игнорирует metadata и сохраняет старые параметры
+            collection = self.client.get_or_create_collection(
+                name=self._collection_name(shard),
+                metadata=self.collection_metadata()
+            )
+            self.collections[shard] = collection
+        return collection
+    
+    def outdated_shards(self) -> List[str]:
+        """Get shards whose HNSW parameters differ from config"""
+        # Значения по умолчанию Chroma для коллекций, созданных без metadata
+        chroma_defaults = {"hnsw:space": "l2", "hnsw:M": 16, "hnsw:construction_ef": 100, "hnsw:search_ef": 10}
+        expected = self.collection_metadata()
+        outdated = []
+        for shard, collection in self.collections.items():
+            current = {**chroma_defaults, **(collection.metadata or {})}
+            if any(current[key] != value for key, value in expected.items()):
+                outdated.append(shard)
+        return outdated
+    
+    def rebuild_shard(self, shard: str) -> int:
+        """
+        Migrate a shard to the HNSW parameters from config
+        
+        Records are copied with their IDs and embeddings into a new collection,
+        which then replaces the old one, so no re-embedding is needed.
+        
+        Returns:
+            Number of copied chunks
+        """
+        if shard not in self.collections:
+            raise ValueError(f"Unknown shard: {shard}")
+        
+        old_collection = self.collections[shard]
+        name = self._collection_name(shard)
+        temp_name = f"{name}__rebuild"
+        
+        # Остатки прерванной миграции
+        if any(collection.name == temp_name for collection in self.client.list_collections()):
+            self.client.delete_collection(temp_name)
+        new_collection = self.client.create_collection(name=temp_name, metadata=self.collection_metadata())
+        
+        count = old_collection.count()
+        batch_size = config.DELETE_BATCH_SIZE
+        for offset in range(0, count, batch_size):
+            batch = old_collection.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=batch_size,
+                offset=offset
+            )
+            new_collection.add(
+                ids=batch['ids'],
+                embeddings=batch['embeddings'],
+                documents=batch['documents'],
+                metadatas=batch['metadatas']
+            )
+        
+        self.client.delete_collection(name)
+        new_collection.modify(name=name)
+        self.collections[shard] = new_collection
+        if shard == DEFAULT_SHARD:
+            self.collection = new_collection
+        print(f"Shard {shard} rebuilt with {self.collection_metadata()} ({count} chunks)")
+        return count
+    
+    @staticmethod
+    def source_type_of(metadata: Dict) -> str:
+        """Get source type (files, web, xwiki) from chunk metadata"""
+        if metadata and metadata.get('web_url'):
+            return "web"
+        if metadata and metadata.get('xwiki_space'):
+            return "xwiki"
+        return "files"
+    
+    @staticmethod
+    def shard_source_type(shard: str) -> Optional[str]:
+        """Get source type stored in a shard (None for the mixed default shard)"""
+        source_type = shard.split("_", 1)[0]
+        return source_type if source_type in SOURCE_TYPES else None
+    
+    def shard_for(self, metadata: Dict) -> str:
+        """Choose shard for a chunk according to config.VECTOR_SHARDING"""
+        if config.VECTOR_SHARDING == "none":
+            return DEFAULT_SHARD
+        
+        source_type = self.source_type_of(metadata)
+        if config.VECTOR_SHARDING == "site" and source_type == "web":
+            # Имя коллекции Chroma: [a-zA-Z0-9._-], поэтому добавляем хеш исходного имени
+            site = metadata.get('web_site', '')
+            slug = re.sub(r'[^a-zA-Z0-9]+', '_', site).strip('_').lower()[:32]
+            site_hash = hashlib.md5(site.encode()).hexdigest()[:8]
+            return f"web_{slug}_{site_hash}" if slug else f"web_{site_hash}"
+        return source_type
+    
+    def _quantized_index(self, shard: str) -> Optional[QuantizedIndex]:
+        """Get compressed index of a shard (None when quantization is disabled)"""
+        if config.VECTOR_QUANTIZATION == "none":
+            return None
+        metric = (self.collections[shard].metadata or {}).get("hnsw:space", "l2")
+        return QuantizedIndex.open(
+            config.QUANTIZED_INDEX_DIR / shard,
+            config.VECTOR_QUANTIZATION,
+            metric,
+            config.PQ_SUBVECTORS
         )
     
-    def add_documents(self, texts: List[str], embeddings: List[List[float]], 
-                     metadatas: List[Dict] = None):
-        """Add documents to vector store"""
-        import hashlib
+    def _sync_quantized_index(self, shard: str) -> QuantizedIndex:
+        """Rebuild compressed index from stored embeddings if it is out of sync"""
+        index = self._quantized_index(shard)
+        collection = self.collections[shard]
+        with index.lock:
+            count = collection.count()
+            if index.count == count:
+                return index
+            
+            print(f"Building {config.VECTOR_QUANTIZATION} index for shard {shard} ({count} chunks)...")
+            ids, vectors = self.get_shard_embeddings(shard)
+            index.build(ids, vectors)
+        return index
+    
+    def get_shard_embeddings(self, shard: str):
+        """Get (ids, float32 matrix) of all embeddings stored in a shard"""
+        collection = self.collections[shard]
+        ids, vectors = [], []
+        batch_size = config.DELETE_BATCH_SIZE
+        for offset in range(0, collection.count(), batch_size):
+            batch = collection.get(include=["embeddings"], limit=batch_size, offset=offset)
+            ids.extend(batch['ids'])
+            vectors.extend(batch['embeddings'])
+        return ids, np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+    
+    def quantization_stats(self) -> Dict[str, Dict]:
+        """Get memory usage of compressed indexes per shard"""
+        if config.VECTOR_QUANTIZATION == "none":
+            return {}
+        return {shard: self._sync_quantized_index(shard).stats() for shard in list(self.collections)}
+    
+    def _sync_source_index(self):
+        """Rebuild source index from collection metadata if it is out of sync"""
+        count = sum(collection.count() for collection in self.collections.values())
+        if self.source_index.chunk_count() == count:
+            return
+        
+        print(f"Rebuilding source index for {count} chunks...")
+        batch_size = config.DELETE_BATCH_SIZE
+        with self.source_index.transaction() as conn:
+            self.source_index.clear(conn)
+            for shard, collection in self.collections.items():
+                shard_count = collection.count()
+                for offset in range(0, shard_count, batch_size):
+                    batch = collection.get(
+                        include=["metadatas"],
+                        limit=batch_size,
+                        offset=offset
+                    )
+                    self.source_index.add(conn, shard, batch['ids'], batch['metadatas'])
+        print("Source index rebuilt")
+    
+    def add_documents(self, texts: List[str], embeddings: List[List[float]],
+                     metadatas: List[Dict] = None, ids: List[str] = None):
+        """Add documents to vector store (ids are generated unless given, e.g. on bundle import)"""
         import time
         
-        # Убедимся, что коллекция существует
-        self._ensure_collection()
+        metadatas = metadatas or [{}] * len(texts)
         
         # Генерируем уникальные ID на основе хеша контента и timestamp
-        ids = []
-        for i, text in enumerate(texts):
-            content_hash = hashlib.md5(text.encode()).hexdigest()[:8]
-            timestamp = int(time.time() * 1000)
-            ids.append(f"doc_{content_hash}_{timestamp}_{i}")
-        
-        self.collection.add(
-            documents=texts,
-            embeddings=embeddings,
-            metadatas=metadatas or [{}] * len(texts),
-            ids=ids
-        )
+        if ids is None:
+            ids = []
+            for i, text in enumerate(texts):
+                content_hash = hashlib.md5(text.encode()).hexdigest()[:8]
+                timestamp = int(time.time() * 1000)
+                ids.append(f"doc_{content_hash}_{timestamp}_{i}")
+        
+        # Раскладываем чанки по шардам, сохраняя порядок внутри шарда
+        groups: Dict[str, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            groups.setdefault(self.shard_for(metadata), []).append(i)
+        
+        for shard, positions in groups.items():
+            self._ensure_collection(shard)
+            shard_ids = [ids[i] for i in positions]
+            shard_metadatas = [metadatas[i] for i in positions]
+            
+            shard_embeddings = [embeddings[i] for i in positions]
+            
+            # Индекс и коллекция обновляются вместе: при ошибке Chroma запись индекса откатывается
+            with self.source_index.transaction() as conn:
+                self.source_index.add(conn, shard, shard_ids, shard_metadatas)
+                self.collections[shard].add(
+                    documents=[texts[i] for i in positions],
+                    embeddings=shard_embeddings,
+                    metadatas=shard_metadatas,
+                    ids=shard_ids
+                )
+            
+            index = self._quantized_index(shard)
+            if index is not None:
+                with index.lock:
+                    index.add(shard_ids, shard_embeddings)
         print(f"Added {len(texts)} documents to vector store")
     
-    def search(self, query_embedding: List[float], top_k: int = config.TOP_K_RESULTS) -> Dict:
-        """Search for similar documents"""
-        # Убедимся, что коллекция существует
-        self._ensure_collection()
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k
+    def _shards_for_types(self, source_types: Optional[List[str]]) -> List[str]:
+        """Get shards that may contain the given source types"""
+        if not source_types:
+            return list(self.collections.keys())
+        return [
+            shard for shard in self.collections
+            if self.shard_source_type(shard) in source_types or self.shard_source_type(shard) is None
+        ]
+    
+    def _search_shard(self, shard: str, query_embedding: List[float], top_k: int) -> Dict:
+        """Search a single shard, distances are in VECTOR_METRIC whatever the shard metric is"""
+        self._ensure_collection(shard)
+        collection = self.collections[shard]
+        count = collection.count()
+        if count == 0:
+            return {'ids': [[]], 'documents': [[]], 'metadatas': [[]], 'distances': [[]]}
+        
+        space = (collection.metadata or {}).get("hnsw:space", "l2")
+        if space == config.VECTOR_METRIC:
+            return self._query_shard(shard, query_embedding, min(top_k, count))
+        
+        # Соседи в старой метрике отличаются от соседей в новой: берем кандидатов с запасом
+        results = self._query_shard(shard, query_embedding, min(top_k * RESCORE_CANDIDATES, count))
+        return self._rescore(collection, query_embedding, results, top_k)
+    
+    @staticmethod
+    def _rescore(collection, query_embedding: List[float], results: Dict, top_k: int) -> Dict:
+        """
+        Recompute distances of hits in VECTOR_METRIC from their stored embeddings
+        
+        Shards not yet rebuilt keep their old metric (l2 by default), and their
+        raw distances cannot be merged with or cut off like the others.
+        """
+        ids = results['ids'][0]
+        if not ids:
+            return results
+        stored = collection.get(ids=ids, include=["embeddings"])
+        by_id = dict(zip(stored['ids'], stored['embeddings']))
+        vectors = np.asarray([by_id[chunk_id] for chunk_id in ids], dtype=np.float32)
+        distances = exact_distances(np.asarray(query_embedding, dtype=np.float32), vectors, config.VECTOR_METRIC)
+        order = np.argsort(distances)[:top_k]
+        return {
+            'ids': [[ids[i] for i in order]],
+            'documents': [[results['documents'][0][i] for i in order]],
+            'metadatas': [[results['metadatas'][0][i] for i in order]],
+            'distances': [[float(distances[i]) for i in order]]
+        }
+    
+    def _query_shard(self, shard: str, query_embedding: List[float], n_results: int) -> Dict:
+        """Nearest chunks of a shard in the shard's own metric"""
+        collection = self.collections[shard]
+        if config.VECTOR_QUANTIZATION == "none":
+            return collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results
+            )
+        
+        # Грубый поиск по сжатым кодам, точное переранжирование короткого списка с диска
+        hits = self._sync_quantized_index(shard).search(
+            query_embedding, n_results, config.QUANTIZATION_RERANK_K
         )
-        return results
+        records = collection.get(ids=[chunk_id for chunk_id, _ in hits], include=["documents", "metadatas"])
+        by_id = {
+            chunk_id: (document, metadata)
+            for chunk_id, document, metadata in zip(records['ids'], records['documents'], records['metadatas'])
+        }
+        hits = [(chunk_id, distance) for chunk_id, distance in hits if chunk_id in by_id]
+        return {
+            'ids': [[chunk_id for chunk_id, _ in hits]],
+            'documents': [[by_id[chunk_id][0] for chunk_id, _ in hits]],
+            'metadatas': [[by_id[chunk_id][1] for chunk_id, _ in hits]],
+            'distances': [[distance for _, distance in hits]]
+        }
     
-    def _ensure_collection(self):
+    def search(self, query_embedding: List[float], top_k: int = config.TOP_K_RESULTS,
+               source_types: Optional[List[str]] = None, max_distance: Optional[float] = None,
+               relative_gap: Optional[float] = None, min_k: int = 1) -> Dict:
+        """
+        Search for similar documents
+        
+        Args:
+            query_embedding: Query vector
+            top_k: Number of results (upper bound when a cutoff is set)
+            source_types: Restrict search to these source types (files, web, xwiki)
+            max_distance: Drop results farther than this distance
+            relative_gap: Drop results less similar than (1 - relative_gap) x best similarity
+            min_k: Results kept despite relative_gap (max_distance is always enforced)
+        
+        Returns:
+            Chroma-style result dict, merged across shards by distance
+        """
+        self.refresh_shards()
+        shards = self._shards_for_types(source_types)
+        
+        def shard_top_k(shard: str) -> int:
+            # Смешанный шард фильтруется после поиска, поэтому запрашиваем больше
+            if source_types and self.shard_source_type(shard) is None:
+                return top_k * len(SOURCE_TYPES)
+            return top_k
+        
+        if len(shards) == 1:
+            shard_results = [self._search_shard(shards[0], query_embedding, shard_top_k(shards[0]))]
+        else:
+            if self._search_executor is None:
+                self._search_executor = ThreadPoolExecutor(
+                    max_workers=config.SEARCH_WORKERS,
+                    thread_name_prefix="shard-search"
+                )
+            futures = [
+                self._search_executor.submit(self._search_shard, shard, query_embedding, shard_top_k(shard))
+                for shard in shards
+            ]
+            shard_results = [future.result() for future in futures]
+        
+        # Объединяем результаты шардов и берем top_k по расстоянию
+        hits = []
+        for shard, results in zip(shards, shard_results):
+            for chunk_id, document, metadata, distance in zip(
+                results['ids'][0], results['documents'][0],
+                results['metadatas'][0], results['distances'][0]
+            ):
+                # Смешанный шард по умолчанию фильтруем по метаданным
+                if source_types and self.source_type_of(metadata) not in source_types:
+                    continue
+                hits.append((distance, chunk_id, document, metadata, shard))
+        
+        hits.sort(key=lambda hit: hit[0])
+        hits = self._cutoff(hits[:top_k], max_distance, relative_gap, min_k)
+        
+        return {
+            'ids': [[hit[1] for hit in hits]],
+            'documents': [[hit[2] for hit in hits]],
+            'metadatas': [[hit[3] for hit in hits]],
+            'distances': [[hit[0] for hit in hits]]
+        }
+    
+    def _cutoff(self, hits: List[tuple], max_distance: Optional[float], relative_gap: Optional[float],
+                min_k: int) -> List[tuple]:
+        """Drop the irrelevant tail of hits sorted by distance (all distances are in VECTOR_METRIC, see _rescore)"""
+        if max_distance is not None:
+            hits = [hit for hit in hits if hit[0] <= max_distance]
+        
+        if relative_gap is not None and hits:
+            best = hits[0][0]
+            if config.VECTOR_METRIC == "l2":
+                limit = best * (1 + relative_gap)
+            elif best < 1:
+                # Для cosine/ip сравниваем сходство (1 - distance): не меньше (1 - relative_gap) от лучшего
+                limit = best + relative_gap * (1 - best)
+            else:
+                # Сходство лучшего не положительно: относительная отсечка не имеет смысла
+                limit = float("inf")
+            kept = sum(1 for hit in hits if hit[0] <= limit)
+            hits = hits[:max(kept, min_k)]
+        return hits
+    
+    def _ensure_collection(self, shard: str = DEFAULT_SHARD):
         """Ensure collection exists and is accessible"""
+        collection = self.collections.get(shard)
+        if collection is None:
+            self._get_collection(shard)
+            return
         try:
             # Проверяем, что коллекция доступна
-            self.collection.count()
+            collection.count()
         except Exception as e:
             # Если коллекция недоступна, переподключаемся
-            print(f"Collection not accessible, reconnecting: {e}")
-            self.collection = self.client.get_or_create_collection(
-                name=config.COLLECTION_NAME
+            print(f"Collection {shard} not accessible, reconnecting: {e}")
+            self.collections[shard] = self.client.get_or_create_collection(
+                name=self._collection_name(shard),
+                metadata=self.collection_metadata()
             )
+            if shard == DEFAULT_SHARD:
+                self.collection = self.collections[shard]
     
     def get_collection_count(self) -> int:
-        """Get number of documents in collection"""
-        self._ensure_collection()
-        return self.collection.count()
+        """Get number of documents in all shards"""
+        self.refresh_shards()
+        total = 0
+        for shard in list(self.collections):
+            self._ensure_collection(shard)
+            total += self.collections[shard].count()
+        return total
+    
+    def list_shards(self) -> Dict[str, int]:
+        """Get chunk count per shard"""
+        self.refresh_shards()
+        return {shard: collection.count() for shard, collection in self.collections.items()}
+    
+    def get_all_metadatas(self) -> List[Dict]:
+        """Get metadata of every chunk in every shard"""
+        metadatas = []
+        batch_size = config.DELETE_BATCH_SIZE
+        for shard in list(self.collections):
+            self._ensure_collection(shard)
+            collection = self.collections[shard]
+            count = collection.count()
+            for offset in range(0, count, batch_size):
+                batch = collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+                metadatas.extend(batch['metadatas'])
+        return metadatas
+    
+    def clear_shard(self, shard: str):
+        """Clear one shard, leaving the other shards untouched"""
+        if shard not in self.collections:
+            raise ValueError(f"Unknown shard: {shard}")
+        
+        index = self._quantized_index(shard)
+        if index is not None:
+            index.destroy()
+        
+        with self.source_index.transaction() as conn:
+            self.source_index.clear(conn, shard)
+            self.client.delete_collection(self._collection_name(shard))
+            del self.collections[shard]
+            if shard == DEFAULT_SHARD:
+                self.collection = self._get_collection(DEFAULT_SHARD)
+        print(f"Shard {shard} cleared")
     
     def clear_collection(self):
         """Clear all documents from collection"""
-        self.client.delete_collection(config.COLLECTION_NAME)
-        self.collection = self.client.get_or_create_collection(
-            name=config.COLLECTION_NAME
-        )
+        with self.source_index.transaction() as conn:
+            self.source_index.clear(conn)
+            for shard in list(self.collections):
+                index = self._quantized_index(shard)
+                if index is not None:
+                    index.destroy()
+                self.client.delete_collection(self._collection_name(shard))
+            self.collections = {}
+            self.collection = self._get_collection(DEFAULT_SHARD)
         print("Collection cleared")
     
-    def delete_document_by_hash(self, file_hash: str) -> int:
-        """Delete all chunks of a document by file_hash"""
-        self._ensure_collection()
+    def _delete_ids(self, shard: str, ids: List[str]) -> int:
+        """Delete chunks of a shard by ID in batches, keeping the source index in sync"""
+        self._ensure_collection(shard)
+        batch_size = config.DELETE_BATCH_SIZE
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            with self.source_index.transaction() as conn:
+                self.source_index.remove_ids(conn, batch)
+                self.collections[shard].delete(ids=batch)
         
-        # Получаем все документы с данным file_hash
-        results = self.collection.get(
-            where={"file_hash": file_hash}
-        )
+        index = self._quantized_index(shard)
+        if index is not None:
+            index.remove(ids)
+        return len(ids)
+    
+    def delete_by_source(self, key_type: str, keys: Iterable[str]) -> int:
+        """Delete all chunks of one or more sources (file_hash or web_site)"""
+        ids_by_shard = self.source_index.get_ids(key_type, keys)
         
-        if not results or not results.get('ids'):
-            return 0
+        deleted_count = 0
+        for shard, ids in ids_by_shard.items():
+            deleted_count += self._delete_ids(shard, ids)
+        return deleted_count
+    
+    def delete_document_by_hash(self, file_hash: str) -> int:
+        """Delete all chunks of a document by file_hash"""
+        deleted_count = self.delete_by_source("file_hash", [file_hash])
+        if deleted_count:
+            print(f"Deleted {deleted_count} chunks for file_hash: {file_hash}")
+        return deleted_count
+    
+    def delete_documents_by_hashes(self, file_hashes: List[str]) -> int:
+        """Delete all chunks of several documents in batches"""
+        deleted_count = self.delete_by_source("file_hash", file_hashes)
+        print(f"Deleted {deleted_count} chunks for {len(file_hashes)} documents")
+        return deleted_count
+    
+    def existing_ids(self, ids: List[str]) -> set:
+        """Get those of the given chunk IDs that are already stored in any shard"""
+        self.refresh_shards()
+        existing = set()
+        for shard in list(self.collections):
+            self._ensure_collection(shard)
+            existing.update(self.collections[shard].get(ids=ids, include=[])['ids'])
+        return existing
+    
+    def has_document(self, file_hash: str) -> bool:
+        """Check whether any chunks of a document are stored"""
+        return bool(self.source_index.get_ids("file_hash", [file_hash]))
+    
+    def copy_document(self, file_hash: str, metadata: Dict) -> int:
+        """
+        Store chunks of a document once more with updated metadata, reusing their vectors
         
-        # Удаляем все найденные чанки
-        ids_to_delete = results['ids']
-        self.collection.delete(ids=ids_to_delete)
+        Args:
+            file_hash: Document to copy
+            metadata: Fields replaced in every copied chunk (e.g. source, file_hash)
         
-        deleted_count = len(ids_to_delete)
-        print(f"Deleted {deleted_count} chunks for file_hash: {file_hash}")
+        Returns:
+            Number of copied chunks
+        """
+        copied = 0
+        batch_size = config.DELETE_BATCH_SIZE
+        for shard, ids in self.source_index.get_ids("file_hash", [file_hash]).items():
+            self._ensure_collection(shard)
+            for start in range(0, len(ids), batch_size):
+                batch = self.collections[shard].get(
+                    ids=ids[start:start + batch_size],
+                    include=["documents", "embeddings", "metadatas"]
+                )
+                metadatas = [{**chunk_metadata, **metadata} for chunk_metadata in batch['metadatas']]
+                self.add_documents(batch['documents'], list(batch['embeddings']), metadatas)
+                copied += len(batch['ids'])
+        return copied
+    
+    def delete_website(self, site_name: str) -> int:
+        """Delete all chunks of a website by site name"""
+        deleted_count = self.delete_by_source("web_site", [site_name])
+        if deleted_count:
+            print(f"Deleted {deleted_count} chunks for website: {site_name}")
         return deleted_count
+
+
+# Общее хранилище для API сервера, RAG движка и Telegram бота: шарды и кэши индексов видны всем
+_vector_store: Optional[VectorStore] = None
+_vector_store_lock = threading.Lock()
+
+
+def get_vector_store() -> VectorStore:
+    """Get shared vector store"""
+    global _vector_store
+    # Первое обращение может прийти одновременно из потока загрузки и из запроса
+    with _vector_store_lock:
+        if _vector_store is None:
+            _vector_store = VectorStore()
+    return _vector_store